@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Paper2Code 解析器基准: 用 outputs/<paper>/ 中记录的真实模型回复及其合成变体
+(超大、格式不规范、截断、带 <think>) 测试各解析函数的吞吐量 (MB/s)、p99 延迟和正确性
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+CODES_DIR = Path(__file__).resolve().parent.parent / "codes"
+sys.path.insert(0, str(CODES_DIR))
+
+from utils import content_to_json, extract_code_from_content, extract_code_from_content2, \
+    extract_json_from_string, extract_yaml_from_content
+
+PARSERS = {
+    "content_to_json": content_to_json,
+    "extract_code_from_content": extract_code_from_content,
+    "extract_code_from_content2": extract_code_from_content2,
+    "extract_json_from_string": extract_json_from_string,
+    "extract_yaml_from_content": extract_yaml_from_content,
+}
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+LARGE_TARGET_BYTES = 1 << 20  # synthetic "large" variants are grown to about 1 MB
+
+
+class Case:
+    """One parser input; `expected` is known for synthetic variants, recorded ones are checked against the golden file."""
+
+    def __init__(self, name, parser, text, expected=None, has_expected=False):
+        self.name = name
+        self.parser = parser
+        self.text = text
+        self.expected = expected
+        self.has_expected = has_expected
+
+
+def digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def call_quietly(parser, text):
+    # 解析失败时各函数会打印警告, 计时期间不输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        return PARSERS[parser](text)
+
+
+def read_content(path):
+    with open(path, encoding="utf-8") as f:
+        responses = json.load(f)
+    return [response["choices"][0]["message"]["content"] for response in responses]
+
+
+def malform_json(value, indent=""):
+    """`value` written the way planning answers go wrong: # comments, trailing commas, single and triple quotes."""
+    inner = indent + "    "
+    if isinstance(value, dict):
+        items = [f"{inner}{json.dumps(k)}: {malform_json(v, inner)},  # {k[:20]}" for k, v in value.items()]
+        return "{\n" + "\n".join(items) + f"\n{indent}}}"
+    if isinstance(value, list):
+        items = [f"{inner}{malform_json(v, inner)}," for v in value]
+        return "[\n" + "\n".join(items) + f"\n{indent}]"
+    if isinstance(value, str):
+        if "\n" in value and '"""' not in value:
+            return f'"""{value}"""'
+        if "'" not in value and "\\" not in value:
+            return f"'{value}'"
+    return json.dumps(value, ensure_ascii=False)
+
+
+def grow(value, target_bytes):
+    """Array of copies of `value` whose JSON is about `target_bytes` long."""
+    return [value] * max(1, math.ceil(target_bytes / max(len(json.dumps(value)), 1)))
+
+
+def build_cases(paper_dir):
+    cases = []
+    planning_path = os.path.join(paper_dir, "planning_response.json")
+    if os.path.exists(planning_path):
+        planning = read_content(planning_path)
+        for idx, content in enumerate(planning[1:3], start=1):
+            cases.append(Case(f"planning_{idx}", "content_to_json", content))
+            parsed = call_quietly("content_to_json", content)
+            if not parsed:
+                continue
+            cases += [
+                Case(f"planning_{idx}_malformed", "content_to_json",
+                     f"[CONTENT]\n{malform_json(parsed)}\n[/CONTENT]", parsed, True),
+                Case(f"planning_{idx}_fenced", "content_to_json",
+                     f"Here is the plan.\n```json\n{json.dumps(parsed, indent=2)}\n```\n", parsed, True),
+                Case(f"planning_{idx}_fenced", "extract_json_from_string",
+                     f"```json\n{json.dumps(parsed, indent=2)}\n```", json.dumps(parsed, indent=2), True),
+                Case(f"planning_{idx}_truncated", "content_to_json", content[:len(content) // 2], {}, True),
+            ]
+            large = grow(parsed, LARGE_TARGET_BYTES)
+            cases.append(Case(f"planning_{idx}_large", "content_to_json",
+                              f"[CONTENT]\n{json.dumps(large, indent=4)}\n[/CONTENT]", large, True))
+        if len(planning) > 3:
+            config_answer = planning[3]
+            cases.append(Case("planning_config", "extract_yaml_from_content", config_answer))
+            yaml_content = extract_yaml_from_content(config_answer)
+            if yaml_content is not None:
+                think = "<think>\n" + "Reasoning about the config.\n" * 2000 + "</think>\n"
+                cases += [
+                    Case("planning_config_think", "extract_yaml_from_content", think + config_answer, yaml_content, True),
+                    Case("planning_config_escaped", "extract_yaml_from_content",
+                         json.dumps(config_answer)[1:-1], json.dumps(yaml_content)[1:-1], True),
+                ]
+
+    for path in sorted(Path(paper_dir).glob("*_response.json")):
+        if path.name == "planning_response.json":
+            continue
+        for content in read_content(path):
+            unit = path.name[:-len("_response.json")]
+            cases.append(Case(unit, "extract_json_from_string", content))
+            cases.append(Case(unit, "extract_code_from_content", content))
+
+    for path in sorted(Path(paper_dir).glob("coding_artifacts/*_coding.txt")):
+        content = path.read_text(encoding="utf-8")
+        unit = path.name[:-len(".txt")]
+        cases.append(Case(unit, "extract_code_from_content", content))
+        cases.append(Case(unit, "extract_code_from_content2", content))
+        code = extract_code_from_content(content)
+        if code:
+            large_code = code * max(1, LARGE_TARGET_BYTES // len(code))
+            large_content = f"```python\n{large_code}```"
+            cases.append(Case(f"{unit}_large", "extract_code_from_content", large_content, large_code, True))
+            cases.append(Case(f"{unit}_large", "extract_code_from_content2", large_content, large_code.strip(), True))
+    return cases
+
+
+def run_case(case, repeat, min_seconds):
+    """Per-call latencies of `case` (at least `repeat` calls and `min_seconds`) and the parsed output."""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat or time.perf_counter() - started < min_seconds:
+        begin = time.perf_counter()
+        output = call_quietly(case.parser, case.text)
+        timings.append(time.perf_counter() - begin)
+    return timings, output
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def run_benchmark(paper_dir, repeat=20, min_seconds=0.05, golden=None, parsers=None):
+    """Results per case and per parser; recorded cases without a golden entry are reported as 'new'."""
+    golden = golden or {}
+    cases = [case for case in build_cases(paper_dir) if not parsers or case.parser in parsers]
+    case_rows, outputs = [], {}
+    for case in cases:
+        timings, output = run_case(case, repeat, min_seconds)
+        key = f"{case.parser}:{case.name}"
+        outputs[key] = digest(output)
+        if case.has_expected:
+            status = "ok" if output == case.expected else "FAIL"
+        elif key in golden:
+            status = "ok" if golden[key] == outputs[key] else "FAIL"
+        else:
+            status = "new"
+        case_rows.append({"parser": case.parser, "case": case.name, "bytes": len(case.text.encode("utf-8")),
+                          "calls": len(timings), "seconds": sum(timings), "p99": percentile(timings, 0.99),
+                          "status": status, "synthetic": case.has_expected})
+
+    parser_rows = []
+    for parser in PARSERS:
+        rows = [row for row in case_rows if row["parser"] == parser]
+        if not rows:
+            continue
+        latencies = [row["seconds"] / row["calls"] for row in rows]
+        total_bytes = sum(row["bytes"] * row["calls"] for row in rows)
+        total_seconds = sum(row["seconds"] for row in rows)
+        parser_rows.append({"parser": parser, "cases": len(rows),
+                            "passed": sum(row["status"] == "ok" for row in rows),
+                            "failed": sum(row["status"] == "FAIL" for row in rows),
+                            "mb_per_s": total_bytes / total_seconds / 1e6 if total_seconds else 0.0,
+                            "p99": max(row["p99"] for row in rows),
+                            "mean_latency": sum(latencies) / len(latencies)})
+    return {"cases": case_rows, "parsers": parser_rows}, outputs
+
+
+def format_results(results):
+    header = f"{'Parser':<28} {'Case':<40} {'KB':>8} {'MB/s':>8} {'p99 (ms)':>9} {'Status':>6}"
+    lines = [header, "-" * len(header)]
+    for row in results["cases"]:
+        mb_per_s = row["bytes"] * row["calls"] / row["seconds"] / 1e6 if row["seconds"] else 0.0
+        lines.append(f"{row['parser']:<28} {row['case'][:40]:<40} {row['bytes'] / 1024:>8.1f} {mb_per_s:>8.1f} "
+                     f"{row['p99'] * 1000:>9.3f} {row['status']:>6}")
+    lines.append("-" * len(header))
+    header = f"{'Parser':<28} {'Cases':>6} {'Passed':>7} {'Failed':>7} {'MB/s':>8} {'p99 (ms)':>9}"
+    lines += ["", header, "-" * len(header)]
+    for row in results["parsers"]:
+        lines.append(f"{row['parser']:<28} {row['cases']:>6} {row['passed']:>7} {row['failed']:>7} "
+                     f"{row['mb_per_s']:>8.1f} {row['p99'] * 1000:>9.3f}")
+    return "\n".join(lines)
+
+
+def compare_baseline(results, baseline, max_slowdown):
+    """Parsers whose throughput fell below baseline / max_slowdown."""
+    previous = {row["parser"]: row for row in baseline.get("parsers", [])}
+    regressions = []
+    for row in results["parsers"]:
+        before = previous.get(row["parser"])
+        if before and before["mb_per_s"] and row["mb_per_s"] < before["mb_per_s"] / max_slowdown:
+            regressions.append(f"{row['parser']}: {row['mb_per_s']:.1f} MB/s (baseline {before['mb_per_s']:.1f} MB/s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paper2Code 解析器吞吐量与正确性基准")
+    parser.add_argument("--paper-dir", default=str(Path(__file__).resolve().parent.parent / "outputs" / "Transformer"),
+                        help="记录了模型回复的输出目录 (默认: outputs/Transformer)")
+    parser.add_argument("--parser", action="append", choices=list(PARSERS), help="只测试指定解析器 (可重复)")
+    parser.add_argument("--repeat", type=int, default=20, help="每个用例的最少调用次数 (默认: 20)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="每个用例的最少计时秒数 (默认: 0.05)")
+    parser.add_argument("--golden", help="黄金输出文件 (默认: benchmarks/golden/<paper>.json)")
+    parser.add_argument("--update-golden", action="store_true", help="用当前输出重写黄金文件")
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="之前 --output 的结果, 吞吐量下降超过 --max-slowdown 时报错")
+    parser.add_argument("--max-slowdown", type=float, default=1.5, help="允许的吞吐量下降倍数 (默认: 1.5)")
+    args = parser.parse_args()
+
+    paper_name = Path(args.paper_dir).name
+    golden_path = Path(args.golden) if args.golden else GOLDEN_DIR / f"{paper_name}.json"
+    golden = {}
+    if golden_path.exists() and not args.update_golden:
+        golden = json.loads(golden_path.read_text(encoding="utf-8"))
+
+    results, outputs = run_benchmark(args.paper_dir, args.repeat, args.min_seconds, golden, args.parser)
+    if not results["cases"]:
+        print(f"❌ 在 {args.paper_dir} 中没有找到可回放的模型回复")
+        sys.exit(1)
+    print(format_results(results))
+
+    if args.update_golden:
+        golden_path.parent.mkdir(parents=True, exist_ok=True)
+        recorded = {key: outputs[key] for key in (f"{row['parser']}:{row['case']}" for row in results["cases"]
+                                                  if not row["synthetic"])}
+        golden_path.write_text(json.dumps(recorded, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\n📝 黄金输出已写入 {golden_path}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    failed = [f"{row['parser']}:{row['case']}" for row in results["cases"] if row["status"] == "FAIL"]
+    regressions = []
+    if args.baseline:
+        regressions = compare_baseline(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")),
+                                       args.max_slowdown)
+    if failed:
+        print(f"\n❌ 输出与黄金结果不一致: {', '.join(failed)}")
+    for regression in regressions:
+        print(f"❌ 吞吐量下降: {regression}")
+    if failed or regressions:
+        sys.exit(1)
+    print("\n✅ 全部用例通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,21 @@ def remove_spans(data):
         return [remove_spans(item) for item in data]
     return data
 
+def run(ctx, input_json_path):
+    # keep the cleaned paper in memory so later stages skip re-parsing it
+    with open(f'{input_json_path}') as f:
+        data = json.load(f)
+
+    cleaned_data = remove_spans(data)
+
+    print(f"[SAVED] {ctx.pdf_json_path}")
+    with open(ctx.pdf_json_path, 'w', encoding='utf-8') as f:
+        json.dump(cleaned_data, f)
+
+    ctx.paper_content = cleaned_data
+    ctx.paper_text = None
+    return cleaned_data
+
 def main(args):
     input_json_path = args.input_json_path
     output_json_path = args.output_json_path 
@@ -3,64 +3,65 @@ import re
 import os
 import argparse
 import shutil
-from utils import extract_planning, content_to_json, format_json_data
+from pipeline import PipelineContext
+from utils import content_to_json, extract_yaml_from_content, format_json_data
 
-parser = argparse.ArgumentParser()
 
-parser.add_argument('--paper_name',type=str)
-parser.add_argument('--output_dir',type=str, default="")
+def run(ctx):
+    output_dir = ctx.output_dir
 
-args    = parser.parse_args()
+    traj = ctx.get_trajectories()
 
-output_dir = args.output_dir
-
-with open(f'{output_dir}/planning_trajectories.json', encoding='utf8') as f:
-    traj = json.load(f)
-
-yaml_raw_content = ""
-for turn_idx, turn in enumerate(traj):
+    yaml_raw_content = ""
+    for turn_idx, turn in enumerate(traj):
         if turn_idx == 8:
-            yaml_raw_content = turn['content']   
-
-if "</think>" in yaml_raw_content:
-    yaml_raw_content = yaml_raw_content.split("</think>")[-1]
-
-match = re.search(r"```yaml\n(.*?)\n```", yaml_raw_content, re.DOTALL)
-if match:
-    yaml_content = match.group(1)
-    with open(f'{output_dir}/planning_config.yaml', 'w', encoding='utf8') as f:
-        f.write(yaml_content)
-else:
-    # print("No YAML content found.")
-    match2 = re.search(r"```yaml\\n(.*?)\\n```", yaml_raw_content, re.DOTALL)
-    if match2:
-        yaml_content = match2.group(1)
+            yaml_raw_content = turn['content']
+
+    yaml_content = extract_yaml_from_content(yaml_raw_content)
+    if yaml_content is not None:
         with open(f'{output_dir}/planning_config.yaml', 'w', encoding='utf8') as f:
             f.write(yaml_content)
+        ctx.config_yaml = yaml_content
+        ctx.shared_context = None
     else:
         print("No YAML content found.")
 
-# ---------------------------------------
+    # ---------------------------------------
+
+    artifact_output_dir=f"{output_dir}/planning_artifacts"
+
+    os.makedirs(artifact_output_dir, exist_ok=True)
+
+    context_lst = ctx.get_context_lst()
+
+    arch_design = content_to_json(context_lst[1])
+    logic_design = content_to_json(context_lst[2])
+
+    formatted_arch_design = format_json_data(arch_design)
+    formatted_logic_design = format_json_data(logic_design)
+
+    with open(f"{artifact_output_dir}/1.1_overall_plan.txt", "w", encoding="utf-8") as f:
+        f.write(context_lst[0])
 
-artifact_output_dir=f"{output_dir}/planning_artifacts"
+    with open(f"{artifact_output_dir}/1.2_arch_design.txt", "w", encoding="utf-8") as f:
+        f.write(formatted_arch_design)
 
-os.makedirs(artifact_output_dir, exist_ok=True)
+    with open(f"{artifact_output_dir}/1.3_logic_design.txt", "w", encoding="utf-8") as f:
+        f.write(formatted_logic_design)
 
-context_lst = extract_planning(f'{output_dir}/planning_trajectories.json')
+    shutil.copy(f"{output_dir}/planning_config.yaml", f"{artifact_output_dir}/1.4_config.yaml")
 
-arch_design = content_to_json(context_lst[1])
-logic_design = content_to_json(context_lst[2])
 
-formatted_arch_design = format_json_data(arch_design)
-formatted_logic_design = format_json_data(logic_design)
+def main(args):
+    ctx = PipelineContext(paper_name=args.paper_name, gpt_version=None, output_dir=args.output_dir)
+    run(ctx)
 
-with open(f"{artifact_output_dir}/1.1_overall_plan.txt", "w", encoding="utf-8") as f:
-    f.write(context_lst[0])
 
-with open(f"{artifact_output_dir}/1.2_arch_design.txt", "w", encoding="utf-8") as f:
-    f.write(formatted_arch_design)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
 
-with open(f"{artifact_output_dir}/1.3_logic_design.txt", "w", encoding="utf-8") as f:
-    f.write(formatted_logic_design)
+    parser.add_argument('--paper_name',type=str)
+    parser.add_argument('--output_dir',type=str, default="")
 
-shutil.copy(f"{output_dir}/planning_config.yaml", f"{artifact_output_dir}/1.4_config.yaml")
+    args    = parser.parse_args()
+    main(args)
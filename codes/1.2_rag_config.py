@@ -3,7 +3,7 @@ import json
 import sys
 import argparse
 
-from openai import OpenAI
+from llm_client import LLMClient
 
 try:
     from huggingface_hub import HfApi
@@ -33,7 +33,7 @@ def parse_args() -> argparse.Namespace:
 
 
 args = parse_args()
-client = OpenAI(api_key = os.environ["OPENAI_API_KEY"])
+client = LLMClient.from_env()
 
 planning_config_path = os.path.join(
     args.output_dir, f"planning_config.yaml"
@@ -84,12 +84,9 @@ Detect the model name and dataset names in the configuration file so that they c
     },
 ]
 
-response = client.chat.completions.create(
-    model=args.gpt_version,
-    messages=messages,
-)
+response = client.chat(messages, args.gpt_version)
 
-answer = response.choices[0].message.content.strip()
+answer = response['choices'][0]['message']['content'].strip()
 # print("Raw OpenAI answer:", answer)
 
 # Parse the list of names from the model output
@@ -1,55 +1,17 @@
-from openai import OpenAI
 import json
-from tqdm import tqdm
 import argparse
 import os
-import sys
-from utils import print_response, print_log_cost, load_accumulated_cost, save_accumulated_cost
-
-parser = argparse.ArgumentParser()
-
-parser.add_argument('--paper_name',type=str)
-parser.add_argument('--gpt_version',type=str)
-parser.add_argument('--paper_format',type=str, default="JSON", choices=["JSON", "LaTeX"])
-parser.add_argument('--pdf_json_path', type=str) # json format
-parser.add_argument('--pdf_latex_path', type=str) # latex format
-parser.add_argument('--output_dir',type=str, default="")
-
-args    = parser.parse_args()
-
-# 支持自定义 API 基础 URL
-client_kwargs = {"api_key": os.environ["OPENAI_API_KEY"]}
-api_base = os.environ.get("OPENAI_API_BASE")
-if api_base:
-    # 确保URL格式正确，添加 /v1 后缀（如果还没有）
-    if not api_base.endswith('/v1'):
-        api_base = api_base.rstrip('/') + '/v1'
-    client_kwargs["base_url"] = api_base
-    print(f"[INFO] 使用自定义 API 基础 URL: {api_base}", file=sys.stderr)
-else:
-    print(f"[INFO] 使用官方 OpenAI API", file=sys.stderr)
-
-client = OpenAI(**client_kwargs)
-
-paper_name = args.paper_name
-gpt_version = args.gpt_version
-paper_format = args.paper_format
-pdf_json_path = args.pdf_json_path
-pdf_latex_path = args.pdf_latex_path
-output_dir = args.output_dir
-
-
-if paper_format == "JSON":
-    with open(f'{pdf_json_path}') as f:
-        paper_content = json.load(f)
-elif paper_format == "LaTeX":
-    with open(f'{pdf_latex_path}') as f:
-        paper_content = f.read()
-else:
-    print(f"[ERROR] Invalid paper format. Please select either 'JSON' or 'LaTeX.")
-    sys.exit(0)
-
-plan_msg = [
+from pipeline import PipelineContext
+from artifact_store import save_trajectories
+from manifest import StageManifest, get_input_hash
+from planning_schema import PLANNING_OUTPUTS, PLANNING_SCHEMAS, get_response_format, validate
+from prompt_templates import render_prompt
+from token_budget import PAPER_TRIM_ORDER
+from tolerant_json import loads_tolerant, TolerantJSONError
+from utils import print_response, load_accumulated_cost, save_accumulated_cost, extract_planning_from_trajectories
+
+def get_plan_msg(paper_content, paper_format):
+    plan_msg = [
         {'role': "system", "content": f"""You are an expert researcher and strategic planner with a deep understanding of experimental design and reproducibility in scientific research. 
 You will receive a research paper in {paper_format} format. 
 Your task is to create a detailed and efficient plan to reproduce the experiments and methodologies described in the paper.
@@ -78,6 +40,7 @@ Instructions:
 
 ## Instruction
 The response should give us a strong roadmap, making it easier to write the code later."""}]
+    return plan_msg
 
 file_list_msg = [
         {"role": "user", "content": """Your goal is to create a concise, usable, and complete software system design for reproducing the paper's method. Use appropriate open-source libraries and keep the overall architecture simple.
@@ -225,102 +188,172 @@ training:
 """
     }]
 
-def api_call(msg, gpt_version):
-    if "o3-mini" in gpt_version:
-        completion = client.chat.completions.create(
-            model=gpt_version, 
-            reasoning_effort="high",
-            messages=msg
-        )
-    else:
-        completion = client.chat.completions.create(
-            model=gpt_version, 
-            messages=msg
-        )
-
-    return completion 
-
-
-def convert_completion_to_json(completion):
-    """处理不同API端点返回的响应格式"""
-    import sys
-    
-    # 检查是否已经是dict
-    if isinstance(completion, dict):
-        return completion
-    
-    # 检查是否是字符串
-    if isinstance(completion, str):
-        # 尝试解析JSON
-        try:
-            return json.loads(completion)
-        except json.JSONDecodeError as e:
-            print(f"[DEBUG] 字符串解析失败: {e}", file=sys.stderr)
-            print(f"[DEBUG] 返回值内容: {completion[:500]}", file=sys.stderr)
-            raise
-    
-    # 检查是否是对象
+# when streaming, a turn ends once the block that later stages read is complete
+PLANNING_STOP_AT = {1: "content", 2: "content", 3: "code"}
+
+
+# text-mode answers are read from inside [CONTENT]; a strict response_format
+# only lets the model answer with the bare object
+CONTENT_WRAPPER = ", wrapped inside [CONTENT][/CONTENT]"
+
+
+def get_repair_msg(answer, errors, schema, structured=False):
+    wrapper = "" if structured else CONTENT_WRAPPER
+    return [
+        {"role": "system", "content": render_prompt("planning_repair_system", Wrapper=wrapper)},
+        {"role": "user", "content": render_prompt("planning_repair_instruction",
+                                                  Schema=json.dumps(schema, indent=2),
+                                                  Errors="\n".join(f"- {error}" for error in errors),
+                                                  Answer=answer, Wrapper=wrapper)}]
+
+
+def validate_plan(content, schema):
+    if "</think>" in content:
+        content = content.split("</think>")[-1].strip()
     try:
-        # 尝试调用 model_dump_json()
-        if hasattr(completion, 'model_dump_json'):
-            return json.loads(completion.model_dump_json())
-        # 尝试调用 model_dump()  
-        elif hasattr(completion, 'model_dump'):
-            return completion.model_dump()
-        # 尝试调用 dict()
-        elif hasattr(completion, '__dict__'):
-            return vars(completion)
+        plan = loads_tolerant(content)
+    except TolerantJSONError as e:
+        return [f"not parseable as JSON ({e})"]
+    return validate(plan, schema)
+
+
+def repair_plan(ctx, completion_json, current_stage, schema, errors, request_kwargs):
+    """The answer of one repair call for `completion_json`, which failed `schema` with `errors`; cheaper than planning again.
+
+    `completion_json` is kept when the repaired answer is still invalid.
+    """
+    content = completion_json['choices'][0]['message']['content']
+    print(f"[WARNING] {current_stage} answer failed validation: {'; '.join(errors)}")
+    repair_stage = f"{current_stage} (repair)"
+    print(repair_stage)
+    repair_msg = get_repair_msg(content, errors, schema, structured="response_format" in request_kwargs)
+    repair_json = ctx.chat(repair_msg, **request_kwargs)
+    print_response(repair_json)
+    ctx.log_cost(repair_json, repair_stage)
+
+    remaining = validate_plan(repair_json['choices'][0]['message']['content'], schema)
+    if remaining:
+        print(f"[WARNING] {repair_stage} answer is still invalid, keeping the original: {'; '.join(remaining)}")
+        return completion_json
+    print(f"✅ {repair_stage} answer passed validation")
+    return repair_json
+
+
+def run(ctx):
+    output_dir = ctx.output_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    paper_format = ctx.get_prompt_paper_format()
+    plan_msg = get_plan_msg(ctx.get_paper_text(), paper_format)
+
+    responses = []
+    trajectories = []
+
+    # every turn is a unit keyed by the conversation that produced it; with
+    # --resume, turns whose conversation is unchanged reuse the saved response
+    manifest = StageManifest(output_dir, "planning")
+    prev_responses = []
+    if ctx.resume:
+        ctx.total_accumulated_cost = load_accumulated_cost(f"{output_dir}/accumulated_cost.json")
+        if os.path.exists(f'{output_dir}/planning_response.json'):
+            with open(f'{output_dir}/planning_response.json', encoding='utf-8') as f:
+                prev_responses = json.load(f)
+    else:
+        ctx.total_accumulated_cost = 0
+
+    for idx, instruction_msg in enumerate([plan_msg, file_list_msg, task_list_msg, config_msg]):
+        current_stage = ""
+        if idx == 0 :
+            current_stage = f"[Planning] Overall plan"
+        elif idx == 1:
+            current_stage = f"[Planning] Architecture design"
+        elif idx == 2:
+            current_stage = f"[Planning] Logic design"
+        elif idx == 3:
+            current_stage = f"[Planning] Configuration file generation"
+        print(current_stage)
+
+        trajectories.extend(instruction_msg)
+
+        # the paper in the opening messages is what gets trimmed once the conversation outgrows the budget
+        history = trajectories[len(plan_msg):]
+        trajectories = ctx.fit_prompt(
+            current_stage,
+            lambda dropped: get_plan_msg(ctx.get_paper_text(dropped), paper_format) + history,
+            PAPER_TRIM_ORDER)
+
+        # the design and task-list turns can be constrained to their schema
+        request_kwargs = {}
+        if ctx.planning_output == "structured" and idx in PLANNING_SCHEMAS:
+            request_kwargs["response_format"] = get_response_format(*PLANNING_SCHEMAS[idx])
+
+        unit = f"turn_{idx}"
+        input_hash = get_input_hash(trajectories, ctx.gpt_version, **request_kwargs)
+        if ctx.resume and idx < len(prev_responses) and manifest.is_done(unit, input_hash):
+            print(f"[Planning] Skipping {unit}: inputs unchanged since the last run")
+            completion_json = prev_responses[idx]
         else:
-            # 最后的尝试：直接转换为JSON字符串
-            print(f"[DEBUG] 未知对象类型: {type(completion)}", file=sys.stderr)
-            print(f"[DEBUG] 对象内容: {str(completion)[:500]}", file=sys.stderr)
-            raise TypeError(f"无法转换类型 {type(completion)} 到 JSON")
-    except Exception as e:
-        print(f"[DEBUG] 对象转换失败: {e}", file=sys.stderr)
-        raise
-
-responses = []
-trajectories = []
-total_accumulated_cost = 0
-
-for idx, instruction_msg in enumerate([plan_msg, file_list_msg, task_list_msg, config_msg]):
-    current_stage = ""
-    if idx == 0 :
-        current_stage = f"[Planning] Overall plan"
-    elif idx == 1:
-        current_stage = f"[Planning] Architecture design"
-    elif idx == 2:
-        current_stage = f"[Planning] Logic design"
-    elif idx == 3:
-        current_stage = f"[Planning] Configuration file generation"
-    print(current_stage)
-
-    trajectories.extend(instruction_msg)
-
-    completion = api_call(trajectories, gpt_version)
-    
-    # response - 使用辅助函数处理不同格式的响应
-    completion_json = convert_completion_to_json(completion)
-
-    # print and logging
-    print_response(completion_json)
-    temp_total_accumulated_cost = print_log_cost(completion_json, gpt_version, current_stage, output_dir, total_accumulated_cost)
-    total_accumulated_cost = temp_total_accumulated_cost
-
-    responses.append(completion_json)
-
-    # trajectories
-    message = completion.choices[0].message
-    trajectories.append({'role': message.role, 'content': message.content})
-
-
-# save
-save_accumulated_cost(f"{output_dir}/accumulated_cost.json", total_accumulated_cost)
-
-os.makedirs(output_dir, exist_ok=True)
-
-with open(f'{output_dir}/planning_response.json', 'w', encoding='utf-8') as f:
-    json.dump(responses, f)
-
-with open(f'{output_dir}/planning_trajectories.json', 'w', encoding='utf-8') as f:
-    json.dump(trajectories, f)
+            # only written to while streaming
+            artifact_path = f"{output_dir}/planning_artifacts/planning_{idx}_response.txt"
+            completion_json = ctx.chat(trajectories, artifact_path, stop_at=PLANNING_STOP_AT.get(idx), **request_kwargs)
+
+            # print and logging
+            print_response(completion_json)
+            ctx.log_cost(completion_json, current_stage)
+
+            # a valid answer is kept as it is, without a repair call
+            if idx in PLANNING_SCHEMAS:
+                schema = PLANNING_SCHEMAS[idx][1]
+                errors = validate_plan(completion_json['choices'][0]['message']['content'], schema)
+                if errors:
+                    completion_json = repair_plan(ctx, completion_json, current_stage, schema, errors,
+                                                  request_kwargs)
+
+        responses.append(completion_json)
+
+        # trajectories
+        message = completion_json['choices'][0]['message']
+        trajectories.append({'role': message['role'], 'content': message['content']})
+
+        # save after every turn so that a crash only loses the turn in flight
+        with open(f'{output_dir}/planning_response.json', 'w', encoding='utf-8') as f:
+            json.dump(responses, f)
+
+        save_trajectories(f'{output_dir}/planning_trajectories.json', trajectories, ctx.get_blob_store())
+
+        manifest.mark_done(unit, input_hash, [f'{output_dir}/planning_response.json'])
+
+    save_accumulated_cost(f"{output_dir}/accumulated_cost.json", ctx.total_accumulated_cost)
+
+    # hand the plan to the next stages without another round-trip through disk
+    ctx.trajectories = trajectories
+    ctx.context_lst = extract_planning_from_trajectories(trajectories)
+    ctx.task_list = None
+    ctx.config_yaml = None
+    ctx.shared_context = None
+    return responses
+
+
+def main(args):
+    ctx = PipelineContext.from_args(args)
+    run(ctx)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--paper_name',type=str)
+    parser.add_argument('--gpt_version',type=str)
+    parser.add_argument('--paper_format',type=str, default="JSON", choices=["JSON", "LaTeX"])
+    parser.add_argument('--pdf_json_path', type=str) # json format
+    parser.add_argument('--pdf_latex_path', type=str) # latex format
+    parser.add_argument('--paper_serialization', type=str, default="markdown", choices=["markdown", "json"]) # how JSON papers are embedded in prompts
+    parser.add_argument('--output_dir',type=str, default="")
+    parser.add_argument('--stream', action='store_true') # write responses to the artifacts as they arrive
+    parser.add_argument('--resume', action='store_true') # skip turns whose inputs are unchanged
+    parser.add_argument('--max_prompt_tokens', type=int, default=None) # default: per-model budget
+    parser.add_argument('--artifact_store', type=str, default="json", choices=["json", "blobs", "blobs-zstd"]) # blobs: deduplicate message bodies of trajectory files
+    parser.add_argument('--planning_output', type=str, default="text", choices=PLANNING_OUTPUTS) # structured: JSON-schema-constrained design and task list
+
+    args    = parser.parse_args()
+    main(args)
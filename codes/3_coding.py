@@ -1,275 +1,262 @@
-from openai import OpenAI
 import json
 import os
 from tqdm import tqdm
 import re
 import sys
-import copy
-from utils import extract_planning, content_to_json, extract_code_from_content, print_response, print_log_cost, load_accumulated_cost, save_accumulated_cost
+from pipeline import PipelineContext
+from prompt_layout import get_shared_context, get_relevant_paper, build_messages
+from prompt_templates import render_prompt, render_code_files
+from manifest import StageManifest, get_input_hash
+from token_budget import PAPER_TRIM_ORDER
+from code_summary import summarize_python_source
+from task_graph import build_dependency_graph, get_transitive_dependencies, schedule_waves
+from utils import extract_code_from_content, print_response, load_accumulated_cost, save_accumulated_cost
 import argparse
 
-parser = argparse.ArgumentParser()
-
-parser.add_argument('--paper_name',type=str)
-parser.add_argument('--gpt_version',type=str, default="o3-mini")
-parser.add_argument('--paper_format',type=str, default="JSON", choices=["JSON", "LaTeX"])
-parser.add_argument('--pdf_json_path', type=str) # json format
-parser.add_argument('--pdf_latex_path', type=str) # latex format
-parser.add_argument('--output_dir',type=str, default="")
-parser.add_argument('--output_repo_dir',type=str, default="")
-
-args    = parser.parse_args()
-# 支持自定义 API 基础 URL
-client_kwargs = {"api_key": os.environ["OPENAI_API_KEY"]}
-api_base = os.environ.get("OPENAI_API_BASE")
-if api_base:
-    # 确保 URL 格式正确，添加 /v1 后缀（如果还没有）
-    if not api_base.endswith('/v1'):
-        api_base = api_base.rstrip('/') + '/v1'
-    client_kwargs["base_url"] = api_base
-    print(f"[INFO] 使用自定义 API 基础 URL: {api_base}", file=sys.stderr)
-else:
-    print(f"[INFO] 使用官方 OpenAI API", file=sys.stderr)
-
-client = OpenAI(**client_kwargs)
-
-paper_name = args.paper_name
-gpt_version = args.gpt_version
-paper_format = args.paper_format
-pdf_json_path = args.pdf_json_path
-pdf_latex_path = args.pdf_latex_path
-output_dir = args.output_dir
-output_repo_dir = args.output_repo_dir
-
-if paper_format == "JSON":
-    with open(f'{pdf_json_path}') as f:
-        paper_content = json.load(f)
-elif paper_format == "LaTeX":
-    with open(f'{pdf_latex_path}') as f:
-        paper_content = f.read()
-else:
-    print(f"[ERROR] Invalid paper format. Please select either 'JSON' or 'LaTeX.")
-    sys.exit(0)
-
-with open(f'{output_dir}/planning_config.yaml') as f: 
-    config_yaml = f.read()
-
-context_lst = extract_planning(f'{output_dir}/planning_trajectories.json')
-# 0: overview, 1: detailed, 2: PRD
-# file_list = content_to_json(context_lst[1])
-task_list = content_to_json(context_lst[2])
-
-todo_file_lst = task_list['Task list']
-done_file_lst = ['config.yaml']
-done_file_dict = {}
-
-code_msg = [
-    {"role": "system", "content": f"""You are an expert researcher and software engineer with a deep understanding of experimental design and reproducibility in scientific research.
-You will receive a research paper in {paper_format} format, an overview of the plan, a Design in JSON format consisting of "Implementation approach", "File list", "Data structures and interfaces", and "Program call flow", followed by a Task in JSON format that includes "Required packages", "Required other language third-party packages", "Logic Analysis", and "Task list", along with a configuration file named "config.yaml". 
-Your task is to write code to reproduce the experiments and methodologies described in the paper. 
-
-The code you write must be elegant, modular, and maintainable, adhering to Google-style guidelines. 
-The code must strictly align with the paper's methodology, experimental setup, and evaluation metrics. 
-Write code with triple quoto."""}]
-
-def get_write_msg(todo_file_name, detailed_logic_analysis, done_file_lst): 
-    code_files = ""
-    for done_file in done_file_lst:
-        if done_file.endswith(".yaml"): continue
-        code_files += f"""
-```python
-{done_file_dict[done_file]}
-```
-
-"""
-
-    write_msg=[
-{'role': 'user', "content": f"""# Context
-## Paper
-{paper_content}
-
------
-
-## Overview of the plan
-{context_lst[0]}
-
------
-
-## Design
-{context_lst[1]}
-
------
-
-## Task
-{context_lst[2]}
-
------
-
-## Configuration file
-```yaml
-{config_yaml}
-```
------
-
-## Code Files
-{code_files}
-
------
 
-# Format example
-## Code: {todo_file_name}
-```python
-## {todo_file_name}
-...
-```
+def get_code_msg(paper_format):
+    code_msg = [
+    {"role": "system", "content": render_prompt("coding_system", PaperFormat=paper_format)}]
+    return code_msg
 
------
+def get_write_msg(ctx, todo_file_name, detailed_logic_analysis, done_file_lst, code_file_lst=None, summary_file_lst=None):
+    done_file_dict = ctx.done_file_dict
 
-# Instruction
-Based on the paper, plan, design, task and configuration file(config.yaml) specified previously, follow "Format example", write the code. 
+    # files whose source is included; all of done_file_lst unless trimmed to the token budget
+    if code_file_lst is None:
+        code_file_lst = done_file_lst
 
-We have {done_file_lst}.
-Next, you must write only the "{todo_file_name}".
-1. Only One file: do your best to implement THIS ONLY ONE FILE.
-2. COMPLETE CODE: Your code will be part of the entire project, so please implement complete, reliable, reusable code snippets.
-3. Set default value: If there is any setting, ALWAYS SET A DEFAULT VALUE, ALWAYS USE STRONG TYPE AND EXPLICIT VARIABLE. AVOID circular import.
-4. Follow design: YOU MUST FOLLOW "Data structures and interfaces". DONT CHANGE ANY DESIGN. Do not use public member functions that do not exist in your design.
-5. CAREFULLY CHECK THAT YOU DONT MISS ANY NECESSARY CLASS/FUNCTION IN THIS FILE.
-6. Before using a external variable/module, make sure you import it first.
-7. Write out EVERY CODE DETAIL, DON'T LEAVE TODO.
-8. REFER TO CONFIGURATION: you must use configuration from "config.yaml". DO NOT FABRICATE any configuration values.
-
-{detailed_logic_analysis}
-
-## Code: {todo_file_name}"""}]
-    return write_msg
-
-
-def api_call(msg):
-    if "o3-mini" in gpt_version:
-        completion = client.chat.completions.create(
-            model=gpt_version, 
-            reasoning_effort="high",
-            messages=msg
-        )
+    code_lst = []
+    for done_file in code_file_lst:
+        if done_file.endswith(".yaml"): continue
+        code = done_file_dict[done_file]
+        if summary_file_lst and done_file in summary_file_lst:
+            summary = get_code_summary(ctx, done_file)
+            if summary is not None:
+                code = f"# Interface of {done_file} (bodies omitted)\n{summary}"
+        code_lst.append(code)
+
+    return render_prompt("coding_instruction", CodeFiles=render_code_files(code_lst), TodoFileName=todo_file_name,
+                         DoneFileList=done_file_lst, DetailedLogicAnalysis=detailed_logic_analysis)
+
+
+def get_code_summary(ctx, file_name):
+    """AST interface summary of a generated file, computed once; None if it cannot be summarized."""
+    if file_name not in ctx.code_summary_dict:
+        summary = None
+        if file_name.endswith(".py"):
+            summary = summarize_python_source(ctx.done_file_dict[file_name])
+        ctx.code_summary_dict[file_name] = summary
+    return ctx.code_summary_dict[file_name]
+
+
+def get_code_summary_lst(todo_file_name, context_file_lst, dependency_dict):
+    """Code files sent as interface summaries: all but the ones `todo_file_name` depends on directly."""
+    direct_dependencies = set(dependency_dict.get(todo_file_name, []))
+    return [f for f in context_file_lst if f not in direct_dependencies]
+
+
+def get_code_trim_order(todo_file_name, context_file_lst, dependency_dict):
+    """Code files to drop from an over-budget prompt: files it does not depend on directly go first, oldest first."""
+    code_file_lst = [f for f in context_file_lst if not f.endswith(".yaml")]
+    direct_dependencies = set(dependency_dict.get(todo_file_name, []))
+    return ([f for f in code_file_lst if f not in direct_dependencies]
+            + [f for f in code_file_lst if f in direct_dependencies])
+
+
+def load_analysis_dict(ctx, todo_file_lst):
+    # analyses produced earlier in this process are reused, the rest come from disk
+    detailed_logic_analysis_dict = {}
+    for todo_file_name in todo_file_lst:
+        # simple analysis
+        save_todo_file_name = todo_file_name.replace("/", "_")
+
+        if todo_file_name == "config.yaml":
+            continue
+
+        if todo_file_name in ctx.analysis_dict:
+            detailed_logic_analysis_dict[todo_file_name] = ctx.analysis_dict[todo_file_name]
+            continue
+
+        with open(f"{ctx.output_dir}/{save_todo_file_name}_simple_analysis_response.json") as f:
+            detailed_logic_analysis_response = json.load(f)
+        detailed_logic_analysis_dict[todo_file_name] = detailed_logic_analysis_response[0]['choices'][0]['message']['content']
+    return detailed_logic_analysis_dict
+
+
+def load_done_code(ctx, manifest, todo_file_name, input_hash):
+    """Reuse the generated `todo_file_name` if the manifest says its inputs are unchanged."""
+    if not manifest.is_done(todo_file_name, input_hash):
+        return False
+    with open(f"{ctx.output_repo_dir}/{todo_file_name}", encoding='utf-8') as f:
+        ctx.done_file_dict[todo_file_name] = f.read()
+    print(f"[CODING] Skipping {todo_file_name}: inputs unchanged since the last run")
+    return True
+
+
+def run(ctx):
+    output_dir = ctx.output_dir
+    output_repo_dir = ctx.output_repo_dir
+
+    task_list = ctx.get_task_list()
+    todo_file_lst = task_list['Task list']
+    done_file_lst = ['config.yaml']
+    done_file_dict = ctx.done_file_dict
+
+    code_msg = get_code_msg(ctx.get_prompt_paper_format())
+    detailed_logic_analysis_dict = load_analysis_dict(ctx, todo_file_lst)
+
+    artifact_output_dir=f'{output_dir}/coding_artifacts'
+    os.makedirs(artifact_output_dir, exist_ok=True)
+
+    # also decides which code files are dropped first when a prompt is over budget
+    logic_analysis_dict = {desc[0]: desc[1] for desc in task_list.get('Logic Analysis', [])}
+    dependency_dict = build_dependency_graph(todo_file_lst, logic_analysis_dict, detailed_logic_analysis_dict)
+
+    if ctx.coding_schedule == "dag":
+        # files whose dependencies are all written are generated together,
+        # each prompt only carrying the code of its own (transitive) dependencies
+        waves = schedule_waves(todo_file_lst, dependency_dict)
+        for wave_idx, wave in enumerate(waves):
+            print(f"[CODING] wave {wave_idx}: {wave}")
     else:
-        completion = client.chat.completions.create(
-            model=gpt_version, 
-            messages=msg
-        )
-    return completion
-
-
-def convert_completion_to_json(completion):
-    """处理不同API端点返回的响应格式"""
-    import sys
-    
-    # 检查是否已经是dict
-    if isinstance(completion, dict):
-        return completion
-    
-    # 检查是否是字符串
-    if isinstance(completion, str):
-        # 尝试解析JSON
-        try:
-            return json.loads(completion)
-        except json.JSONDecodeError as e:
-            print(f"[DEBUG] 字符串解析失败: {e}", file=sys.stderr)
-            print(f"[DEBUG] 返回值内容: {completion[:500]}", file=sys.stderr)
-            raise
-    
-    # 检查是否是对象
-    try:
-        # 尝试调用 model_dump_json()
-        if hasattr(completion, 'model_dump_json'):
-            return json.loads(completion.model_dump_json())
-        # 尝试调用 model_dump()
-        elif hasattr(completion, 'model_dump'):
-            return completion.model_dump()
-        # 尝试调用 dict()
-        elif hasattr(completion, '__dict__'):
-            return vars(completion)
-        else:
-            # 最后的尝试：直接转换为JSON字符串
-            print(f"[DEBUG] 未知对象类型: {type(completion)}", file=sys.stderr)
-            print(f"[DEBUG] 对象内容: {str(completion)[:500]}", file=sys.stderr)
-            raise TypeError(f"无法转换类型 {type(completion)} 到 JSON")
-    except Exception as e:
-        print(f"[DEBUG] 对象转换失败: {e}", file=sys.stderr)
-        raise
-    
-
-# testing for checking
-detailed_logic_analysis_dict = {}
-retrieved_section_dict = {}
-for todo_file_name in todo_file_lst:
-    # simple analysis
-    save_todo_file_name = todo_file_name.replace("/", "_")
-
-    if todo_file_name == "config.yaml":
-        continue
-    
-    with open(f"{output_dir}/{save_todo_file_name}_simple_analysis_response.json") as f:
-        detailed_logic_analysis_response = json.load(f)
-    detailed_logic_analysis_dict[todo_file_name] = detailed_logic_analysis_response[0]['choices'][0]['message']['content']
-
-artifact_output_dir=f'{output_dir}/coding_artifacts'
-os.makedirs(artifact_output_dir, exist_ok=True)
-
-total_accumulated_cost = load_accumulated_cost(f"{output_dir}/accumulated_cost.json")
-for todo_idx, todo_file_name in enumerate(tqdm(todo_file_lst)):
-    responses = []
-    trajectories = copy.deepcopy(code_msg)
-
-    current_stage = f"[CODING] {todo_file_name}"
-    print(current_stage)
-
-    if todo_file_name == "config.yaml":
-        continue
-
-    instruction_msg = get_write_msg(todo_file_name, detailed_logic_analysis_dict[todo_file_name], done_file_lst)
-    trajectories.extend(instruction_msg)
-
-    completion = api_call(trajectories)
-    # print(completion.choices[0].message)
-    
-    # response
-    completion_json = convert_completion_to_json(completion)
-    responses.append(completion_json)
-
-    # trajectories
-    message = completion.choices[0].message
-    trajectories.append({'role': message.role, 'content': message.content})
-
-    done_file_lst.append(todo_file_name)
-
-    # save
-    # save_dir_name = f"{paper_name}_repo"
-    os.makedirs(f'{output_repo_dir}', exist_ok=True)
-    save_todo_file_name = todo_file_name.replace("/", "_")
-
+        waves = [[todo_file_name] for todo_file_name in todo_file_lst if todo_file_name != "config.yaml"]
 
-    # print and logging
-    print_response(completion_json)
-    temp_total_accumulated_cost = print_log_cost(completion_json, gpt_version, current_stage, output_dir, total_accumulated_cost)
-    total_accumulated_cost = temp_total_accumulated_cost
-
-    # save artifacts
-    with open(f'{artifact_output_dir}/{save_todo_file_name}_coding.txt', 'w', encoding='utf-8') as f:
-        f.write(completion_json['choices'][0]['message']['content'])
-
-
-    # extract code save 
-    code = extract_code_from_content(message.content)
-    if len(code) == 0:
-        code = message.content 
-
-    done_file_dict[todo_file_name] = code
-    if save_todo_file_name != todo_file_name:
-        todo_file_dir = '/'.join(todo_file_name.split("/")[:-1])
-        os.makedirs(f"{output_repo_dir}/{todo_file_dir}", exist_ok=True)
-
-    with open(f"{output_repo_dir}/{todo_file_name}", 'w', encoding='utf-8') as f:
-        f.write(code)
+    os.makedirs(f'{output_repo_dir}', exist_ok=True)
 
-save_accumulated_cost(f"{output_dir}/accumulated_cost.json", total_accumulated_cost)
+    manifest = StageManifest(output_dir, "coding")
+
+    ctx.total_accumulated_cost = load_accumulated_cost(f"{output_dir}/accumulated_cost.json")
+    progress = tqdm(total=sum(len(wave) for wave in waves))
+    for wave_idx, wave in enumerate(waves):
+        requests = []
+        todo_dict = {}
+        for todo_file_name in wave:
+            print(f"[CODING] {todo_file_name}")
+
+            if ctx.coding_schedule == "dag":
+                context_file_lst = ['config.yaml'] + get_transitive_dependencies(todo_file_name, dependency_dict, todo_file_lst)
+            else:
+                context_file_lst = list(done_file_lst)
+
+            current_stage = f"[CODING] {todo_file_name}"
+            query = "\n".join([todo_file_name, logic_analysis_dict.get(todo_file_name, ""),
+                               detailed_logic_analysis_dict[todo_file_name]])
+
+            # the shared context is identical for every file and sent ahead of the code
+            # files and the file-specific instruction, unless the prompt has to be trimmed
+            # with --code_context interface, files it does not use directly only show their interfaces
+            summary_file_lst = []
+            if ctx.code_context == "interface":
+                summary_file_lst = get_code_summary_lst(todo_file_name, context_file_lst, dependency_dict)
+
+            def build_msg(dropped):
+                code_file_lst = [f for f in context_file_lst if f"code:{f}" not in dropped]
+                instruction_msg = get_write_msg(ctx, todo_file_name, detailed_logic_analysis_dict[todo_file_name],
+                                                context_file_lst, code_file_lst, summary_file_lst)
+                return build_messages(code_msg, "# Context\n" + get_shared_context(ctx, dropped),
+                                      get_relevant_paper(ctx, current_stage, query, dropped) + instruction_msg)
+
+            trim_order = [f"code:{f}" for f in get_code_trim_order(todo_file_name, context_file_lst, dependency_dict)]
+            trajectories = ctx.fit_prompt(current_stage, build_msg, trim_order + PAPER_TRIM_ORDER)
+
+            input_hash = get_input_hash(trajectories, ctx.gpt_version)
+            if ctx.resume and load_done_code(ctx, manifest, todo_file_name, input_hash):
+                progress.update(1)
+                continue
+
+            artifact_path = f'{artifact_output_dir}/{todo_file_name.replace("/", "_")}_coding.txt'
+            requests.append((todo_file_name, trajectories, artifact_path))
+            todo_dict[todo_file_name] = (trajectories, input_hash)
+
+        # a failed file does not stop the rest of its wave from being saved (and skipped by --resume)
+        errors = []
+        # later waves find the shared prefix already cached
+        # the code block is all that is kept, so each stream ends at its closing fence
+        for todo_file_name, completion_json, error in ctx.chat_all(
+                requests, f"coding_wave_{wave_idx}", warm_up=(wave_idx == 0), stop_at="code"):
+            trajectories, input_hash = todo_dict[todo_file_name]
+            current_stage = f"[CODING] {todo_file_name}"
+            if error is not None:
+                print(f"[ERROR] {current_stage}: {error}")
+                errors.append(error)
+                continue
+
+            # trajectories
+            message = completion_json['choices'][0]['message']
+            trajectories.append({'role': message['role'], 'content': message['content']})
+
+            # save
+            # save_dir_name = f"{paper_name}_repo"
+            save_todo_file_name = todo_file_name.replace("/", "_")
+
+
+            # print and logging
+            print(current_stage)
+            print_response(completion_json)
+            ctx.log_cost(completion_json, current_stage)
+
+            # save artifacts
+            with open(f'{artifact_output_dir}/{save_todo_file_name}_coding.txt', 'w', encoding='utf-8') as f:
+                f.write(completion_json['choices'][0]['message']['content'])
+
+
+            # extract code save 
+            code = extract_code_from_content(message['content'])
+            if len(code) == 0:
+                code = message['content']
+
+            done_file_dict[todo_file_name] = code
+            if save_todo_file_name != todo_file_name:
+                todo_file_dir = '/'.join(todo_file_name.split("/")[:-1])
+                os.makedirs(f"{output_repo_dir}/{todo_file_dir}", exist_ok=True)
+
+            with open(f"{output_repo_dir}/{todo_file_name}", 'w', encoding='utf-8') as f:
+                f.write(code)
+
+            manifest.mark_done(todo_file_name, input_hash, [
+                f'{artifact_output_dir}/{save_todo_file_name}_coding.txt',
+                f"{output_repo_dir}/{todo_file_name}",
+            ])
+            progress.update(1)
+
+        if errors:
+            raise errors[0]
+
+        # keep task list order regardless of completion order
+        done_file_lst.extend(wave)
+    progress.close()
+    ctx.report_prompt_cache("[CODING]")
+    ctx.report_paper_retrieval("[CODING]")
+
+    save_accumulated_cost(f"{output_dir}/accumulated_cost.json", ctx.total_accumulated_cost)
+
+
+def main(args):
+    ctx = PipelineContext.from_args(args)
+    run(ctx)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--paper_name',type=str)
+    parser.add_argument('--gpt_version',type=str, default="o3-mini")
+    parser.add_argument('--paper_format',type=str, default="JSON", choices=["JSON", "LaTeX"])
+    parser.add_argument('--pdf_json_path', type=str) # json format
+    parser.add_argument('--pdf_latex_path', type=str) # latex format
+    parser.add_argument('--paper_serialization', type=str, default="markdown", choices=["markdown", "json"]) # how JSON papers are embedded in prompts
+    parser.add_argument('--output_dir',type=str, default="")
+    parser.add_argument('--output_repo_dir',type=str, default="")
+    parser.add_argument('--max_workers',type=int, default=1) # concurrent coding requests within a wave
+    parser.add_argument('--coding_schedule',type=str, default="sequential", choices=["sequential", "dag"])
+    parser.add_argument('--stream', action='store_true') # write responses to the artifacts as they arrive
+    parser.add_argument('--resume', action='store_true') # skip files whose inputs are unchanged
+    parser.add_argument('--batch', action='store_true') # submit each wave as one Batch API job
+    parser.add_argument('--max_prompt_tokens', type=int, default=None) # default: per-model budget
+    parser.add_argument('--paper_top_k', type=int, default=None) # send only the k most relevant paper sections per file
+    parser.add_argument('--paper_token_cap', type=int, default=None) # paper tokens per file with --paper_top_k
+    parser.add_argument('--code_context', type=str, default="full", choices=["full", "interface"]) # interface: summarize files that are not direct dependencies
+
+    args    = parser.parse_args()
+    main(args)
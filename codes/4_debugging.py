@@ -4,7 +4,7 @@ import argparse
 import re
 import sys
 
-from openai import OpenAI
+from llm_client import LLMClient
 from utils import read_python_files, content_to_json, extract_planning
 
 
@@ -123,19 +123,7 @@ def parse_args() -> argparse.Namespace:
 
 
 args = parse_args()
-# 支持自定义 API 基础 URL
-client_kwargs = {"api_key": os.environ["OPENAI_API_KEY"]}
-api_base = os.environ.get("OPENAI_API_BASE")
-if api_base:
-    # 确保 URL 格式正确，添加 /v1 后缀（如果还没有）
-    if not api_base.endswith('/v1'):
-        api_base = api_base.rstrip('/') + '/v1'
-    client_kwargs["base_url"] = api_base
-    print(f"[INFO] 使用自定义 API 基础 URL: {api_base}", file=sys.stderr)
-else:
-    print(f"[INFO] 使用官方 OpenAI API", file=sys.stderr)
-
-client = OpenAI(**client_kwargs)
+client = LLMClient.from_env()
 
 if not os.path.exists(args.error_file_name):
     raise FileNotFoundError(f"Error file not found: {args.error_file_name}")
@@ -257,13 +245,9 @@ result = model(input_data)
 """,
     },
 ]
-response = client.chat.completions.create(
-    model=args.model,
-    messages=msg,
-    reasoning_effort="high",
-)
+response = client.chat(msg, args.model, reasoning_effort="high")
 
-answer = response.choices[0].message.content
+answer = response['choices'][0]['message']['content']
 # print("===== RAW MODEL ANSWER =====")
 # print(answer)
 
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sys
+
+ARTIFACT_STORES = ["json", "blobs", "blobs-zstd"]
+TRAJECTORIES_FORMAT = "paper2code-trajectories/1"
+INLINE_MAX_BYTES = 1024  # shorter message bodies stay in the trajectory file
+
+
+class BlobStore:
+    """Content-addressed store for message bodies under `<output_dir>/blobs`.
+
+    Every body is written once as `<sha256[:2]>/<sha256>` (`.zst` when
+    compressed), no matter how many trajectory files refer to it, so the
+    system prompt, paper and plan shared by all per-file trajectories take
+    the disk space of a single copy.
+    """
+
+    def __init__(self, root, compression=None):
+        self.root = root
+        self.compression = compression
+        if compression == "zstd" and get_zstd() is None:
+            print("[WARNING] zstandard is not installed; storing blobs uncompressed.", file=sys.stderr)
+            self.compression = None
+        self.written = set()
+
+    def path(self, digest, compressed):
+        return os.path.join(self.root, digest[:2], digest + (".zst" if compressed else ""))
+
+    def put(self, text):
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self.written:
+            return f"sha256:{digest}"
+        compressed = self.compression == "zstd"
+        path = self.path(digest, compressed)
+        if not os.path.exists(path) and not os.path.exists(self.path(digest, not compressed)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if compressed:
+                data = get_zstd().ZstdCompressor(level=10).compress(data)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.written.add(digest)
+        return f"sha256:{digest}"
+
+    def get(self, ref):
+        digest = ref.split(":", 1)[1]
+        path = self.path(digest, False)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read().decode("utf-8")
+        zstd = get_zstd()
+        if zstd is None:
+            raise RuntimeError(f"Blob {digest} is zstd-compressed; install zstandard to read it")
+        with open(self.path(digest, True), "rb") as f:
+            return zstd.ZstdDecompressor().decompress(f.read()).decode("utf-8")
+
+
+def get_zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def get_blob_store(output_dir, artifact_store):
+    if artifact_store == "blobs":
+        return BlobStore(os.path.join(output_dir, "blobs"))
+    if artifact_store == "blobs-zstd":
+        return BlobStore(os.path.join(output_dir, "blobs"), compression="zstd")
+    return None
+
+
+def save_trajectories(path, trajectories, blob_store=None):
+    """Write a message list; with a blob store, long bodies are replaced by references to their blobs."""
+    if blob_store is None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trajectories, f)
+        return
+
+    messages = []
+    for message in trajectories:
+        content = message.get("content")
+        if isinstance(content, str) and len(content.encode("utf-8")) > INLINE_MAX_BYTES:
+            ref = blob_store.put(content)
+            message = {("content_ref" if k == "content" else k): (ref if k == "content" else v) for k, v in message.items()}
+        messages.append(message)
+    blob_dir = os.path.relpath(blob_store.root, os.path.dirname(os.path.abspath(path)))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"format": TRAJECTORIES_FORMAT, "blob_dir": blob_dir, "messages": messages}, f)
+
+
+def load_trajectories(path):
+    """Read a message list written by save_trajectories, in either layout."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if not (isinstance(data, dict) and data.get("format") == TRAJECTORIES_FORMAT):
+        return data
+
+    blob_store = BlobStore(os.path.join(os.path.dirname(os.path.abspath(path)), data["blob_dir"]))
+    trajectories = []
+    for message in data["messages"]:
+        if "content_ref" in message:
+            message = {("content" if k == "content_ref" else k): (blob_store.get(v) if k == "content_ref" else v)
+                       for k, v in message.items()}
+        trajectories.append(message)
+    return trajectories
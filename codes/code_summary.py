@@ -0,0 +1,78 @@
+import ast
+import copy
+
+CODE_CONTEXTS = ["full", "interface"]
+MAX_VALUE_CHARS = 80  # longer constant values are shown as ...
+
+
+def summarize_python_source(source):
+    """Interface of a Python file: imports, constants, classes and function signatures with their
+    docstrings, every body replaced by `...`. Returns None if the source does not parse."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+
+    body = []
+    if ast.get_docstring(tree) is not None:
+        body.append(tree.body[0])
+    for node in tree.body[len(body):]:
+        summary = summarize_node(node, in_class=False)
+        if summary is not None:
+            body.append(summary)
+    tree.body = body
+    return ast.unparse(tree)
+
+
+def summarize_node(node, in_class):
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return None if in_class else node
+
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        if is_private(node.name):
+            return None
+        node = copy.copy(node)
+        node.body = get_docstring_body(node) + [ast.Expr(ast.Constant(...))]
+        return node
+
+    if isinstance(node, ast.ClassDef):
+        if is_private(node.name):
+            return None
+        node = copy.copy(node)
+        docstring_body = get_docstring_body(node)
+        members = [summarize_node(child, in_class=True) for child in node.body[len(docstring_body):]]
+        node.body = docstring_body + [member for member in members if member is not None]
+        if not node.body:
+            node.body = [ast.Expr(ast.Constant(...))]
+        return node
+
+    if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+        node = copy.copy(node)
+        node.value = shorten_value(node.value)
+        return node
+
+    if isinstance(node, ast.Assign):
+        names = [target.id for target in node.targets if isinstance(target, ast.Name)]
+        # class attributes and module-level CONSTANTS; other module-level assignments are implementation
+        if names and len(names) == len(node.targets) and (in_class or all(name.isupper() for name in names)):
+            node = copy.copy(node)
+            node.value = shorten_value(node.value)
+            return node
+
+    return None
+
+
+def get_docstring_body(node):
+    if ast.get_docstring(node) is not None:
+        return [node.body[0]]
+    return []
+
+
+def shorten_value(value):
+    if value is not None and len(ast.unparse(value)) > MAX_VALUE_CHARS:
+        return ast.Constant(...)
+    return value
+
+
+def is_private(name):
+    return name.startswith("_") and not (name.startswith("__") and name.endswith("__"))
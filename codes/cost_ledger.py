@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+LEDGER_FILE = "cost_ledger.sqlite"
+LEDGER_GROUP_KEYS = ["paper", "stage", "model", "run_id"]
+BUSY_TIMEOUT_MS = 60_000  # writers of other processes hold the lock for one INSERT at a time
+
+# every process appends under its own run id, so one run can be told apart from earlier ones
+RUN_ID = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    paper TEXT,
+    stage TEXT,
+    file TEXT,
+    model TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    from_cache INTEGER NOT NULL DEFAULT 0,
+    from_batch INTEGER NOT NULL DEFAULT 0,
+    estimated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS calls_paper ON calls (paper);
+CREATE INDEX IF NOT EXISTS calls_run_id ON calls (run_id);
+"""
+COLUMNS = ["ts", "run_id", "paper", "stage", "file", "model", "prompt_tokens", "cached_tokens",
+           "completion_tokens", "cost", "from_cache", "from_batch", "estimated"]
+# counts and flags of a record that lacks them (e.g. written before the field existed) are stored as 0
+ZERO_DEFAULT_COLUMNS = {"prompt_tokens", "cached_tokens", "completion_tokens", "cost", "from_cache", "from_batch",
+                        "estimated"}
+# columns added after the first release, added to ledgers created before them
+ADDED_COLUMNS = {"estimated": "INTEGER NOT NULL DEFAULT 0"}
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+class CostLedger:
+    """Append-only record of every billed call in a SQLite database in WAL mode.
+
+    Each call is one INSERT in its own transaction, so any number of threads
+    and processes can write to the same ledger without the lost updates of
+    a read-modify-write total: totals are only ever computed by queries.
+    Every thread uses its own connection; SQLite's file locks order the
+    writers of different processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(calls)")}
+            for column, definition in ADDED_COLUMNS.items():
+                if column not in existing:
+                    try:
+                        conn.execute(f"ALTER TABLE calls ADD COLUMN {column} {definition}")
+                    except sqlite3.OperationalError:
+                        pass  # added by another process in the meantime
+
+    def connect(self):
+        # connections are not carried across fork() or shared between threads
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def append(self, record):
+        """Add one call; `record` is a telemetry.build_record dict."""
+        row = dict(record, run_id=record.get("run_id") or RUN_ID)
+        values = []
+        for column in COLUMNS:
+            value = row.get(column)
+            if value is None and column in ZERO_DEFAULT_COLUMNS:
+                value = 0
+            values.append(int(value) if isinstance(value, bool) else value)
+        with self.connect() as conn:
+            conn.execute(f"INSERT INTO calls ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", values)
+
+    def total_cost(self, **filters):
+        """Sum of `cost` over the calls matching every `column=value` filter (paper, stage, model, run_id)."""
+        where, params = build_where(filters)
+        row = self.connect().execute(f"SELECT COALESCE(SUM(cost), 0) FROM calls{where}", params).fetchone()
+        return row[0]
+
+    def summarize(self, group_by, **filters):
+        """Calls, tokens and cost per value of `group_by` (one of LEDGER_GROUP_KEYS)."""
+        if group_by not in LEDGER_GROUP_KEYS:
+            raise ValueError(f"Cannot group the ledger by {group_by!r}")
+        where, params = build_where(filters)
+        rows = self.connect().execute(
+            f"SELECT {group_by}, COUNT(*), SUM(from_cache), SUM(estimated), SUM(prompt_tokens), "
+            f"SUM(cached_tokens), SUM(completion_tokens), SUM(cost) FROM calls{where} GROUP BY {group_by} ORDER BY {group_by}",
+            params).fetchall()
+        keys = [group_by, "calls", "cache_hits", "estimated", "prompt_tokens", "cached_tokens", "completion_tokens",
+                "cost"]
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def build_where(filters):
+    filters = {k: v for k, v in filters.items() if v is not None}
+    for column in filters:
+        if column not in LEDGER_GROUP_KEYS:
+            raise ValueError(f"Cannot filter the ledger by {column!r}")
+    if not filters:
+        return "", []
+    return " WHERE " + " AND ".join(f"{column} = ?" for column in filters), list(filters.values())
+
+
+def get_ledger_path(output_dir):
+    # PAPER2CODE_LEDGER lets every paper and stage of a run share one ledger
+    return os.environ.get("PAPER2CODE_LEDGER") or os.path.join(output_dir, LEDGER_FILE)
+
+
+def get_ledger(path):
+    """Process-wide CostLedger of `path`."""
+    with _ledgers_lock:
+        if path not in _ledgers:
+            _ledgers[path] = CostLedger(path)
+        return _ledgers[path]
+
+
+def append_to_ledger(output_dir, record):
+    """Record a call in the ledger of `output_dir`; a ledger failure is reported, never raised."""
+    try:
+        get_ledger(get_ledger_path(output_dir)).append(record)
+    except sqlite3.Error as e:
+        print(f"[WARNING] Cost ledger not updated: {e}", file=sys.stderr)
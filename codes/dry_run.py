@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+
+from pipeline import PipelineContext
+from prompt_layout import get_stage_tag
+from token_counter import count_message_tokens, count_text_tokens
+from utils import cal_cost
+
+# completion tokens (reasoning included) per request when no earlier run has logged the stage
+DEFAULT_OUTPUT_TOKENS = {"[Planning]": 4000, "[ANALYSIS]": 3000, "[CODING]": 4000}
+DEFAULT_TOKENS_PER_SECOND = 60.0
+
+# the provider caches prompt prefixes of at least 1024 tokens, in steps of 128
+MIN_CACHED_PREFIX_TOKENS = 1024
+CACHED_PREFIX_BLOCK = 128
+
+STAGE_PATTERN = re.compile(r'^(\[[^\]]+\].*)$')
+OUTPUT_TOKENS_PATTERN = re.compile(r'^📤 Output tokens: (\d+)')
+TIMING_PATTERN = re.compile(r'^⏱️ Time to first token: ([\d.]+)s \(total: ([\d.]+)s\)')
+
+
+class History:
+    """Completion tokens and generation speed per stage, read from the cost_info.log of earlier runs."""
+
+    def __init__(self, history_dirs):
+        self.stage_outputs = defaultdict(list)  # "[CODING] model.py" -> [completion tokens, ...]
+        self.tag_outputs = defaultdict(list)    # "[CODING]" -> [completion tokens, ...]
+        self.speeds = []                        # completion tokens per second of streamed responses
+        for history_dir in history_dirs:
+            for root, _, files in os.walk(history_dir):
+                if "cost_info.log" in files:
+                    self.read_log(os.path.join(root, "cost_info.log"))
+
+    def read_log(self, path):
+        stage, output_tokens = None, None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line == "🌟 Usage Summary 🌟":
+                    stage, output_tokens = "", None
+                elif stage == "" and STAGE_PATTERN.match(line):
+                    stage = line
+                elif stage and OUTPUT_TOKENS_PATTERN.match(line):
+                    output_tokens = int(OUTPUT_TOKENS_PATTERN.match(line).group(1))
+                    if output_tokens:
+                        self.stage_outputs[stage].append(output_tokens)
+                        self.tag_outputs[get_stage_tag(stage)].append(output_tokens)
+                elif stage and output_tokens and TIMING_PATTERN.match(line):
+                    ttft, total = map(float, TIMING_PATTERN.match(line).groups())
+                    if total > ttft:
+                        self.speeds.append(output_tokens / (total - ttft))
+
+    def output_tokens(self, current_stage):
+        samples = self.stage_outputs.get(current_stage) or self.tag_outputs.get(get_stage_tag(current_stage))
+        if samples:
+            return round(sum(samples) / len(samples))
+        return None
+
+    def tokens_per_second(self):
+        return sum(self.speeds) / len(self.speeds) if self.speeds else DEFAULT_TOKENS_PER_SECOND
+
+
+def find_reference_dir(candidates):
+    """First directory holding a finished planning run, whose answers stand in for the model's."""
+    for candidate in candidates:
+        for root, _, files in os.walk(candidate):
+            if "planning_response.json" in files:
+                return root
+    return None
+
+
+class DryRunContext(PipelineContext):
+    """PipelineContext that builds every prompt of a run without calling the API.
+
+    Each request is answered with the matching answer of a reference run
+    (`reference_dir`) so later stages get realistic plans, analyses and
+    code to build their prompts from; answers it lacks are replaced by
+    filler of the expected length. Prompt tokens are counted, completion
+    tokens come from the `history` of earlier runs, and every request is
+    priced with utils.cal_cost.
+    """
+
+    records_spend = False
+
+    def __init__(self, *args, history=None, reference_dir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stream = False
+        self.batch = False
+        self.resume = False
+        self.history = history or History([])
+        self.reference_dir = reference_dir
+        self.rows = []
+        self.seen_prefixes = set()
+        self.prefix_lock = threading.Lock()
+
+    def chat(self, msg, artifact_path=None, stop_at=None, **kwargs):
+        # nothing is streamed, so `stop_at` has no effect
+        content = self.get_reference_answer(artifact_path)
+        prompt_tokens = count_message_tokens(msg, self.gpt_version)
+        return {
+            "model": self.gpt_version,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens,
+                      "completion_tokens": count_text_tokens(content, self.gpt_version),
+                      "prompt_tokens_details": {"cached_tokens": self.estimate_cached_tokens(msg)}},
+        }
+
+    def estimate_cached_tokens(self, msg):
+        """Tokens of the longest leading run of messages already sent by an earlier request."""
+        hashes = []
+        digest = hashlib.sha256()
+        for message in msg:
+            digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            hashes.append(digest.copy().hexdigest())
+        with self.prefix_lock:
+            num_cached = 0
+            for idx, prefix_hash in enumerate(hashes):
+                if prefix_hash in self.seen_prefixes:
+                    num_cached = idx + 1
+            self.seen_prefixes.update(hashes)
+        if num_cached == len(msg):
+            num_cached -= 1  # an identical request still has its last message processed
+        cached_tokens = count_message_tokens(msg[:num_cached], self.gpt_version) if num_cached else 0
+        if cached_tokens < MIN_CACHED_PREFIX_TOKENS:
+            return 0
+        return cached_tokens // CACHED_PREFIX_BLOCK * CACHED_PREFIX_BLOCK
+
+    def get_reference_answer(self, artifact_path):
+        name = os.path.basename(artifact_path or "")
+        reference_dir = self.reference_dir
+        if reference_dir:
+            match = re.match(r'planning_(\d+)_response\.txt$', name)
+            if match:
+                with open(os.path.join(reference_dir, "planning_response.json"), encoding="utf-8") as f:
+                    responses = json.load(f)
+                if int(match.group(1)) < len(responses):
+                    return responses[int(match.group(1))]["choices"][0]["message"]["content"]
+            for artifact_dir in ("analyzing_artifacts", "coding_artifacts"):
+                path = os.path.join(reference_dir, artifact_dir, name)
+                if name and os.path.exists(path):
+                    with open(path, encoding="utf-8") as f:
+                        return f.read()
+        if name.endswith("_coding.txt"):
+            file_name = name[:-len("_coding.txt")]
+            return f"```python\n## {file_name}\n" + "pass\n" * DEFAULT_OUTPUT_TOKENS["[CODING]"] + "```"
+        return "analysis " * DEFAULT_OUTPUT_TOKENS["[ANALYSIS]"]
+
+    def log_cost(self, completion_json, current_stage):
+        usage = completion_json["usage"]
+        # reasoning tokens are billed as output too, so logged completions beat the length of the stand-in answer
+        usage["completion_tokens"] = self.history.output_tokens(current_stage) \
+            or max(usage["completion_tokens"], DEFAULT_OUTPUT_TOKENS.get(get_stage_tag(current_stage), 0))
+        usage_info = cal_cost(completion_json, self.gpt_version)
+        self.rows.append({
+            "stage": get_stage_tag(current_stage),
+            "unit": current_stage[len(get_stage_tag(current_stage)):].strip(),
+            "input_tokens": usage["prompt_tokens"],
+            "cached_tokens": usage["prompt_tokens_details"]["cached_tokens"],
+            "output_tokens": usage["completion_tokens"],
+            "cost": usage_info["total_cost"],
+            "seconds": usage["completion_tokens"] / self.history.tokens_per_second(),
+        })
+        return super().log_cost(completion_json, current_stage)
+
+
+def summarize_rows(rows):
+    """Per-stage subtotals and the overall total of the estimate."""
+    totals = {}
+    for row in rows + [dict(row, stage="Total") for row in rows]:
+        total = totals.setdefault(row["stage"], {"stage": row["stage"], "unit": "", "requests": 0, "input_tokens": 0,
+                                                 "cached_tokens": 0, "output_tokens": 0, "cost": 0.0, "seconds": 0.0})
+        total["requests"] += 1
+        for key in ("input_tokens", "cached_tokens", "output_tokens", "cost", "seconds"):
+            total[key] += row[key]
+    return list(totals.values())
+
+
+def format_estimate(rows):
+    header = f"{'Stage':<12} {'Unit':<32} {'Input':>9} {'Cached':>9} {'Output':>9} {'Cost ($)':>10} {'Time (s)':>9}"
+    lines = [header, "-" * len(header)]
+
+    def format_row(row, unit):
+        return (f"{row['stage']:<12} {unit[:32]:<32} {row['input_tokens']:>9} {row['cached_tokens']:>9} "
+                f"{row['output_tokens']:>9} {row['cost']:>10.4f} {row['seconds']:>9.0f}")
+
+    for row in rows:
+        lines.append(format_row(row, row["unit"]))
+    lines.append("-" * len(header))
+    for total in summarize_rows(rows):
+        lines.append(format_row(total, f"({total['requests']} requests)"))
+    return "\n".join(lines)
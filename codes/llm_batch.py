@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+from llm_cache import make_cache_key
+from llm_client import build_request, without_timing
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+DEFAULT_POLL_INTERVAL = 30.0  # seconds between status checks
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def to_batch_line(custom_id, request_json):
+    body = {k: v for k, v in request_json.items() if k != "timeout"}
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def parse_batch_output(text):
+    """custom_id -> (completion_json, error) for every line of a batch output or error file."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code", 200) != 200:
+            error = item.get("error") or (response.get("body") or {}).get("error") or response
+            results[item["custom_id"]] = (None, RuntimeError(f"Batch request {item['custom_id']} failed: {error}"))
+        else:
+            results[item["custom_id"]] = (response["body"], None)
+    return results
+
+
+class BatchRunner:
+    """Runs the independent requests of a stage as one OpenAI Batch API job.
+
+    Requests are written to `<output_dir>/batch/<name>_requests.jsonl`,
+    uploaded and submitted; the job is polled until it finishes and its
+    results are handed back per request. The id of the submitted job is
+    kept in `<name>_batch.json`, so a restarted run with the same requests
+    picks up the job that is already running instead of paying for it twice.
+    Requests answered by the response cache are never submitted.
+    """
+
+    def __init__(self, llm_client, output_dir, gpt_version, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.llm_client = llm_client
+        self.client = llm_client.client  # openai.OpenAI
+        self.batch_dir = os.path.join(output_dir, "batch")
+        self.gpt_version = gpt_version
+        self.poll_interval = poll_interval
+
+    def run(self, name, requests):
+        """`requests` is a list of (custom_id, msg); yields (custom_id, completion_json, error)."""
+        cache = self.llm_client.cache
+        pending = []
+        for custom_id, msg in requests:
+            request_json = build_request(msg, self.gpt_version)
+            completion_json = cache.get(make_cache_key(request_json)) if cache is not None else None
+            if completion_json is not None:
+                completion_json["from_cache"] = True
+                yield custom_id, completion_json, None
+            else:
+                pending.append((custom_id, request_json))
+        if not pending:
+            return
+
+        os.makedirs(self.batch_dir, exist_ok=True)
+        input_path = os.path.join(self.batch_dir, f"{name}_requests.jsonl")
+        content = "".join(json.dumps(to_batch_line(custom_id, request_json)) + "\n"
+                          for custom_id, request_json in pending)
+        with open(input_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        input_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+        batch = self.poll(self.get_or_submit(name, input_path, input_hash))
+
+        results = {}
+        if batch.output_file_id:
+            results.update(parse_batch_output(self.client.files.content(batch.output_file_id).text))
+        if batch.error_file_id:
+            results.update(parse_batch_output(self.client.files.content(batch.error_file_id).text))
+
+        for custom_id, request_json in pending:
+            completion_json, error = results.get(custom_id, (None, None))
+            if completion_json is None and error is None:
+                error = RuntimeError(f"Batch {batch.id} ended as '{batch.status}' without a result for {custom_id}")
+            if completion_json is not None:
+                completion_json["from_batch"] = True
+                if cache is not None:
+                    cache.put(make_cache_key(request_json), without_timing(completion_json))
+            yield custom_id, completion_json, error
+
+    def get_or_submit(self, name, input_path, input_hash):
+        state_path = os.path.join(self.batch_dir, f"{name}_batch.json")
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("input_hash") == input_hash:
+                batch = self.client.batches.retrieve(state["batch_id"])
+                if batch.status not in ("failed", "expired", "cancelled"):
+                    print(f"[BATCH] Reusing {batch.id} ({batch.status}) for {name}")
+                    return batch.id
+
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=BATCH_COMPLETION_WINDOW)
+        print(f"[BATCH] Submitted {batch.id} for {name}")
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"batch_id": batch.id, "input_file_id": input_file.id, "input_hash": input_hash}, f)
+        return batch.id
+
+    def poll(self, batch_id):
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            progress = f"{counts.completed + counts.failed}/{counts.total}" if counts else "-"
+            print(f"[BATCH] {batch_id}: {batch.status} ({progress})", file=sys.stderr)
+            if batch.status in FINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_interval)
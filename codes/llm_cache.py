@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+CACHE_MODES = ["off", "read_write", "read_only", "write_only"]
+
+# request fields that do not change what the model returns
+NON_SEMANTIC_KEYS = {"timeout", "stream", "stream_options", "user", "metadata", "store"}
+
+
+def make_cache_key(request_json, stop_at=None):
+    """sha256 over the model, messages and every sampling parameter of a request.
+
+    A stream closed at its first `stop_at` block (llm_client.py) holds a
+    truncated answer, so it is kept apart from the full answer of the same
+    request.
+    """
+    key_json = {k: v for k, v in request_json.items() if k not in NON_SEMANTIC_KEYS}
+    if stop_at is not None:
+        key_json["stop_at"] = stop_at
+    payload = json.dumps(key_json, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk, content-addressed store of completion JSON with size-based LRU eviction.
+
+    Entries live at `<cache_dir>/<key[:2]>/<key>.json`. A hit refreshes the
+    file's mtime, so eviction (oldest mtime first) approximates LRU across
+    processes without any shared index.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, mode="read_write"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.total_bytes = None  # computed lazily on the first write
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def readable(self):
+        return self.mode in ("read_write", "read_only")
+
+    @property
+    def writable(self):
+        return self.mode in ("read_write", "write_only")
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        if not self.readable:
+            return None
+        path = self.get_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                completion_json = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return completion_json
+
+    def put(self, key, completion_json):
+        if not self.writable:
+            return
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(completion_json, f)
+
+        with self.lock:
+            # an overwritten entry no longer counts towards the budget
+            try:
+                replaced_bytes = os.path.getsize(path)
+            except OSError:
+                replaced_bytes = 0
+            os.replace(tmp_path, path)
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self.scan())
+            else:
+                self.total_bytes += os.path.getsize(path) - replaced_bytes
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def scan(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith(".json"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        # drop least recently used entries until 90% of the budget is free again
+        entries = sorted(self.scan(), key=lambda entry: entry[2])
+        total_bytes = sum(size for _, size, _ in entries)
+        target_bytes = int(self.max_bytes * 0.9)
+        for path, size, _ in entries:
+            if total_bytes <= target_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass
+        self.total_bytes = total_bytes
+
+
+def cache_from_env():
+    cache_dir = os.environ.get("PAPER2CODE_CACHE_DIR")
+    mode = os.environ.get("PAPER2CODE_CACHE_MODE", "read_write")
+    if not cache_dir or mode == "off":
+        return None
+    max_bytes = int(float(os.environ.get("PAPER2CODE_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 ** 2)) * 1024 ** 2)
+    return ResponseCache(cache_dir, max_bytes=max_bytes, mode=mode)
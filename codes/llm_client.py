@@ -0,0 +1,488 @@
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from llm_cache import cache_from_env, make_cache_key
+from stream_extract import get_extractor
+from token_counter import count_message_tokens, count_text_tokens
+
+DEFAULT_TIMEOUT = 600.0         # seconds per request; o3-mini coding answers can take minutes
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_MAX_CONNECTIONS = 32
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 120.0
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# models that get `reasoning_effort="high"` unless the caller says otherwise
+REASONING_EFFORT_MODELS = ("o3-mini", "o4-mini")
+
+
+def get_api_base():
+    # 支持自定义 API 基础 URL
+    api_base = os.environ.get("OPENAI_API_BASE")
+    if api_base:
+        # 确保 URL 格式正确，添加 /v1 后缀（如果还没有）
+        if not api_base.endswith('/v1'):
+            api_base = api_base.rstrip('/') + '/v1'
+        print(f"[INFO] 使用自定义 API 基础 URL: {api_base}", file=sys.stderr)
+    else:
+        print(f"[INFO] 使用官方 OpenAI API", file=sys.stderr)
+    return api_base
+
+
+def build_request(msg, gpt_version, **kwargs):
+    request_json = {"model": gpt_version, "messages": msg}
+    if any(name in gpt_version for name in REASONING_EFFORT_MODELS):
+        request_json["reasoning_effort"] = "high"
+    request_json.update(kwargs)
+    return request_json
+
+
+def convert_completion_to_json(completion):
+    """处理不同API端点返回的响应格式"""
+    # 检查是否已经是dict
+    if isinstance(completion, dict):
+        return completion
+
+    # 检查是否是字符串
+    if isinstance(completion, str):
+        # 尝试解析JSON
+        try:
+            return json.loads(completion)
+        except json.JSONDecodeError as e:
+            print(f"[DEBUG] 字符串解析失败: {e}", file=sys.stderr)
+            print(f"[DEBUG] 返回值内容: {completion[:500]}", file=sys.stderr)
+            raise
+
+    # 检查是否是对象
+    try:
+        # 尝试调用 model_dump_json()
+        if hasattr(completion, 'model_dump_json'):
+            return json.loads(completion.model_dump_json())
+        # 尝试调用 model_dump()
+        elif hasattr(completion, 'model_dump'):
+            return completion.model_dump()
+        # 尝试调用 dict()
+        elif hasattr(completion, '__dict__'):
+            return vars(completion)
+        else:
+            # 最后的尝试：直接转换为JSON字符串
+            print(f"[DEBUG] 未知对象类型: {type(completion)}", file=sys.stderr)
+            print(f"[DEBUG] 对象内容: {str(completion)[:500]}", file=sys.stderr)
+            raise TypeError(f"无法转换类型 {type(completion)} 到 JSON")
+    except Exception as e:
+        print(f"[DEBUG] 对象转换失败: {e}", file=sys.stderr)
+        raise
+
+
+def collect_stream(stream, writer=None, start_time=None, extractor=None):
+    """Assemble streamed chunks into the same completion JSON a non-streaming call returns.
+
+    Content is handed to `writer` as it arrives; the time to the first
+    content token is kept under `timing` next to the usual fields. Once
+    `extractor` (stream_extract.py) has seen its block end, the stream is
+    closed so the rest of the answer is neither waited for nor generated;
+    such completions are marked `stopped_early` and carry no usage.
+    """
+    start_time = start_time or time.time()
+    first_token_time = None
+    completion_json = {"object": "chat.completion"}
+    role = "assistant"
+    content_parts = []
+    finish_reason = None
+    usage = None
+    stopped_early = False
+
+    for chunk in stream:
+        chunk_json = convert_completion_to_json(chunk)
+        for key in ("id", "created", "model", "system_fingerprint"):
+            if chunk_json.get(key) is not None:
+                completion_json[key] = chunk_json[key]
+        if chunk_json.get("usage"):
+            usage = chunk_json["usage"]
+        for choice in chunk_json.get("choices") or []:
+            if choice.get("index", 0) != 0:
+                continue
+            delta = choice.get("delta") or {}
+            role = delta.get("role") or role
+            text = delta.get("content")
+            if text:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                content_parts.append(text)
+                if writer is not None:
+                    writer.write(text)
+                if extractor is not None and extractor.feed(text):
+                    stopped_early = True
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+        if stopped_early:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()  # drops the connection; the server stops generating
+            finish_reason = finish_reason or "stop"
+            completion_json["stopped_early"] = True
+            break
+
+    end_time = time.time()
+    usage = usage or {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    usage["prompt_tokens_details"] = usage.get("prompt_tokens_details") or {"cached_tokens": 0}
+
+    completion_json["choices"] = [{
+        "index": 0,
+        "message": {"role": role, "content": "".join(content_parts)},
+        "finish_reason": finish_reason,
+    }]
+    completion_json["usage"] = usage
+    completion_json["timing"] = {
+        "ttft": None if first_token_time is None else round(first_token_time - start_time, 3),
+        "total": round(end_time - start_time, 3),
+    }
+    return completion_json
+
+
+class StreamWriter:
+    """Appends streamed content to an artifact file as it arrives.
+
+    `start` truncates the file, so a retried stream does not leave the
+    partial text of the failed attempt behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def start(self):
+        self.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.f = open(self.path, "w", encoding="utf-8")
+
+    def write(self, text):
+        self.f.write(text)
+        self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def without_timing(completion_json):
+    # timings and retry counts describe one particular call and are not worth replaying from the cache
+    return {k: v for k, v in completion_json.items() if k not in ("timing", "retries")}
+
+
+def estimate_request_tokens(request_json):
+    # prompt size reserved against the rate limit; repeated prompt prefixes are counted once (token_counter.py)
+    return count_message_tokens(request_json.get("messages", []), request_json.get("model"))
+
+
+def estimate_usage(request_json, completion_json):
+    """Usage of a stream closed before the provider reported it: the prompt plus the text received."""
+    prompt_tokens = estimate_request_tokens(request_json)
+    completion_tokens = count_text_tokens(completion_json["choices"][0]["message"]["content"] or "",
+                                          request_json.get("model"))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens, "prompt_tokens_details": {"cached_tokens": 0},
+            "estimated": True}
+
+
+class TokenRateLimiter:
+    """Tokens-per-minute budget shared by every request sent through one client.
+
+    A request reserves its estimated prompt size before it is sent and the
+    reservation is corrected to the reported `total_tokens` once it returns;
+    requests wait while the last 60 seconds already used up the budget.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self.cond = threading.Condition()
+        self.reservations = collections.deque()  # [timestamp, tokens]
+        self.used_tokens = 0
+
+    def expire(self, now):
+        while self.reservations and self.reservations[0][0] <= now - self.WINDOW:
+            self.used_tokens -= self.reservations.popleft()[1]
+
+    def acquire(self, tokens):
+        # a request larger than the whole budget still goes out, alone
+        tokens = min(tokens, self.tokens_per_minute)
+        with self.cond:
+            while True:
+                now = time.time()
+                self.expire(now)
+                if self.used_tokens + tokens <= self.tokens_per_minute:
+                    reservation = [now, tokens]
+                    self.reservations.append(reservation)
+                    self.used_tokens += tokens
+                    return reservation
+                self.cond.wait(timeout=max(0.05, self.reservations[0][0] + self.WINDOW - now))
+
+    def settle(self, reservation, tokens):
+        with self.cond:
+            if any(r is reservation for r in self.reservations):
+                self.used_tokens += tokens - reservation[1]
+            reservation[1] = tokens
+            self.cond.notify_all()
+
+
+def is_retryable(error):
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def get_retry_after(error):
+    """Delay in seconds requested by the server through Retry-After headers, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def get_retry_delay(error, attempt):
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    # exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def log_retry(error, attempt, max_retries, delay):
+    status = getattr(error, "status_code", type(error).__name__)
+    print(f"[WARNING] API 请求失败 ({status}), {delay:.1f}s 后重试 ({attempt + 1}/{max_retries})", file=sys.stderr)
+
+
+class LLMClient:
+    """Pooled OpenAI client shared by every stage, with timeouts and retry/backoff.
+
+    The SDK's own retries are disabled so that every retry goes through
+    `get_retry_delay`, which honours Retry-After on 429/503 responses.
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, max_connections=DEFAULT_MAX_CONNECTIONS, cache=None,
+                 rate_limiter=None, max_concurrent_requests=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache  # llm_cache.ResponseCache or None
+        self.rate_limiter = rate_limiter  # TokenRateLimiter or None
+        # caps in-flight requests across every thread sharing this client
+        self.request_slots = threading.BoundedSemaphore(max_concurrent_requests) if max_concurrent_requests else None
+        self.local = threading.local()  # retries of the last call made on each thread
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=DEFAULT_CONNECT_TIMEOUT),
+        )
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                             timeout=timeout, http_client=self.http_client)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        kwargs.setdefault("timeout", float(os.environ.get("OPENAI_TIMEOUT", DEFAULT_TIMEOUT)))
+        kwargs.setdefault("max_retries", int(os.environ.get("OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES)))
+        kwargs.setdefault("cache", cache_from_env())
+        return cls(api_key=os.environ["OPENAI_API_KEY"], base_url=get_api_base(), **kwargs)
+
+    def call_with_retries(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                result = fn(*args, **kwargs)
+                self.local.retries = attempt
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = get_retry_delay(e, attempt)
+                log_retry(e, attempt, self.max_retries, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    def create(self, **request_json):
+        """`chat.completions.create` with per-request timeout and retries; returns the SDK object."""
+        request_json.setdefault("timeout", self.timeout)
+        return self.call_with_retries(self.client.chat.completions.create, **request_json)
+
+    def read_stream(self, request_json, writer=None, stop_at=None):
+        if writer is not None:
+            writer.start()
+        try:
+            start_time = time.time()
+            # a fresh extractor per attempt, so a retried stream starts from a clean state
+            completion_json = collect_stream(self.client.chat.completions.create(**request_json), writer, start_time,
+                                             get_extractor(stop_at))
+            if completion_json.get("stopped_early"):
+                completion_json["usage"] = estimate_usage(request_json, completion_json)
+            return completion_json
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def complete(self, request_json):
+        """Send a full request body through the response cache and return the completion JSON."""
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(request_json)
+            completion_json = self.cache.get(key)
+            if completion_json is not None:
+                completion_json["from_cache"] = True
+                return completion_json
+
+        with self.request_slot():
+            reservation = self.reserve(request_json)
+            start_time = time.time()
+            completion_json = convert_completion_to_json(self.create(**request_json))
+            completion_json["timing"] = {"ttft": None, "total": round(time.time() - start_time, 3)}
+            completion_json["retries"] = self.local.retries
+            self.settle(reservation, completion_json)
+        if self.cache is not None:
+            self.cache.put(key, without_timing(completion_json))
+        return completion_json
+
+    def request_slot(self):
+        return self.request_slots if self.request_slots is not None else contextlib.nullcontext()
+
+    def reserve(self, request_json):
+        if self.rate_limiter is None:
+            return None
+        return self.rate_limiter.acquire(estimate_request_tokens(request_json))
+
+    def settle(self, reservation, completion_json):
+        if reservation is not None:
+            usage = completion_json.get("usage") or {}
+            self.rate_limiter.settle(reservation, usage.get("total_tokens") or reservation[1])
+
+    def stream(self, request_json, writer=None, stop_at=None):
+        """Streaming counterpart of `complete`; a failed stream is retried from the start.
+
+        With `stop_at` ("code" or "content") the stream is closed as soon as
+        the first block of that kind is complete; such answers are cached
+        under their own key, so a call without `stop_at` never replays them.
+        """
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(request_json, stop_at)
+            completion_json = self.cache.get(key)
+            if completion_json is not None:
+                completion_json["from_cache"] = True
+                if writer is not None:
+                    writer.start()
+                    writer.write(completion_json["choices"][0]["message"]["content"] or "")
+                    writer.close()
+                return completion_json
+
+        request_json = dict(request_json, stream=True, stream_options={"include_usage": True})
+        request_json.setdefault("timeout", self.timeout)
+        with self.request_slot():
+            reservation = self.reserve(request_json)
+            completion_json = self.call_with_retries(self.read_stream, request_json, writer, stop_at)
+            completion_json["retries"] = self.local.retries
+            self.settle(reservation, completion_json)
+        if self.cache is not None:
+            self.cache.put(key, without_timing(completion_json))
+        return completion_json
+
+    def chat(self, msg, gpt_version, **kwargs):
+        """Send one chat request and return the completion as a JSON dict."""
+        return self.complete(build_request(msg, gpt_version, **kwargs))
+
+    def chat_stream(self, msg, gpt_version, writer=None, stop_at=None, **kwargs):
+        """Like `chat`, but streams the answer into `writer` (a `StreamWriter`) while it is generated."""
+        return self.stream(build_request(msg, gpt_version, **kwargs), writer, stop_at)
+
+    def close(self):
+        self.http_client.close()
+
+
+class AsyncLLMClient:
+    """asyncio counterpart of `LLMClient` for callers that fan out many requests."""
+
+    def __init__(self, api_key=None, base_url=None, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, max_connections=DEFAULT_MAX_CONNECTIONS, cache=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache  # llm_cache.ResponseCache or None
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=DEFAULT_CONNECT_TIMEOUT),
+        )
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                  timeout=timeout, http_client=self.http_client)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        kwargs.setdefault("timeout", float(os.environ.get("OPENAI_TIMEOUT", DEFAULT_TIMEOUT)))
+        kwargs.setdefault("max_retries", int(os.environ.get("OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES)))
+        kwargs.setdefault("cache", cache_from_env())
+        return cls(api_key=os.environ["OPENAI_API_KEY"], base_url=get_api_base(), **kwargs)
+
+    async def create(self, **request_json):
+        request_json.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                return await self.client.chat.completions.create(**request_json)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = get_retry_delay(e, attempt)
+                log_retry(e, attempt, self.max_retries, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def complete(self, request_json):
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(request_json)
+            completion_json = self.cache.get(key)
+            if completion_json is not None:
+                completion_json["from_cache"] = True
+                return completion_json
+
+        completion_json = convert_completion_to_json(await self.create(**request_json))
+        if self.cache is not None:
+            self.cache.put(key, completion_json)
+        return completion_json
+
+    async def chat(self, msg, gpt_version, **kwargs):
+        return await self.complete(build_request(msg, gpt_version, **kwargs))
+
+    async def close(self):
+        await self.http_client.aclose()
@@ -0,0 +1,46 @@
+import json
+import os
+import threading
+
+from llm_cache import make_cache_key
+from llm_client import build_request
+
+
+def get_input_hash(msg, gpt_version, **kwargs):
+    """Hash of everything that determines a unit's LLM answer: the model, the full prompt and request options."""
+    return make_cache_key(build_request(msg, gpt_version, **kwargs))
+
+
+class StageManifest:
+    """Completed units of a stage, each with the hash of the inputs that produced it.
+
+    Stored as `<output_dir>/<stage>_manifest.json` and rewritten after every
+    unit, so a crashed run leaves behind exactly the units that finished.
+    A unit counts as done only while its input hash is unchanged and all of
+    its output files still exist.
+    """
+
+    def __init__(self, output_dir, stage):
+        self.path = os.path.join(output_dir, f"{stage}_manifest.json")
+        self.lock = threading.Lock()
+        self.units = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.units = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print(f"[WARNING] Ignoring unreadable manifest: {self.path}")
+
+    def is_done(self, unit, input_hash):
+        entry = self.units.get(unit)
+        if not entry or entry.get("input_hash") != input_hash:
+            return False
+        return all(os.path.exists(path) for path in entry.get("outputs", []))
+
+    def mark_done(self, unit, input_hash, outputs):
+        with self.lock:
+            self.units[unit] = {"input_hash": input_hash, "outputs": list(outputs)}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.units, f, indent=2)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,89 @@
+import html
+import re
+
+PAPER_SERIALIZATIONS = ["markdown", "json"]
+
+TABLE_ROW_PATTERN = re.compile(r'<tr[^>]*>(.*?)</tr>', re.IGNORECASE | re.DOTALL)
+TABLE_CELL_PATTERN = re.compile(r'<t[dh][^>]*/>|<t[dh][^>]*>(.*?)</t[dh]>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+def paper_to_markdown(paper_content):
+    """Cleaned S2ORC paper (see 0_pdf_process.py) as section-headed markdown.
+
+    Consecutive paragraphs of a section share one heading, whose level
+    follows the depth of its `sec_num` ("3.2.1" -> ####). Figure and table
+    captions are listed at the end, tables with their cells as markdown rows.
+    """
+    return "\n\n".join(paper_to_sections(paper_content)) + "\n"
+
+
+def paper_to_sections(paper_content):
+    """The markdown of `paper_to_markdown` split into sections: title and abstract first, then
+    one entry per section and per figure or table."""
+    pdf_parse = paper_content.get("pdf_parse", paper_content)
+
+    front = []
+    title = (paper_content.get("title") or "").strip()
+    if title:
+        front.append(f"# {title}")
+    abstract = pdf_parse.get("abstract") or []
+    if abstract:
+        front.append("## Abstract\n" + "\n\n".join(p["text"].strip() for p in abstract if p.get("text")))
+    elif paper_content.get("abstract"):
+        front.append("## Abstract\n" + paper_content["abstract"].strip())
+
+    sections = ["\n\n".join(front)] if front else []
+    sections.extend(render_sections(pdf_parse.get("body_text") or []))
+    sections.extend(render_sections(pdf_parse.get("back_matter") or []))
+
+    ref_entries = [render_ref_entry(entry) for entry in (pdf_parse.get("ref_entries") or {}).values()]
+    ref_entries = [entry for entry in ref_entries if entry]
+    if ref_entries:
+        ref_entries[0] = "## Figures and Tables\n" + ref_entries[0]
+        sections.extend(ref_entries)
+    return sections
+
+
+def render_sections(paragraphs):
+    sections = []  # [heading, [paragraph texts]]
+    for paragraph in paragraphs:
+        text = (paragraph.get("text") or "").strip()
+        if not text:
+            continue
+        heading = get_heading(paragraph.get("section"), paragraph.get("sec_num"))
+        if not sections or sections[-1][0] != heading:
+            sections.append([heading, []])
+        sections[-1][1].append(text)
+    return ["\n\n".join(texts) if heading is None else heading + "\n" + "\n\n".join(texts)
+            for heading, texts in sections]
+
+
+def get_heading(section, sec_num):
+    section = (section or "").strip()
+    sec_num = (sec_num or "").strip().rstrip(".")
+    if not section and not sec_num:
+        return None
+    level = 2 + min(sec_num.count("."), 2) if sec_num else 2
+    return "#" * level + " " + " ".join(s for s in (sec_num, section) if s)
+
+
+def render_ref_entry(entry):
+    caption = (entry.get("text") or "").strip()
+    if entry.get("type_str") == "table" and entry.get("content"):
+        rows = html_table_to_rows(entry["content"])
+        if rows:
+            return caption + "\n" + "\n".join(rows)
+    return caption
+
+
+def html_table_to_rows(table_html):
+    rows = []
+    for row_html in TABLE_ROW_PATTERN.findall(table_html):
+        cells = []
+        for match in TABLE_CELL_PATTERN.finditer(row_html):
+            cell = html.unescape(TAG_PATTERN.sub("", match.group(1) or ""))
+            cells.append(" ".join(cell.split()).replace("|", "\\|"))
+        if cells:
+            rows.append("| " + " | ".join(cells) + " |")
+    return rows
@@ -0,0 +1,93 @@
+import math
+import re
+from collections import Counter
+
+from token_counter import count_many_texts
+
+DEFAULT_PAPER_TOKEN_CAP = 6000  # paper tokens per prompt when only the top-k sections are sent
+
+LATEX_SECTION_PATTERN = re.compile(r'\\section\*?\{')
+CAMEL_CASE_PATTERN = re.compile(r'([a-z0-9])([A-Z])')
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = set("""
+a about above after all also an and any are as at be been before being between both but by can could did
+do does each for from further had has have how if in into is it its itself may more most must no not of on
+once only or other our out over same should so some such than that the their them then there these they
+this those through to under until up use used using very was we were what when where which while who will
+with would you your py file class function method implement implementation
+""".split())
+
+
+def tokenize(text):
+    """Lowercased words without stopwords; snake_case and CamelCase names are split into their parts."""
+    words = WORD_PATTERN.findall(CAMEL_CASE_PATTERN.sub(r'\1 \2', text).lower())
+    return [stem(word) for word in words if len(word) > 1 and word not in STOPWORDS]
+
+
+def stem(word):
+    # plural forms only; enough to match "layers" with "layer" and "batches" with "batch"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def split_latex_sections(paper_text):
+    """LaTeX source split at every \\section; the preamble, title and abstract stay in the first part."""
+    starts = [m.start() for m in LATEX_SECTION_PATTERN.finditer(paper_text)]
+    bounds = [0] + starts + [len(paper_text)]
+    return [paper_text[begin:end].strip() for begin, end in zip(bounds, bounds[1:]) if paper_text[begin:end].strip()]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(document)) for document in documents]
+        self.doc_lens = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_doc_len = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0.0
+        doc_freqs = Counter(term for tf in self.term_freqs for term in tf)
+        num_docs = len(documents)
+        self.idf = {term: math.log(1 + (num_docs - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def score(self, query):
+        query_terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for tf, doc_len in zip(self.term_freqs, self.doc_lens):
+            norm = self.k1 * (1 - self.b + self.b * doc_len / self.avg_doc_len) if self.avg_doc_len else self.k1
+            scores.append(sum(self.idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+                              for term in query_terms if term in tf))
+        return scores
+
+
+class PaperIndex:
+    """Sections of one paper, ranked per query; the first section (title and abstract) is always kept."""
+
+    def __init__(self, sections, gpt_version):
+        self.sections = sections
+        self.num_tokens = count_many_texts(sections, gpt_version)
+        self.bm25 = BM25Index(sections[1:])
+
+    def select(self, query, top_k, max_tokens):
+        """Indices, in paper order, of the pinned section plus up to `top_k` matching ones within `max_tokens`."""
+        if not self.sections:
+            return []
+        selected = [0]
+        total = self.num_tokens[0]
+        scores = self.bm25.score(query)
+        ranked = sorted(range(len(scores)), key=lambda idx: -scores[idx])
+        for idx in ranked:
+            if len(selected) > top_k or scores[idx] <= 0:
+                break
+            if total + self.num_tokens[idx + 1] > max_tokens:
+                continue
+            selected.append(idx + 1)
+            total += self.num_tokens[idx + 1]
+        return sorted(selected)
+
+    def render(self, indices):
+        return "\n\n".join(self.sections[idx] for idx in indices)
@@ -0,0 +1,360 @@
+import contextvars
+import importlib.util
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from artifact_store import get_blob_store, load_trajectories
+from llm_batch import BatchRunner
+from llm_client import LLMClient, StreamWriter
+from paper_markdown import paper_to_markdown, paper_to_sections
+from paper_retrieval import DEFAULT_PAPER_TOKEN_CAP, PaperIndex, split_latex_sections
+from prompt_layout import PromptCacheStats
+from token_budget import PAPER_TRIM_ORDER, TokenBudget, trim_paper
+from token_counter import count_text_tokens
+from utils import extract_planning, content_to_json, print_log_cost, save_accumulated_cost
+
+CODES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# stage name -> script under codes/ exposing `run(ctx)`
+STAGE_SCRIPTS = {
+    "preprocess": "0_pdf_process.py",
+    "planning": "1_planning.py",
+    "extract_config": "1.1_extract_config.py",
+    "analyzing": "2_analyzing.py",
+    "coding": "3_coding.py",
+}
+
+DEFAULT_STAGES = ["preprocess", "planning", "extract_config", "analyzing", "coding"]
+
+_stage_modules = {}
+
+
+class PipelineContext:
+    """In-memory state shared by the stages of a single paper run.
+
+    Every stage reads its inputs through the getters below, so a stage that
+    runs right after the one producing them never goes back to disk, while a
+    stage launched on its own from the command line falls back to the
+    artifacts in `output_dir`.
+    """
+
+    # calls are appended to telemetry.jsonl and the cost ledger; estimates (dry_run.py) are not
+    records_spend = True
+
+    def __init__(self, paper_name, gpt_version, output_dir, output_repo_dir="",
+                 paper_format="JSON", pdf_json_path=None, pdf_latex_path=None, max_workers=1,
+                 coding_schedule="sequential", stream=False, resume=False,
+                 batch=False, max_prompt_tokens=None, paper_serialization="markdown",
+                 paper_top_k=None, paper_token_cap=None, code_context="full", artifact_store="json",
+                 planning_output="text"):
+        self.paper_name = paper_name
+        self.gpt_version = gpt_version
+        self.output_dir = output_dir
+        self.output_repo_dir = output_repo_dir
+        self.paper_format = paper_format
+        self.pdf_json_path = pdf_json_path
+        self.pdf_latex_path = pdf_latex_path
+        self.max_workers = max_workers  # concurrent LLM requests within a stage
+        self.coding_schedule = coding_schedule  # "sequential" or "dag"
+        self.stream = stream  # stream responses into their artifacts as they are generated
+        self.resume = resume  # skip units whose manifest entry matches their inputs
+        self.batch = batch  # send analysis/coding requests through the Batch API
+        self.max_prompt_tokens = max_prompt_tokens  # None: derived from the model (token_budget.py)
+        self.paper_serialization = paper_serialization  # JSON papers in prompts: "markdown" or "json" (dict repr)
+        self.paper_top_k = paper_top_k  # analysis/coding prompts carry only the k most relevant sections; None: whole paper
+        self.paper_token_cap = paper_token_cap or DEFAULT_PAPER_TOKEN_CAP
+        self.code_context = code_context  # earlier code files in coding prompts: "full" source or "interface" summaries
+        self.artifact_store = artifact_store  # trajectory files: plain "json", or bodies deduplicated into "blobs"/"blobs-zstd"
+        self.planning_output = planning_output  # design/task-list turns: free "text" or schema-constrained "structured" JSON
+
+        self.client = None
+        self.paper_content = None
+        self.paper_text = None        # paper as embedded in prompts
+        self.paper_index = None       # sections of the paper for per-file retrieval
+        self.paper_retrieval_stats = {}  # stage tag -> [requests, sections sent, paper tokens sent]
+        self.trajectories = None      # planning trajectories
+        self.context_lst = None       # 0: overview, 1: detailed, 2: PRD
+        self.task_list = None
+        self.config_yaml = None
+        self.analysis_dict = {}       # todo_file_name -> logic analysis
+        self.done_file_dict = {}      # todo_file_name -> generated code
+        self.code_summary_dict = {}   # todo_file_name -> interface summary of the generated code
+        self.total_accumulated_cost = 0.0
+        self.shared_context = None    # prompt prefix shared by analysis/coding requests
+        self.prompt_cache_stats = PromptCacheStats()
+        self.token_budget = None
+        self.blob_store = None
+        self.usage_totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(
+            paper_name=args.paper_name,
+            gpt_version=getattr(args, "gpt_version", None),
+            output_dir=args.output_dir,
+            output_repo_dir=getattr(args, "output_repo_dir", ""),
+            paper_format=getattr(args, "paper_format", "JSON"),
+            pdf_json_path=getattr(args, "pdf_json_path", None),
+            pdf_latex_path=getattr(args, "pdf_latex_path", None),
+            max_workers=getattr(args, "max_workers", 1),
+            coding_schedule=getattr(args, "coding_schedule", "sequential"),
+            stream=getattr(args, "stream", False),
+            resume=getattr(args, "resume", False),
+            batch=getattr(args, "batch", False),
+            max_prompt_tokens=getattr(args, "max_prompt_tokens", None),
+            paper_serialization=getattr(args, "paper_serialization", "markdown"),
+            paper_top_k=getattr(args, "paper_top_k", None),
+            paper_token_cap=getattr(args, "paper_token_cap", None),
+            code_context=getattr(args, "code_context", "full"),
+            artifact_store=getattr(args, "artifact_store", "json"),
+            planning_output=getattr(args, "planning_output", "text"),
+        )
+
+    def get_client(self):
+        if self.client is None:
+            self.client = LLMClient.from_env()
+        return self.client
+
+    def chat(self, msg, artifact_path=None, stop_at=None, **kwargs):
+        """One LLM call of a stage; when streaming, the answer is written to `artifact_path` as it arrives.
+
+        Streamed answers end as soon as their first `stop_at` block ("code"
+        fence or "content" block) is complete; whatever the model would
+        write after it is never used.
+        """
+        client = self.get_client()
+        if self.stream:
+            writer = StreamWriter(artifact_path) if artifact_path else None
+            return client.chat_stream(msg, self.gpt_version, writer, stop_at=stop_at, **kwargs)
+        return client.chat(msg, self.gpt_version, **kwargs)
+
+    def fit_prompt(self, current_stage, build_msg, trim_order):
+        """Build a prompt that fits the model's token budget; `build_msg(dropped)` leaves out the named sections."""
+        if self.token_budget is None:
+            self.token_budget = TokenBudget(self.gpt_version, self.max_prompt_tokens)
+        msg, dropped, original_tokens, num_tokens = self.token_budget.fit(build_msg, trim_order)
+        max_prompt_tokens = self.token_budget.max_prompt_tokens
+        if original_tokens is not None and original_tokens > max_prompt_tokens:
+            report = (f"✂️ {current_stage} Prompt has {original_tokens} tokens (budget: {max_prompt_tokens}); "
+                      f"dropped: {', '.join(dropped) or 'nothing'} -> {num_tokens} tokens")
+            if num_tokens > max_prompt_tokens:
+                report += " [WARNING] still over budget"
+            print(report)
+            with open(f"{self.output_dir}/cost_info.log", "a", encoding="utf-8") as f:
+                f.write(report + "\n")
+        return msg
+
+    def chat_all(self, requests, batch_name, warm_up=True, stop_at=None):
+        """Send independent requests and yield (key, completion_json, error) as their answers arrive.
+
+        `requests` is a list of (key, msg, artifact_path). They go through a
+        pool of `max_workers` threads, or into a single Batch API job named
+        `batch_name` when `batch` is set.
+        """
+        if not requests:
+            return
+        if self.batch:
+            runner = BatchRunner(self.get_client(), self.output_dir, self.gpt_version)
+            yield from runner.run(batch_name, [(key, msg) for key, msg, _ in requests])
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            future_to_key = {}
+            for idx, (key, msg, artifact_path) in enumerate(requests):
+                # workers run in a copy of the caller's context, so per-paper log routing (run_batch.py) follows them
+                future = executor.submit(contextvars.copy_context().run, self.chat, msg, artifact_path,
+                                         stop_at=stop_at)
+                future_to_key[future] = key
+                if warm_up and idx == 0 and self.max_workers > 1 and len(requests) > 1:
+                    # let the first request populate the provider's prompt cache before fanning out
+                    wait([future])
+
+            for future in as_completed(future_to_key):
+                try:
+                    yield future_to_key[future], future.result(), None
+                except Exception as e:
+                    yield future_to_key[future], None, e
+
+    def get_paper_content(self):
+        if self.paper_content is None:
+            if self.paper_format == "JSON":
+                with open(f'{self.pdf_json_path}') as f:
+                    self.paper_content = json.load(f)
+            elif self.paper_format == "LaTeX":
+                with open(f'{self.pdf_latex_path}') as f:
+                    self.paper_content = f.read()
+            else:
+                print(f"[ERROR] Invalid paper format. Please select either 'JSON' or 'LaTeX.")
+                sys.exit(0)
+        return self.paper_content
+
+    def get_paper_text(self, dropped=None):
+        """The paper as it is embedded in prompts; rendered once, or per call with parts of it `dropped`."""
+        if dropped and set(dropped) & set(PAPER_TRIM_ORDER):
+            return self.render_paper(trim_paper(self.get_paper_content(), dropped))
+        if self.paper_text is None:
+            self.paper_text = self.render_paper(self.get_paper_content())
+            if self.uses_markdown():
+                self.report_paper_serialization()
+        return self.paper_text
+
+    def get_prompt_paper_format(self):
+        return "Markdown" if self.uses_markdown() else self.paper_format
+
+    def uses_markdown(self):
+        return self.paper_format == "JSON" and self.paper_serialization == "markdown"
+
+    def render_paper(self, paper_content):
+        if self.uses_markdown():
+            return paper_to_markdown(paper_content)
+        return f"{paper_content}"
+
+    def uses_retrieval(self):
+        # JSON papers are split along their markdown sections
+        return bool(self.paper_top_k) and (self.paper_format == "LaTeX" or self.uses_markdown())
+
+    def get_paper_index(self, dropped=None):
+        """BM25 index over the paper's sections, built once per paper (trimmed copies are indexed per call)."""
+        if dropped and set(dropped) & set(PAPER_TRIM_ORDER):
+            return PaperIndex(self.split_paper(trim_paper(self.get_paper_content(), dropped)), self.gpt_version)
+        if self.paper_index is None:
+            self.paper_index = PaperIndex(self.split_paper(self.get_paper_content()), self.gpt_version)
+        return self.paper_index
+
+    def split_paper(self, paper_content):
+        if self.paper_format == "LaTeX":
+            return split_latex_sections(paper_content)
+        return paper_to_sections(paper_content)
+
+    def report_paper_retrieval(self, stage_tag):
+        if stage_tag not in self.paper_retrieval_stats:
+            return
+        requests, num_sections, num_tokens = self.paper_retrieval_stats[stage_tag]
+        paper_index = self.get_paper_index()
+        report = (f"📑 {stage_tag} Paper retrieval: {num_sections / requests:.1f} of {len(paper_index.sections)} sections, "
+                  f"{num_tokens / requests:.0f} of {sum(paper_index.num_tokens)} paper tokens per request on average")
+        print(report)
+        with open(f"{self.output_dir}/cost_info.log", "a", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+    def report_paper_serialization(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(f"{self.output_dir}/paper.md", "w", encoding="utf-8") as f:
+            f.write(self.paper_text)
+        repr_tokens = count_text_tokens(f"{self.get_paper_content()}", self.gpt_version)
+        markdown_tokens = count_text_tokens(self.paper_text, self.gpt_version)
+        saved = repr_tokens - markdown_tokens
+        report = (f"📝 Paper serialized as markdown: {markdown_tokens} tokens instead of {repr_tokens} "
+                  f"({saved} saved per prompt, {saved / repr_tokens if repr_tokens else 0.0:.1%})")
+        print(report)
+        with open(f"{self.output_dir}/cost_info.log", "a", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+    def get_context_lst(self):
+        if self.context_lst is None:
+            self.context_lst = extract_planning(f'{self.output_dir}/planning_trajectories.json')
+        return self.context_lst
+
+    def get_trajectories(self):
+        if self.trajectories is None:
+            self.trajectories = load_trajectories(f'{self.output_dir}/planning_trajectories.json')
+        return self.trajectories
+
+    def get_blob_store(self):
+        if self.blob_store is None:
+            self.blob_store = get_blob_store(self.output_dir, self.artifact_store)
+        return self.blob_store
+
+    def get_task_list(self):
+        if self.task_list is None:
+            if os.path.exists(f'{self.output_dir}/task_list.json'):
+                with open(f'{self.output_dir}/task_list.json') as f:
+                    self.task_list = json.load(f)
+            else:
+                self.task_list = content_to_json(self.get_context_lst()[2])
+        return self.task_list
+
+    def get_config_yaml(self):
+        if self.config_yaml is None:
+            with open(f'{self.output_dir}/planning_config.yaml') as f:
+                self.config_yaml = f.read()
+        return self.config_yaml
+
+    def log_cost(self, completion_json, current_stage):
+        self.prompt_cache_stats.record(current_stage, completion_json)
+        self.record_usage(completion_json)
+        previous_cost = self.total_accumulated_cost
+        self.total_accumulated_cost = print_log_cost(completion_json, self.gpt_version, current_stage,
+                                                     self.output_dir, self.total_accumulated_cost, self.paper_name,
+                                                     record=self.records_spend)
+        self.usage_totals["cost"] += self.total_accumulated_cost - previous_cost
+        # kept current after every call so that an interrupted stage does not lose what it already spent
+        save_accumulated_cost(f"{self.output_dir}/accumulated_cost.json", self.total_accumulated_cost)
+        return self.total_accumulated_cost
+
+    def record_usage(self, completion_json):
+        # tokens actually billed in this process (cached responses cost nothing)
+        if completion_json.get("from_cache"):
+            return
+        usage = completion_json.get("usage") or {}
+        self.usage_totals["requests"] += 1
+        self.usage_totals["prompt_tokens"] += usage.get("prompt_tokens", 0) or 0
+        self.usage_totals["cached_tokens"] += (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        self.usage_totals["completion_tokens"] += usage.get("completion_tokens", 0) or 0
+
+    def report_prompt_cache(self, stage_tag):
+        report = self.prompt_cache_stats.format_report(stage_tag)
+        print(report)
+        with open(f"{self.output_dir}/cost_info.log", "a", encoding="utf-8") as f:
+            f.write(report + "\n")
+        return report
+
+
+def load_stage(stage):
+    """Import a stage script (whose file name is not a valid module name) once per process."""
+    if stage not in _stage_modules:
+        script_path = os.path.join(CODES_DIR, STAGE_SCRIPTS[stage])
+        module_name = "paper2code_" + stage
+        spec = importlib.util.spec_from_file_location(module_name, script_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        _stage_modules[stage] = module
+    return _stage_modules[stage]
+
+
+def copy_config(ctx):
+    planning_config = os.path.join(ctx.output_dir, "planning_config.yaml")
+    output_config = os.path.join(ctx.output_repo_dir, "config.yaml")
+    if os.path.exists(planning_config):
+        shutil.copy2(planning_config, output_config)
+        print(f"复制配置文件: {planning_config} -> {output_config}")
+    else:
+        print(f"警告: 配置文件不存在 {planning_config}")
+
+
+def run_pipeline(ctx, input_json_path=None, stages=None):
+    """Run the selected stages in order over a single shared context."""
+    stages = stages or DEFAULT_STAGES
+
+    os.makedirs(ctx.output_dir, exist_ok=True)
+    if ctx.output_repo_dir:
+        os.makedirs(ctx.output_repo_dir, exist_ok=True)
+
+    for stage in stages:
+        print(f"\n------- {stage} -------")
+        module = load_stage(stage)
+        if stage == "preprocess":
+            if input_json_path is None:
+                continue
+            module.run(ctx, input_json_path)
+        else:
+            module.run(ctx)
+
+        if stage == "extract_config" and ctx.output_repo_dir:
+            copy_config(ctx)
+
+    return ctx
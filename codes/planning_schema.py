@@ -0,0 +1,80 @@
+import json
+
+PLANNING_OUTPUTS = ["text", "structured"]
+
+# "required" lists what later stages cannot do without; the other fields are only type-checked
+ARCH_DESIGN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Implementation approach": {"type": "string"},
+        "File list": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "Data structures and interfaces": {"type": "string"},
+        "Program call flow": {"type": "string"},
+        "Anything UNCLEAR": {"type": "string"},
+    },
+    "required": ["File list"],
+}
+
+TASK_LIST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Required packages": {"type": "array", "items": {"type": "string"}},
+        "Required Other language third-party packages": {"type": "array", "items": {"type": "string"}},
+        # [file name, description] pairs
+        "Logic Analysis": {"type": "array", "minItems": 1,
+                           "items": {"type": "array", "items": {"type": "string"}, "minItems": 2, "maxItems": 2}},
+        "Task list": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "Full API spec": {"type": "string"},
+        "Shared Knowledge": {"type": "string"},
+        "Anything UNCLEAR": {"type": "string"},
+    },
+    "required": ["Logic Analysis", "Task list"],
+}
+
+# planning turn -> (schema name, schema); the other turns answer in free text
+PLANNING_SCHEMAS = {
+    1: ("architecture_design", ARCH_DESIGN_SCHEMA),
+    2: ("logic_design", TASK_LIST_SCHEMA),
+}
+
+JSON_TYPES = {"object": dict, "array": list, "string": str}
+
+
+def get_response_format(name, schema):
+    """`response_format` that constrains the answer to `schema` (strict mode: every field present, no extras)."""
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": to_strict_schema(schema)}}
+
+
+def to_strict_schema(schema):
+    strict = {k: v for k, v in schema.items() if k not in ("minItems", "maxItems")}
+    if schema.get("type") == "object":
+        strict["properties"] = {k: to_strict_schema(v) for k, v in schema["properties"].items()}
+        strict["required"] = list(schema["properties"])
+        strict["additionalProperties"] = False
+    elif schema.get("type") == "array":
+        strict["items"] = to_strict_schema(schema["items"])
+    return strict
+
+
+def validate(value, schema, path="$"):
+    """Problems of `value` against the subset of JSON Schema used above; [] when it conforms."""
+    expected = JSON_TYPES[schema["type"]]
+    if not isinstance(value, expected):
+        return [f"{path}: expected {schema['type']}, got {type(value).__name__}"]
+
+    errors = []
+    if schema["type"] == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required field \"{key}\"")
+        for key, sub_schema in schema["properties"].items():
+            if key in value:
+                errors += validate(value[key], sub_schema, f"{path}[{json.dumps(key)}]")
+    elif schema["type"] == "array":
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items, got {len(value)}")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{path}: expected at most {schema['maxItems']} items, got {len(value)}")
+        for idx, item in enumerate(value):
+            errors += validate(item, schema["items"], f"{path}[{idx}]")
+    return errors
@@ -0,0 +1,162 @@
+import json
+import os
+import sys
+import threading
+
+# USD per 1M tokens; cached_input None: the model has no cache discount, cached tokens cost the input price
+BUILTIN_PRICES = {
+    # gpt-4.1
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4.1-2025-04-14": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+
+    # gpt-4.1-mini
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1-mini-2025-04-14": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+
+    # gpt-4.1-nano
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-4.1-nano-2025-04-14": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+
+    # gpt-4.5-preview
+    "gpt-4.5-preview": {"input": 75.00, "cached_input": 37.50, "output": 150.00},
+    "gpt-4.5-preview-2025-02-27": {"input": 75.00, "cached_input": 37.50, "output": 150.00},
+
+    # gpt-4o
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-2024-08-06": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-2024-11-20": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-2024-05-13": {"input": 5.00, "cached_input": None, "output": 15.00},
+
+    # gpt-4o-audio-preview
+    "gpt-4o-audio-preview": {"input": 2.50, "cached_input": None, "output": 10.00},
+    "gpt-4o-audio-preview-2024-12-17": {"input": 2.50, "cached_input": None, "output": 10.00},
+    "gpt-4o-audio-preview-2024-10-01": {"input": 2.50, "cached_input": None, "output": 10.00},
+
+    # gpt-4o-realtime-preview
+    "gpt-4o-realtime-preview": {"input": 5.00, "cached_input": 2.50, "output": 20.00},
+    "gpt-4o-realtime-preview-2024-12-17": {"input": 5.00, "cached_input": 2.50, "output": 20.00},
+    "gpt-4o-realtime-preview-2024-10-01": {"input": 5.00, "cached_input": 2.50, "output": 20.00},
+
+    # gpt-4o-mini
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o-mini-2024-07-18": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+
+    # gpt-4o-mini-audio-preview
+    "gpt-4o-mini-audio-preview": {"input": 0.15, "cached_input": None, "output": 0.60},
+    "gpt-4o-mini-audio-preview-2024-12-17": {"input": 0.15, "cached_input": None, "output": 0.60},
+
+    # gpt-4o-mini-realtime-preview
+    "gpt-4o-mini-realtime-preview": {"input": 0.60, "cached_input": 0.30, "output": 2.40},
+    "gpt-4o-mini-realtime-preview-2024-12-17": {"input": 0.60, "cached_input": 0.30, "output": 2.40},
+
+    # o1
+    "o1": {"input": 15.00, "cached_input": 7.50, "output": 60.00},
+    "o1-2024-12-17": {"input": 15.00, "cached_input": 7.50, "output": 60.00},
+    "o1-preview-2024-09-12": {"input": 15.00, "cached_input": 7.50, "output": 60.00},
+
+    # o1-pro
+    "o1-pro": {"input": 150.00, "cached_input": None, "output": 600.00},
+    "o1-pro-2025-03-19": {"input": 150.00, "cached_input": None, "output": 600.00},
+
+    # o3
+    "o3": {"input": 10.00, "cached_input": 2.50, "output": 40.00},
+    "o3-2025-04-16": {"input": 10.00, "cached_input": 2.50, "output": 40.00},
+
+    # o4-mini
+    "o4-mini": {"input": 1.10, "cached_input": 0.275, "output": 4.40},
+    "o4-mini-2025-04-16": {"input": 1.10, "cached_input": 0.275, "output": 4.40},
+
+    # o3-mini
+    "o3-mini": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
+    "o3-mini-2025-01-31": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
+
+    # o1-mini
+    "o1-mini": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
+    "o1-mini-2024-09-12": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
+
+    # gpt-4o-mini-search-preview
+    "gpt-4o-mini-search-preview": {"input": 0.15, "cached_input": None, "output": 0.60},
+    "gpt-4o-mini-search-preview-2025-03-11": {"input": 0.15, "cached_input": None, "output": 0.60},
+
+    # gpt-4o-search-preview
+    "gpt-4o-search-preview": {"input": 2.50, "cached_input": None, "output": 10.00},
+    "gpt-4o-search-preview-2025-03-11": {"input": 2.50, "cached_input": None, "output": 10.00},
+
+    # computer-use-preview
+    "computer-use-preview": {"input": 3.00, "cached_input": None, "output": 12.00},
+    "computer-use-preview-2025-03-11": {"input": 3.00, "cached_input": None, "output": 12.00},
+
+    # gpt-image-1
+    "gpt-image-1": {"input": 5.00, "cached_input": None, "output": None},
+}
+PRICE_KEYS = ["input", "cached_input", "output"]
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+class PricingRegistry:
+    """Model prices with exact, then longest-prefix lookup.
+
+    "gpt-4o-mini-2025-01-01" is priced as "gpt-4o-mini", not "gpt-4o", and
+    a provider path such as "openai/gpt-4.1" is also tried without the
+    provider. `layers` are searched in order, so a user entry "gpt-4o"
+    overrides every built-in gpt-4o snapshot. Lookups are memoized, so the
+    prefix scan runs once per model.
+    """
+
+    def __init__(self, *layers):
+        self.layers = [(dict(prices), sorted(prices, key=len, reverse=True)) for prices in layers]
+        self.resolved = {}
+
+    def lookup(self, model_name):
+        """Price entry of `model_name`; None when no entry matches."""
+        if model_name not in self.resolved:
+            self.resolved[model_name] = self.find(model_name)
+        return self.resolved[model_name]
+
+    def find(self, model_name):
+        for prices, prefixes in self.layers:
+            for name in (model_name, model_name.rsplit("/", 1)[-1]):
+                entry = self.match(prices, prefixes, name)
+                if entry is not None:
+                    return entry
+        return None
+
+    @staticmethod
+    def match(prices, prefixes, model_name):
+        if model_name in prices:
+            return prices[model_name]
+        return next((prices[prefix] for prefix in prefixes if model_name.startswith(prefix)), None)
+
+
+def load_pricing_file(path):
+    """Price entries of a JSON file {"model": {"input": ..., "cached_input": ..., "output": ...}} (USD per 1M tokens)."""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, dict):
+        raise ValueError(f"{path}: expected an object of model names to prices")
+    prices = {}
+    for model_name, entry in entries.items():
+        if not isinstance(entry, dict) or not isinstance(entry.get("input"), (int, float)):
+            raise ValueError(f"{path}: {model_name!r} needs a numeric 'input' price")
+        for key in PRICE_KEYS:
+            if entry.get(key) is not None and not isinstance(entry[key], (int, float)):
+                raise ValueError(f"{path}: {model_name!r} has a non-numeric {key!r} price")
+        prices[model_name] = {key: entry.get(key) for key in PRICE_KEYS}
+    return prices
+
+
+def get_registry():
+    """Registry of the built-in prices, overridden by the PAPER2CODE_PRICING file; loaded once per file."""
+    path = os.environ.get("PAPER2CODE_PRICING") or None
+    with _registries_lock:
+        if path not in _registries:
+            layers = [BUILTIN_PRICES]
+            if path:
+                try:
+                    layers.insert(0, load_pricing_file(path))
+                except (OSError, ValueError) as e:
+                    print(f"[WARNING] Pricing file not loaded, using built-in prices: {e}", file=sys.stderr)
+            _registries[path] = PricingRegistry(*layers)
+        return _registries[path]
@@ -0,0 +1,101 @@
+import copy
+import threading
+
+from prompt_templates import render_prompt
+from token_budget import PAPER_TRIM_ORDER
+
+
+def get_shared_context(ctx, dropped=None):
+    """Paper, plan, design, task and config block that opens every analysis and coding request.
+
+    It is rendered once per paper and sent as its own message right after the
+    stage's system prompt, so all per-file requests of a stage start with the
+    same bytes and the provider can serve that prefix from its prompt cache.
+    Everything file-specific goes into the message after it. Only prompts
+    that outgrow the token budget get a variant with parts of the paper
+    `dropped` (see token_budget.trim_paper). With per-file section retrieval
+    the paper is left out here and sent with each file (see get_relevant_paper).
+    """
+    if ctx.uses_retrieval():
+        if ctx.shared_context is None:
+            ctx.shared_context = render_shared_context(ctx, None)
+        return ctx.shared_context
+    if dropped and set(dropped) & set(PAPER_TRIM_ORDER):
+        return render_shared_context(ctx, ctx.get_paper_text(dropped))
+    if ctx.shared_context is None:
+        ctx.shared_context = render_shared_context(ctx, ctx.get_paper_text())
+    return ctx.shared_context
+
+
+def render_shared_context(ctx, paper_text):
+    context_lst = ctx.get_context_lst()
+    paper_block = "" if paper_text is None else render_prompt("paper", Paper=paper_text)
+    return render_prompt("shared_context", PaperBlock=paper_block, Overview=context_lst[0], Design=context_lst[1],
+                         Task=context_lst[2], ConfigYaml=ctx.get_config_yaml())
+
+
+def get_relevant_paper(ctx, current_stage, query, dropped=None):
+    """Paper block of a per-file message: the sections that best match `query`, empty without retrieval."""
+    if not ctx.uses_retrieval():
+        return ""
+    paper_index = ctx.get_paper_index(dropped)
+    selected = paper_index.select(query, ctx.paper_top_k, ctx.paper_token_cap)
+    if not dropped:
+        # every prompt is built untrimmed exactly once, so each request is counted once
+        stats = ctx.paper_retrieval_stats.setdefault(get_stage_tag(current_stage), [0, 0, 0])
+        stats[0] += 1
+        stats[1] += len(selected)
+        stats[2] += sum(paper_index.num_tokens[idx] for idx in selected)
+    return render_prompt("relevant_paper", Paper=paper_index.render(selected))
+
+
+def build_messages(system_msg, shared_content, instruction_content):
+    """[system, shared prefix, per-file instruction]: only the last message differs between files."""
+    msg = copy.deepcopy(system_msg)
+    msg.append({'role': 'user', 'content': shared_content})
+    msg.append({'role': 'user', 'content': instruction_content})
+    return msg
+
+
+def get_stage_tag(current_stage):
+    # "[CODING] model.py" -> "[CODING]"
+    if current_stage.startswith("[") and "]" in current_stage:
+        return current_stage[:current_stage.index("]") + 1]
+    return current_stage
+
+
+class PromptCacheStats:
+    """Prompt and cached-token totals per stage, as reported back in `usage`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_usage = {}  # stage tag -> [requests, prompt_tokens, cached_tokens]
+        self.estimated = {}  # stage tag -> requests whose usage was estimated locally
+
+    def record(self, current_stage, completion_json):
+        if completion_json.get("from_cache") or "usage" not in completion_json:
+            return
+        usage = completion_json["usage"]
+        if usage.get("estimated"):
+            # streams closed early (llm_client.estimate_usage) never learn their cached tokens
+            with self.lock:
+                stage_tag = get_stage_tag(current_stage)
+                self.estimated[stage_tag] = self.estimated.get(stage_tag, 0) + 1
+            return
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        with self.lock:
+            stats = self.stage_usage.setdefault(get_stage_tag(current_stage), [0, 0, 0])
+            stats[0] += 1
+            stats[1] += prompt_tokens
+            stats[2] += cached_tokens
+
+    def format_report(self, stage_tag):
+        requests, prompt_tokens, cached_tokens = self.stage_usage.get(stage_tag, [0, 0, 0])
+        ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        report = (f"📦 {stage_tag} Prompt cache: {cached_tokens}/{prompt_tokens} prompt tokens cached "
+                  f"({ratio:.1%}) over {requests} requests")
+        num_estimated = self.estimated.get(stage_tag, 0)
+        if num_estimated:
+            report += f" ({num_estimated} early-stopped requests without reported usage left out)"
+        return report
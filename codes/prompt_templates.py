@@ -0,0 +1,51 @@
+import os
+import re
+import threading
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "prompts")
+SLOT_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+_templates = {}
+_template_lock = threading.Lock()
+
+
+class PromptTemplate:
+    """A prompt with `{{Slot}}` placeholders, split into literal segments and slots once when loaded.
+
+    Rendering joins the literal segments with the slot values in a single
+    pass; values are never scanned for placeholders, so papers and code
+    containing `{{...}}` are inserted verbatim, and the same values always
+    produce the same bytes.
+    """
+
+    def __init__(self, text, name=""):
+        self.name = name
+        self.parts = SLOT_PATTERN.split(text)  # literal, slot, literal, slot, ..., literal
+        self.slots = set(self.parts[1::2])
+
+    def render(self, **values):
+        missing = self.slots - values.keys()
+        if missing:
+            raise KeyError(f"Prompt template '{self.name}' is missing slots: {', '.join(sorted(missing))}")
+        parts = list(self.parts)
+        parts[1::2] = [f"{values[slot]}" for slot in self.parts[1::2]]
+        return "".join(parts)
+
+
+def load_template(name):
+    """`data/prompts/<name>.txt`, read and parsed once per process."""
+    with _template_lock:
+        if name not in _templates:
+            with open(os.path.join(PROMPTS_DIR, f"{name}.txt"), encoding="utf-8", newline="") as f:
+                _templates[name] = PromptTemplate(f.read(), name)
+        return _templates[name]
+
+
+def render_prompt(name, **values):
+    return load_template(name).render(**values)
+
+
+def render_code_files(code_lst):
+    """Code block of every source in `code_lst`, joined once instead of grown file by file."""
+    template = load_template("code_file")
+    return "".join(template.render(Code=code) for code in code_lst)
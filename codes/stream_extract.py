@@ -0,0 +1,137 @@
+import re
+
+# opening fence on a line of its own, as extract_code_from_content requires: ```python
+OPENING_FENCE_PATTERN = re.compile(r'```\w*\s*$')
+CLOSING_FENCE = "```"
+CONTENT_OPEN = "[CONTENT]"
+CONTENT_CLOSE = "[/CONTENT]"
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def partial_tag_length(text, tag):
+    """Length of the longest end of `text` that is the beginning of `tag` (a tag split across deltas)."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ThinkFilter:
+    """Drops inline <think>...</think> reasoning from streamed text.
+
+    A fence or [/CONTENT] written while the model is still reasoning must
+    not end the stream, so the extractors only see what is outside the
+    reasoning, as utils.extract_planning_from_trajectories does after
+    splitting on </think>. Text that may be the start of a tag split
+    across deltas is held back until the next delta.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.in_think = False
+
+    def feed(self, text):
+        text = self.pending + text
+        self.pending = ""
+        visible = []
+        while text:
+            tag = THINK_CLOSE if self.in_think else THINK_OPEN
+            pos = text.find(tag)
+            if pos >= 0:
+                if not self.in_think:
+                    visible.append(text[:pos])
+                text = text[pos + len(tag):]
+                self.in_think = not self.in_think
+                continue
+            held = partial_tag_length(text, tag)
+            if not self.in_think:
+                visible.append(text[:len(text) - held])
+            self.pending = text[len(text) - held:]
+            break
+        return "".join(visible)
+
+
+class FenceExtractor:
+    """Incremental counterpart of extract_code_from_content for streamed answers.
+
+    Text is fed delta by delta and only the unfinished last line is kept
+    around, so every character is looked at once. `feed` returns True as
+    soon as the line after the code body starts with ```, before the rest
+    of that line (let alone any explanation after the block) arrives.
+    """
+
+    def __init__(self):
+        self.line = ""  # unfinished last line
+        self.in_body = False
+        self.body_lines = []
+        self.done = False
+        self.think_filter = ThinkFilter()
+
+    def feed(self, text):
+        if self.done:
+            return True
+        text = self.think_filter.feed(text)
+        lines = (self.line + text).split("\n")
+        self.line = lines.pop()
+        for line in lines:
+            if self.add_line(line):
+                return True
+        if self.in_body and self.line.startswith(CLOSING_FENCE):
+            self.done = True
+        return self.done
+
+    def add_line(self, line):
+        if not self.in_body:
+            self.in_body = OPENING_FENCE_PATTERN.match(line) is not None
+        elif line.startswith(CLOSING_FENCE):
+            self.done = True
+        else:
+            self.body_lines.append(line)
+        return self.done
+
+    def result(self):
+        """Code of the first complete block; "" while it is still open."""
+        return "".join(line + "\n" for line in self.body_lines) if self.done else ""
+
+
+class ContentBlockExtractor:
+    """Watches streamed text for the end of a [CONTENT]...[/CONTENT] block."""
+
+    def __init__(self):
+        self.tail = ""  # text not yet searched, plus enough of the end of the last delta to match a split tag
+        self.parts = []
+        self.opened = False
+        self.done = False
+        self.think_filter = ThinkFilter()
+
+    def feed(self, text):
+        if self.done:
+            return True
+        text = self.think_filter.feed(text)
+        self.parts.append(text)
+        window = self.tail + text
+        if not self.opened:
+            begin = window.find(CONTENT_OPEN)
+            if begin < 0:
+                self.tail = window[-(len(CONTENT_OPEN) - 1):]
+                return False
+            self.opened = True
+            window = window[begin + len(CONTENT_OPEN):]
+        self.done = CONTENT_CLOSE in window
+        self.tail = window[-(len(CONTENT_CLOSE) - 1):]
+        return self.done
+
+    def result(self):
+        text = "".join(self.parts)
+        begin = text.find(CONTENT_OPEN)
+        end = text.find(CONTENT_CLOSE, begin + len(CONTENT_OPEN))
+        return text[begin + len(CONTENT_OPEN):end] if self.done else ""
+
+
+EXTRACTORS = {"code": FenceExtractor, "content": ContentBlockExtractor}
+
+
+def get_extractor(stop_at):
+    """Fresh extractor for a `stop_at` block kind ("code" or "content"); None streams the whole answer."""
+    return EXTRACTORS[stop_at]() if stop_at else None
@@ -0,0 +1,89 @@
+import os
+import re
+
+
+def get_class_name(file_name):
+    # dataset_loader.py -> DatasetLoader
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return "".join(part[:1].upper() + part[1:] for part in stem.split("_") if part)
+
+
+def get_module_name(file_name):
+    # src/models/net.py -> src.models.net
+    return os.path.splitext(file_name)[0].replace("/", ".")
+
+
+def mentions_file(text, file_name):
+    """Whether a description refers to `file_name` by path, import statement or derived class name."""
+    if not text:
+        return False
+
+    if re.search(r'(?<![\w/.])' + re.escape(file_name) + r'(?![\w])', text):
+        return True
+
+    module_name = get_module_name(file_name)
+    short_module_name = module_name.split(".")[-1]
+    for name in {module_name, short_module_name}:
+        if re.search(r'\b(?:from\s+\.?' + re.escape(name) + r'\s+import|import\s+' + re.escape(name) + r'\b)', text):
+            return True
+
+    class_name = get_class_name(file_name)
+    if class_name and re.search(r'\b' + re.escape(class_name) + r'\b', text):
+        return True
+
+    return False
+
+
+def build_dependency_graph(todo_file_lst, *description_dicts):
+    """Map every file of the task list to the earlier files its descriptions depend on.
+
+    The task list is already ordered by dependency, so edges only point
+    backwards; this keeps the graph acyclic even when two descriptions
+    mention each other. config.yaml is written by planning and left out;
+    other non-Python files (e.g. configs/model.yaml) are nodes without
+    dependencies, and code files never depend on them.
+    """
+    file_lst = [f for f in todo_file_lst if f != "config.yaml"]
+    code_file_lst = [f for f in file_lst if f.endswith(".py")]
+
+    dependency_dict = {}
+    for todo_file_name in file_lst:
+        if not todo_file_name.endswith(".py"):
+            dependency_dict[todo_file_name] = []
+            continue
+        idx = code_file_lst.index(todo_file_name)
+        texts = [d.get(todo_file_name, "") for d in description_dicts if d]
+        dependency_dict[todo_file_name] = [
+            prev_file for prev_file in code_file_lst[:idx]
+            if any(mentions_file(text, prev_file) for text in texts)
+        ]
+    return dependency_dict
+
+
+def get_transitive_dependencies(todo_file_name, dependency_dict, todo_file_lst):
+    """Every file `todo_file_name` depends on directly or indirectly, in task list order."""
+    seen = set()
+    stack = list(dependency_dict.get(todo_file_name, []))
+    while stack:
+        dep = stack.pop()
+        if dep in seen:
+            continue
+        seen.add(dep)
+        stack.extend(dependency_dict.get(dep, []))
+    return [f for f in todo_file_lst if f in seen]
+
+
+def schedule_waves(todo_file_lst, dependency_dict):
+    """Group files into waves whose members only depend on files of earlier waves."""
+    level_dict = {}
+    waves = []
+    for todo_file_name in todo_file_lst:
+        if todo_file_name not in dependency_dict:
+            continue
+        deps = dependency_dict[todo_file_name]
+        level = 1 + max((level_dict[dep] for dep in deps), default=-1)
+        level_dict[todo_file_name] = level
+        if level == len(waves):
+            waves.append([])
+        waves[level].append(todo_file_name)
+    return waves
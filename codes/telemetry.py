@@ -0,0 +1,130 @@
+import json
+import math
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from prompt_layout import get_stage_tag
+
+TELEMETRY_FILE = "telemetry.jsonl"
+GROUP_KEYS = ["stage", "paper", "model"]
+
+_append_lock = threading.Lock()
+
+
+def split_stage(current_stage):
+    # "[CODING] model.py" -> ("[CODING]", "model.py"); planning turns keep their name in place of a file
+    stage = get_stage_tag(current_stage)
+    return stage, current_stage[len(stage):].strip() or None
+
+
+def build_record(completion_json, usage_info, current_stage, paper_name, gpt_version):
+    """One telemetry line for an LLM call, from its completion JSON and utils.cal_cost result."""
+    # cache hits were not billed and are recorded with no tokens, like utils.cal_cost counts them
+    usage = {} if completion_json.get("from_cache") else completion_json.get("usage") or {}
+    timing = completion_json.get("timing") or {}
+    stage, file_name = split_stage(current_stage)
+    return {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "paper": paper_name,
+        "stage": stage,
+        "file": file_name,
+        "model": gpt_version,
+        "prompt_tokens": usage.get("prompt_tokens", 0) or 0,
+        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0,
+        "completion_tokens": usage.get("completion_tokens", 0) or 0,
+        "latency": timing.get("total"),
+        "ttft": timing.get("ttft"),
+        "retries": completion_json.get("retries", 0),
+        "cost": usage_info["total_cost"],
+        "priced": usage_info.get("priced", True),
+        "from_cache": bool(completion_json.get("from_cache")),
+        "from_batch": bool(completion_json.get("from_batch")),
+        "stopped_early": bool(completion_json.get("stopped_early")),
+        "estimated": bool(usage.get("estimated")),
+    }
+
+
+def append_record(path, record):
+    """Append one JSON line with a single O_APPEND write, so concurrent writers never interleave lines."""
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    with _append_lock:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def read_records(paths):
+    """Records of every telemetry.jsonl under `paths` (files or directories); torn lines are skipped."""
+    records = []
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = [os.path.join(root, TELEMETRY_FILE) for root, _, names in os.walk(path) if TELEMETRY_FILE in names]
+        for file_path in sorted(files):
+            with open(file_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+    return records
+
+
+def percentile(values, q):
+    """Nearest-rank percentile; None without values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(records, group_by):
+    """Per-group call counts, latency percentiles, throughput and cost; `group_by` is one of GROUP_KEYS."""
+    groups = defaultdict(list)
+    for record in records:
+        groups[record.get(group_by) or "-"].append(record)
+
+    rows = []
+    for name, group in sorted(groups.items()):
+        # cache hits took no time at the provider and would flatter the latency figures
+        latencies = [r["latency"] for r in group if r.get("latency") is not None and not r.get("from_cache")]
+        ttfts = [r["ttft"] for r in group if r.get("ttft") is not None and not r.get("from_cache")]
+        timed_completion_tokens = sum(r.get("completion_tokens", 0) for r in group
+                                      if r.get("latency") is not None and not r.get("from_cache"))
+        rows.append({
+            group_by: name,
+            "calls": len(group),
+            "cache_hits": sum(1 for r in group if r.get("from_cache")),
+            "retries": sum(r.get("retries", 0) or 0 for r in group),
+            "estimated": sum(1 for r in group if r.get("estimated")),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in group),
+            "cached_tokens": sum(r.get("cached_tokens", 0) for r in group),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in group),
+            "p50_latency": percentile(latencies, 0.50),
+            "p95_latency": percentile(latencies, 0.95),
+            "p50_ttft": percentile(ttfts, 0.50),
+            "tokens_per_second": timed_completion_tokens / sum(latencies) if latencies and sum(latencies) else None,
+            "cost": sum(r.get("cost", 0.0) for r in group),
+        })
+    return rows
+
+
+def format_summary(rows, group_by):
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    # Est.: calls whose usage was estimated locally because their stream was closed early
+    header = (f"{group_by.capitalize():<28} {'Calls':>6} {'Cached':>7} {'Retries':>7} {'Est.':>5} {'Prompt':>10} "
+              f"{'Output':>9} {'p50 (s)':>8} {'p95 (s)':>8} {'TTFT (s)':>8} {'tok/s':>7} {'Cost ($)':>10}")
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(f"{str(row[group_by])[:28]:<28} {row['calls']:>6} {row['cache_hits']:>7} {row['retries']:>7} "
+                     f"{row['estimated']:>5} {row['prompt_tokens']:>10} {row['completion_tokens']:>9} {seconds(row['p50_latency']):>8} "
+                     f"{seconds(row['p95_latency']):>8} {seconds(row['p50_ttft']):>8} "
+                     f"{seconds(row['tokens_per_second']):>7} {row['cost']:>10.4f}")
+    return "\n".join(lines)
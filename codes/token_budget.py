@@ -0,0 +1,112 @@
+import copy
+import os
+import re
+
+from token_counter import count_message_tokens
+
+# context window per model family; the longest matching prefix wins
+CONTEXT_WINDOWS = {
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4-mini": 200_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4.5": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+}
+DEFAULT_CONTEXT_WINDOW = 128_000
+
+# room kept free for the answer; reasoning tokens of o-series models count against the window too
+OUTPUT_RESERVES = {"o1": 40_000, "o3": 40_000, "o4-mini": 40_000}
+DEFAULT_OUTPUT_RESERVE = 16_384
+
+# paper parts that can be dropped, least important first
+PAPER_TRIM_ORDER = ["references", "appendix"]
+
+APPENDIX_SECTION_PATTERN = re.compile(r'^\s*(appendix|appendices|supplementary|acknowledg)', re.IGNORECASE)
+APPENDIX_SEC_NUM_PATTERN = re.compile(r'^[A-Z](\.\d+)*\.?$')
+
+def match_model(table, gpt_version, default):
+    matches = [prefix for prefix in table if gpt_version and gpt_version.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else default
+
+
+def get_max_prompt_tokens(gpt_version):
+    """Prompt budget of a model: its context window minus the reserve for the answer."""
+    if os.environ.get("PAPER2CODE_MAX_PROMPT_TOKENS"):
+        return int(os.environ["PAPER2CODE_MAX_PROMPT_TOKENS"])
+    window = match_model(CONTEXT_WINDOWS, gpt_version, DEFAULT_CONTEXT_WINDOW)
+    return window - match_model(OUTPUT_RESERVES, gpt_version, DEFAULT_OUTPUT_RESERVE)
+
+
+def trim_paper(paper_content, dropped):
+    """Copy of the paper without the parts named in `dropped` ("appendix", "references")."""
+    if not dropped or not set(dropped) & set(PAPER_TRIM_ORDER):
+        return paper_content
+    if isinstance(paper_content, str):
+        return trim_latex_paper(paper_content, dropped)
+
+    paper_content = copy.deepcopy(paper_content)
+    pdf_parse = paper_content.get("pdf_parse", paper_content)
+    if "references" in dropped:
+        # figure/table captions and any bibliography left after 0_pdf_process.py
+        for key in ("ref_entries", "bib_entries"):
+            pdf_parse.pop(key, None)
+    if "appendix" in dropped:
+        pdf_parse.pop("back_matter", None)
+        body_text = pdf_parse.get("body_text", [])
+        for idx, paragraph in enumerate(body_text):
+            if APPENDIX_SECTION_PATTERN.match(paragraph.get("section") or "") \
+                    or APPENDIX_SEC_NUM_PATTERN.match(paragraph.get("sec_num") or ""):
+                pdf_parse["body_text"] = body_text[:idx]
+                break
+    return paper_content
+
+
+def trim_latex_paper(paper_content, dropped):
+    if "references" in dropped:
+        paper_content = re.sub(r'\\begin\{thebibliography\}.*?\\end\{thebibliography\}', '', paper_content, flags=re.DOTALL)
+        paper_content = re.sub(r'\\bibliography\{[^}]*\}', '', paper_content)
+    if "appendix" in dropped:
+        match = re.search(r'\\appendix\b|\\section\*?\{\s*(Appendix|Supplementary)', paper_content, re.IGNORECASE)
+        if match:
+            end = paper_content.find(r'\end{document}', match.start())
+            paper_content = paper_content[:match.start()] + (paper_content[end:] if end >= 0 else "")
+    return paper_content
+
+
+class TokenBudget:
+    """Keeps every prompt of a model under its budget by dropping low-priority sections.
+
+    Callers describe the prompt as `build_msg(dropped)` plus the names of the
+    sections it can leave out, least important first; sections are dropped
+    one at a time until the prompt fits.
+    """
+
+    def __init__(self, gpt_version, max_prompt_tokens=None):
+        self.gpt_version = gpt_version
+        self.max_prompt_tokens = max_prompt_tokens or get_max_prompt_tokens(gpt_version)
+
+    def fits(self, msg):
+        # a token is never shorter than a byte, so small prompts are accepted without encoding them
+        num_bytes = sum(len((message.get("content") or "").encode("utf-8")) + 3 for message in msg) + 3
+        if num_bytes <= self.max_prompt_tokens:
+            return True, None
+        num_tokens = count_message_tokens(msg, self.gpt_version)
+        return num_tokens <= self.max_prompt_tokens, num_tokens
+
+    def fit(self, build_msg, trim_order):
+        """Returns (msg, dropped, num_tokens before trimming, num_tokens after trimming)."""
+        dropped = []
+        msg = build_msg(dropped)
+        ok, original_tokens = self.fits(msg)
+        num_tokens = original_tokens
+        for section in trim_order:
+            if ok:
+                break
+            dropped.append(section)
+            msg = build_msg(dropped)
+            ok, num_tokens = self.fits(msg)
+        return msg, dropped, original_tokens, num_tokens
@@ -0,0 +1,102 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# encoding per model family; the longest matching prefix wins
+ENCODINGS = {
+    "o1": "o200k_base",
+    "o3": "o200k_base",
+    "o4": "o200k_base",
+    "gpt-5": "o200k_base",
+    "gpt-4.1": "o200k_base",
+    "gpt-4.5": "o200k_base",
+    "gpt-4o": "o200k_base",
+    "gpt-4": "cl100k_base",
+    "gpt-3.5": "cl100k_base",
+}
+DEFAULT_ENCODING = "o200k_base"
+
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3  # every reply is primed with <|start|>assistant<|message|>
+
+MEMO_MIN_CHARS = 1024   # shorter texts are cheaper to encode than to hash
+MEMO_MAX_ENTRIES = 4096
+PARALLEL_MIN_ITEMS = 8  # fewer items are counted on the calling thread
+DEFAULT_MAX_WORKERS = 8
+
+_encoders = {}
+_encoder_lock = threading.Lock()
+_memo = OrderedDict()  # (encoding name, sha1 of text) -> tokens
+_memo_lock = threading.Lock()
+
+
+def get_encoding_name(model):
+    matches = [prefix for prefix in ENCODINGS if model and model.startswith(prefix)]
+    return ENCODINGS[max(matches, key=len)] if matches else DEFAULT_ENCODING
+
+
+def get_encoder(model):
+    """Process-wide tiktoken encoder of `model`; None (4 characters per token) without tiktoken."""
+    encoding_name = get_encoding_name(model)
+    with _encoder_lock:
+        if encoding_name not in _encoders:
+            try:
+                import tiktoken
+                _encoders[encoding_name] = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                print(f"[WARNING] tiktoken unavailable ({e}); estimating 4 characters per token.", file=sys.stderr)
+                _encoders[encoding_name] = None
+        return _encoders[encoding_name]
+
+
+def count_text_tokens(text, model):
+    """Tokens of `text`; long texts such as the paper are counted once per process."""
+    encoder = get_encoder(model)
+    if encoder is None:
+        return len(text) // 4 + 1
+    if len(text) < MEMO_MIN_CHARS:
+        return len(encoder.encode(text, disallowed_special=()))
+
+    key = (get_encoding_name(model), hashlib.sha1(text.encode("utf-8")).hexdigest())
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+    num_tokens = len(encoder.encode(text, disallowed_special=()))
+    with _memo_lock:
+        _memo[key] = num_tokens
+        if len(_memo) > MEMO_MAX_ENTRIES:
+            _memo.popitem(last=False)
+    return num_tokens
+
+
+def count_message_tokens(messages, model):
+    """Prompt tokens of a chat message list, including the per-message overhead."""
+    num_tokens = TOKENS_PER_REPLY
+    for message in messages:
+        num_tokens += TOKENS_PER_MESSAGE
+        for key, value in message.items():
+            num_tokens += count_text_tokens(value if isinstance(value, str) else str(value or ""), model)
+            if key == "name":
+                num_tokens += TOKENS_PER_NAME
+    return num_tokens
+
+
+def count_many(message_lists, model, max_workers=DEFAULT_MAX_WORKERS):
+    """count_message_tokens over many prompts; large batches are spread over threads (tiktoken releases the GIL)."""
+    return map_items(lambda messages: count_message_tokens(messages, model), message_lists, max_workers)
+
+
+def count_many_texts(texts, model, max_workers=DEFAULT_MAX_WORKERS):
+    return map_items(lambda text: count_text_tokens(text, model), texts, max_workers)
+
+
+def map_items(fn, items, max_workers):
+    items = list(items)
+    if len(items) < PARALLEL_MIN_ITEMS or max_workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(fn, items))
@@ -0,0 +1,203 @@
+import json
+import re
+from json.decoder import scanstring
+
+CONTENT_OPEN = "[CONTENT]"
+
+# whitespace, `# comments` and `// comments` between tokens, skipped in one match
+SKIP_PATTERN = re.compile(r'(?:\s+|#[^\n]*|//[^\n]*)*')
+NUMBER_PATTERN = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+LITERAL_PATTERN = re.compile(r'true|false|null|True|False|None')
+STRING_STOP_PATTERNS = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+# what may follow the answer: closing tag, fence, comments
+TRAILER_PATTERN = re.compile(r'(?:\s+|#[^\n]*|//[^\n]*|```|\[/CONTENT\])*\Z')
+START_PATTERN = re.compile(r'[{\[]')
+HEX4_PATTERN = re.compile(r'[0-9a-fA-F]{4}')
+ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class TolerantJSONError(ValueError):
+    """Parse failure with the line and column of the offending character."""
+
+    def __init__(self, msg, text, pos):
+        self.msg = msg
+        self.pos = pos
+        self.lineno = text.count("\n", 0, pos) + 1
+        self.colno = pos - text.rfind("\n", 0, pos)
+        super().__init__(f"{msg}: line {self.lineno} column {self.colno} (char {pos})")
+
+
+def find_begin(text):
+    """Offset where the answer starts: after a `[CONTENT]` tag when there is one."""
+    begin = text.find(CONTENT_OPEN)
+    return 0 if begin < 0 else begin + len(CONTENT_OPEN)
+
+
+class TolerantParser:
+    """Single left-to-right scan over a model answer that is almost, but not quite, JSON.
+
+    Besides strict JSON it accepts what planning answers tend to contain:
+    a `[CONTENT]...[/CONTENT]` or ``` wrapper and prose around the value,
+    `#` and `//` comments, trailing commas, single-quoted and triple-quoted
+    strings, raw newlines and unknown backslash escapes inside strings, and
+    Python's True/False/None. There is no retry with a different cleanup,
+    so the cost stays linear in the length of the answer and a failure
+    points at the character that broke it.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def error(self, msg, pos=None):
+        return TolerantJSONError(msg, self.text, self.pos if pos is None else pos)
+
+    def skip(self):
+        self.pos = SKIP_PATTERN.match(self.text, self.pos).end()
+
+    def parse(self):
+        """The value the answer consists of, skipping prose such as "Note [1]:" before it.
+
+        Every `{` or `[` is a candidate start, tried in order. A candidate
+        inside a span an earlier attempt already covered is skipped, so
+        the text is scanned about once. The first complete object wins;
+        without one, the value that runs through to the end of the answer,
+        then the first value. With no value at all, the error of the first
+        attempt is raised.
+        """
+        begin = find_begin(self.text)
+        parsed, last_value, first_error = [], None, None
+        for match in START_PATTERN.finditer(self.text, begin):
+            if match.start() < self.pos:
+                continue
+            self.pos = match.start()
+            try:
+                value = self.parse_value()
+            except TolerantJSONError as e:
+                first_error = first_error or e
+                self.pos = max(e.pos, match.start() + 1)
+                continue
+            if isinstance(value, dict):
+                return value
+            parsed.append(value)
+            if TRAILER_PATTERN.match(self.text, self.pos):
+                last_value = parsed[-1]
+        if last_value is not None:
+            return last_value
+        if parsed:
+            return parsed[0]
+        raise first_error or TolerantJSONError("No JSON object or array found", self.text, begin)
+
+    def parse_value(self):
+        self.skip()
+        text, pos = self.text, self.pos
+        if pos >= len(text):
+            raise self.error("Unexpected end of input")
+        char = text[pos]
+        if char == "{":
+            return self.parse_object()
+        if char == "[":
+            return self.parse_array()
+        if char in "\"'":
+            return self.parse_string()
+        match = NUMBER_PATTERN.match(text, pos) or LITERAL_PATTERN.match(text, pos)
+        if match is None:
+            raise self.error(f"Unexpected character {char!r}")
+        self.pos = match.end()
+        token = match.group()
+        if token in LITERALS:
+            return LITERALS[token]
+        return float(token) if any(c in token for c in ".eE") else int(token)
+
+    def parse_object(self):
+        self.pos += 1
+        result = {}
+        while True:
+            self.skip()
+            if self.text.startswith("}", self.pos):
+                self.pos += 1
+                return result
+            if self.pos >= len(self.text) or self.text[self.pos] not in "\"'":
+                raise self.error("Expecting property name enclosed in quotes")
+            key = self.parse_string()
+            self.skip()
+            if not self.text.startswith(":", self.pos):
+                raise self.error("Expecting ':' delimiter")
+            self.pos += 1
+            result[key] = self.parse_value()
+            if not self.parse_separator("}"):
+                return result
+
+    def parse_array(self):
+        self.pos += 1
+        result = []
+        while True:
+            self.skip()
+            if self.text.startswith("]", self.pos):
+                self.pos += 1
+                return result
+            result.append(self.parse_value())
+            if not self.parse_separator("]"):
+                return result
+
+    def parse_separator(self, closing):
+        """Consume a `,` (True: more items may follow) or the closing bracket (False)."""
+        self.skip()
+        if self.text.startswith(",", self.pos):
+            self.pos += 1
+            return True
+        if self.text.startswith(closing, self.pos):
+            self.pos += 1
+            return False
+        if self.pos >= len(self.text):
+            raise self.error(f"Unexpected end of input, expecting ',' or '{closing}'")
+        raise self.error(f"Expecting ',' or '{closing}'")
+
+    def parse_string(self):
+        text, start = self.text, self.pos
+        quote = text[start]
+        if text.startswith(quote * 3, start):
+            end = text.find(quote * 3, start + 3)
+            if end < 0:
+                raise self.error("Unterminated triple-quoted string", start)
+            self.pos = end + 3
+            return text[start + 3:end]
+        if quote == '"':
+            try:
+                value, self.pos = scanstring(text, start + 1, False)  # strict=False: raw newlines are kept
+                return value
+            except json.JSONDecodeError:
+                pass  # unknown escape such as "\d"; decoded by hand below
+        return self.parse_loose_string(quote)
+
+    def parse_loose_string(self, quote):
+        """String whose unknown escapes are kept as written (`"\\d+"` stays `\\d+`)."""
+        text, start = self.text, self.pos
+        stop_pattern = STRING_STOP_PATTERNS[quote]
+        chunks = []
+        pos = start + 1
+        while True:
+            stop = stop_pattern.search(text, pos)
+            if stop is None:
+                raise self.error("Unterminated string starting at", start)
+            end = stop.start()
+            chunks.append(text[pos:end])
+            if text[end] == quote:
+                self.pos = end + 1
+                return "".join(chunks)
+            escape = text[end + 1:end + 2]
+            if escape == "u" and HEX4_PATTERN.fullmatch(text, end + 2, end + 6):
+                chunks.append(chr(int(text[end + 2:end + 6], 16)))
+                pos = end + 6
+            elif escape in ESCAPES:
+                chunks.append(ESCAPES[escape])
+                pos = end + 2
+            else:
+                chunks.append("\\")
+                pos = end + 1
+
+
+def loads_tolerant(text):
+    """The first JSON-like value in `text`; raises TolerantJSONError with its position when there is none."""
+    return TolerantParser(text).parse()
@@ -2,11 +2,20 @@ import json
 import re
 import os
 from datetime import datetime
+from artifact_store import load_trajectories
+from token_counter import count_message_tokens
+from tolerant_json import loads_tolerant, TolerantJSONError
+from telemetry import TELEMETRY_FILE, append_record, build_record
+from cost_ledger import append_to_ledger
+from pricing import get_registry
 
 def extract_planning(trajectories_json_file_path):
-    with open(trajectories_json_file_path) as f:
-        traj = json.load(f)
+    traj = load_trajectories(trajectories_json_file_path)
 
+    return extract_planning_from_trajectories(traj)
+
+
+def extract_planning_from_trajectories(traj):
     context_lst = []
     for turn in traj:
         if turn['role'] == 'assistant':
@@ -24,97 +33,12 @@ def extract_planning(trajectories_json_file_path):
 
 
 def content_to_json(data):
-    clean_data = re.sub(r'\[CONTENT\]|\[/CONTENT\]', '', data).strip()
-
-    clean_data = re.sub(r'(".*?"),\s*#.*', r'\1,', clean_data)
-
-    clean_data = re.sub(r',\s*\]', ']', clean_data)
-
-    clean_data = re.sub(r'\n\s*', '', clean_data)
-
-
-    # JSON parsing
+    # [CONTENT] wrapper, comments, trailing commas and triple quotes are all handled in one pass
     try:
-        json_data = json.loads(clean_data)
-        return json_data
-    except json.JSONDecodeError as e:
-        # print(e)
-        return content_to_json2(data)
-        
-    
-def content_to_json2(data):
-    # remove [CONTENT][/CONTENT]
-    clean_data = re.sub(r'\[CONTENT\]|\[/CONTENT\]', '', data).strip()
-
-    # "~~~~", #comment -> "~~~~",
-    clean_data = re.sub(r'(".*?"),\s*#.*', r'\1,', clean_data)
-
-    # "~~~~" #comment → "~~~~"
-    clean_data = re.sub(r'(".*?")\s*#.*', r'\1', clean_data)
-
-
-    # ("~~~~",] -> "~~~~"])
-    clean_data = re.sub(r',\s*\]', ']', clean_data)
-
-    clean_data = re.sub(r'\n\s*', '', clean_data)
-
-    # JSON parsing
-    try:
-        json_data = json.loads(clean_data)
-        return json_data
-    
-    except json.JSONDecodeError as e:
-        # print("Json parsing error", e)
-        return content_to_json3(data)
-
-def content_to_json3(data):
-    # remove [CONTENT] [/CONTENT]
-    clean_data = re.sub(r'\[CONTENT\]|\[/CONTENT\]', '', data).strip()
-
-    # "~~~~", #comment -> "~~~~",
-    clean_data = re.sub(r'(".*?"),\s*#.*', r'\1,', clean_data)
-
-    # "~~~~" #comment → "~~~~"
-    clean_data = re.sub(r'(".*?")\s*#.*', r'\1', clean_data)
-
-    # remove ("~~~~",] -> "~~~~"])
-    clean_data = re.sub(r',\s*\]', ']', clean_data)
-
-    clean_data = re.sub(r'\n\s*', '', clean_data) 
-    clean_data = re.sub(r'"""', '"', clean_data)  # Replace triple double quotes
-    clean_data = re.sub(r"'''", "'", clean_data)  # Replace triple single quotes
-    clean_data = re.sub(r"\\", "'", clean_data)  # Replace \ 
-
-    # JSON parsing
-    try:
-        json_data = json.loads(f"""{clean_data}""")
-        return json_data
-    
-    except json.JSONDecodeError as e:
-        # print(e)
-        
-        # print(f"[DEBUG] utils.py > content_to_json3 ")
-        # return None 
-        return content_to_json4(data)
-    
-def content_to_json4(data):
-    # 1. Extract Logic Analysis, Task list
-    pattern = r'"Logic Analysis":\s*(\[[\s\S]*?\])\s*,\s*"Task list":\s*(\[[\s\S]*?\])'
-    match = re.search(pattern, data)
-
-    if match:
-        logic_analysis = json.loads(match.group(1))
-        task_list = json.loads(match.group(2))
-
-        result = {
-            "Logic Analysis": logic_analysis,
-            "Task list": task_list
-        }
-    else:
-        result = {}
-
-    # print(json.dumps(result, indent=2))
-    return result
+        return loads_tolerant(data)
+    except TolerantJSONError as e:
+        print(f"[WARNING] Failed to parse JSON content: {e}")
+        return {}
 
 def extract_code_from_content(content):
     pattern = r'^```(?:\w+)?\s*\n(.*?)(?=^```)```'
@@ -135,6 +59,20 @@ def extract_code_from_content2(content):
         print("[WARNING] No Python code found.")
     return extracted_code
 
+def extract_yaml_from_content(content):
+    # ```yaml\n...\n``` block of the config answer; None when there is none
+    if "</think>" in content:
+        content = content.split("</think>")[-1]
+
+    match = re.search(r"```yaml\n(.*?)\n```", content, re.DOTALL)
+    if match:
+        return match.group(1)
+    # answers that were JSON-escaped once more keep a literal "\n"
+    match = re.search(r"```yaml\\n(.*?)\\n```", content, re.DOTALL)
+    if match:
+        return match.group(1)
+    return None
+
 def format_json_data(data):
     formatted_text = ""
     for key, value in data.items():
@@ -149,110 +87,46 @@ def format_json_data(data):
     return formatted_text
 
 
+_unpriced_models = set()
+
+
 def cal_cost(response_json, model_name):
-    model_cost = {
-        # gpt-4.1
-        "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
-        "gpt-4.1-2025-04-14": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
-
-        # gpt-4.1-mini
-        "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
-        "gpt-4.1-mini-2025-04-14": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
-
-        # gpt-4.1-nano
-        "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
-        "gpt-4.1-nano-2025-04-14": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
-
-        # gpt-4.5-preview
-        "gpt-4.5-preview": {"input": 75.00, "cached_input": 37.50, "output": 150.00},
-        "gpt-4.5-preview-2025-02-27": {"input": 75.00, "cached_input": 37.50, "output": 150.00},
-
-        # gpt-4o
-        "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
-        "gpt-4o-2024-08-06": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
-        "gpt-4o-2024-11-20": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
-        "gpt-4o-2024-05-13": {"input": 5.00, "cached_input": None, "output": 15.00},
-
-        # gpt-4o-audio-preview
-        "gpt-4o-audio-preview": {"input": 2.50, "cached_input": None, "output": 10.00},
-        "gpt-4o-audio-preview-2024-12-17": {"input": 2.50, "cached_input": None, "output": 10.00},
-        "gpt-4o-audio-preview-2024-10-01": {"input": 2.50, "cached_input": None, "output": 10.00},
-
-        # gpt-4o-realtime-preview
-        "gpt-4o-realtime-preview": {"input": 5.00, "cached_input": 2.50, "output": 20.00},
-        "gpt-4o-realtime-preview-2024-12-17": {"input": 5.00, "cached_input": 2.50, "output": 20.00},
-        "gpt-4o-realtime-preview-2024-10-01": {"input": 5.00, "cached_input": 2.50, "output": 20.00},
-
-        # gpt-4o-mini
-        "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
-        "gpt-4o-mini-2024-07-18": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
-
-        # gpt-4o-mini-audio-preview
-        "gpt-4o-mini-audio-preview": {"input": 0.15, "cached_input": None, "output": 0.60},
-        "gpt-4o-mini-audio-preview-2024-12-17": {"input": 0.15, "cached_input": None, "output": 0.60},
-
-        # gpt-4o-mini-realtime-preview
-        "gpt-4o-mini-realtime-preview": {"input": 0.60, "cached_input": 0.30, "output": 2.40},
-        "gpt-4o-mini-realtime-preview-2024-12-17": {"input": 0.60, "cached_input": 0.30, "output": 2.40},
-
-        # o1
-        "o1": {"input": 15.00, "cached_input": 7.50, "output": 60.00},
-        "o1-2024-12-17": {"input": 15.00, "cached_input": 7.50, "output": 60.00},
-        "o1-preview-2024-09-12": {"input": 15.00, "cached_input": 7.50, "output": 60.00},
-
-        # o1-pro
-        "o1-pro": {"input": 150.00, "cached_input": None, "output": 600.00},
-        "o1-pro-2025-03-19": {"input": 150.00, "cached_input": None, "output": 600.00},
-
-        # o3
-        "o3": {"input": 10.00, "cached_input": 2.50, "output": 40.00},
-        "o3-2025-04-16": {"input": 10.00, "cached_input": 2.50, "output": 40.00},
-
-        # o4-mini
-        "o4-mini": {"input": 1.10, "cached_input": 0.275, "output": 4.40},
-        "o4-mini-2025-04-16": {"input": 1.10, "cached_input": 0.275, "output": 4.40},
-
-        # o3-mini
-        "o3-mini": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
-        "o3-mini-2025-01-31": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
-
-        # o1-mini
-        "o1-mini": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
-        "o1-mini-2024-09-12": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
-
-        # gpt-4o-mini-search-preview
-        "gpt-4o-mini-search-preview": {"input": 0.15, "cached_input": None, "output": 0.60},
-        "gpt-4o-mini-search-preview-2025-03-11": {"input": 0.15, "cached_input": None, "output": 0.60},
-
-        # gpt-4o-search-preview
-        "gpt-4o-search-preview": {"input": 2.50, "cached_input": None, "output": 10.00},
-        "gpt-4o-search-preview-2025-03-11": {"input": 2.50, "cached_input": None, "output": 10.00},
-
-        # computer-use-preview
-        "computer-use-preview": {"input": 3.00, "cached_input": None, "output": 12.00},
-        "computer-use-preview-2025-03-11": {"input": 3.00, "cached_input": None, "output": 12.00},
-
-        # gpt-image-1
-        "gpt-image-1": {"input": 5.00, "cached_input": None, "output": None},
-    }
+    usage = response_json.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", 0) or 0
+    completion_tokens = usage.get("completion_tokens", 0) or 0
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
 
-    
-    prompt_tokens = response_json["usage"]["prompt_tokens"]
-    completion_tokens = response_json["usage"]["completion_tokens"]
-    cached_tokens = response_json["usage"]["prompt_tokens_details"].get("cached_tokens", 0)
+    # served from the local response cache (llm_cache.py): nothing was billed
+    if response_json.get("from_cache"):
+        prompt_tokens, completion_tokens, cached_tokens = 0, 0, 0
 
     # input token = (prompt_tokens - cached_tokens)
     actual_input_tokens = prompt_tokens - cached_tokens
     output_tokens = completion_tokens
 
-    cost_info = model_cost[model_name]
-
+    # unknown models (e.g. self-hosted endpoints without a --pricing entry) keep token-only accounting at $0
+    cost_info = get_registry().lookup(model_name)
+    priced = cost_info is not None and cost_info["output"] is not None
+    if cost_info is None:
+        if model_name not in _unpriced_models:
+            _unpriced_models.add(model_name)
+            print(f"[WARNING] No pricing for model {model_name!r}; counting tokens only (cost $0). "
+                  f"Add it to a pricing file passed with --pricing.")
+        cost_info = {"input": 0.0, "cached_input": None, "output": 0.0}
+
+    # no cache discount for this model: cached tokens are billed as regular input
+    cached_price = cost_info["cached_input"] if cost_info["cached_input"] is not None else cost_info["input"]
     input_cost = (actual_input_tokens / 1_000_000) * cost_info['input']
-    cached_input_cost = (cached_tokens / 1_000_000) * cost_info['cached_input']
-    output_cost = (output_tokens / 1_000_000) * cost_info['output']
+    cached_input_cost = (cached_tokens / 1_000_000) * cached_price
+    output_cost = (output_tokens / 1_000_000) * (cost_info['output'] or 0.0)
 
     total_cost = input_cost + cached_input_cost + output_cost
 
+    # answered through the Batch API (llm_batch.py), billed at half price
+    if response_json.get("from_batch"):
+        input_cost, cached_input_cost, output_cost = input_cost / 2, cached_input_cost / 2, output_cost / 2
+        total_cost = total_cost / 2
+
     return {
         'model_name': model_name,
         'actual_input_tokens': actual_input_tokens,
@@ -262,6 +136,8 @@ def cal_cost(response_json, model_name):
         'output_tokens': output_tokens,
         'output_cost': output_cost,
         'total_cost': total_cost,
+        'priced': priced,
+        'estimated': bool(usage.get("estimated")),
     }
 
 def load_accumulated_cost(accumulated_cost_file):
@@ -273,8 +149,12 @@ def load_accumulated_cost(accumulated_cost_file):
         return 0.0
 
 def save_accumulated_cost(accumulated_cost_file, cost):
-    with open(accumulated_cost_file, "w", encoding="utf-8") as f:
+    # snapshot of this process's total; written to a temp file and renamed so readers never see it half-written.
+    # the cost ledger (cost_ledger.py) is what concurrent runs should be totalled from
+    tmp_file = f"{accumulated_cost_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
         json.dump({"total_cost": cost}, f)
+    os.replace(tmp_file, accumulated_cost_file)
 
 def print_response(completion_json, is_llm=False):
     print("============================================")
@@ -284,7 +164,8 @@ def print_response(completion_json, is_llm=False):
         print(completion_json['choices'][0]['message']['content'])
     print("============================================\n")
 
-def print_log_cost(completion_json, gpt_version, current_stage, output_dir, total_accumulated_cost):
+def print_log_cost(completion_json, gpt_version, current_stage, output_dir, total_accumulated_cost, paper_name=None,
+                   record=True):
     usage_info = cal_cost(completion_json, gpt_version)
 
     current_cost = usage_info['total_cost']
@@ -293,12 +174,19 @@ def print_log_cost(completion_json, gpt_version, current_stage, output_dir, tota
     output_lines = []
     output_lines.append("🌟 Usage Summary 🌟")
     output_lines.append(f"{current_stage}")
-    output_lines.append(f"🛠️ Model: {usage_info['model_name']}")
+    output_lines.append(f"🛠️ Model: {usage_info['model_name']}" + ("" if usage_info['priced'] else " (no pricing, cost not counted)"))
     output_lines.append(f"📥 Input tokens: {usage_info['actual_input_tokens']} (Cost: ${usage_info['input_cost']:.8f})")
     output_lines.append(f"📦 Cached input tokens: {usage_info['cached_tokens']} (Cost: ${usage_info['cached_input_cost']:.8f})")
     output_lines.append(f"📤 Output tokens: {usage_info['output_tokens']} (Cost: ${usage_info['output_cost']:.8f})")
     output_lines.append(f"💵 Current total cost: ${current_cost:.8f}")
+    if usage_info['estimated']:
+        # stream closed early (llm_client.collect_stream): the provider never reported usage
+        output_lines.append("⚠️ Usage estimated locally: cached and reasoning tokens are unknown")
     output_lines.append(f"🪙 Accumulated total cost so far: ${total_accumulated_cost:.8f}")
+    timing = completion_json.get("timing")
+    if timing and timing.get("ttft") is not None:
+        # streamed responses (llm_client.collect_stream)
+        output_lines.append(f"⏱️ Time to first token: {timing['ttft']}s (total: {timing['total']}s)")
     output_lines.append("============================================\n")
 
     output_text = "\n".join(output_lines)
@@ -307,58 +195,21 @@ def print_log_cost(completion_json, gpt_version, current_stage, output_dir, tota
 
     with open(f"{output_dir}/cost_info.log", "a", encoding="utf-8") as f:
         f.write(output_text + "\n")
+
+    # one machine-readable line per call, aggregated by scripts/report.py; estimates (record=False) are not spend
+    if not record:
+        return total_accumulated_cost
+    paper_name = paper_name or os.path.basename(os.path.normpath(output_dir))
+    record = build_record(completion_json, usage_info, current_stage, paper_name, gpt_version)
+    append_record(f"{output_dir}/{TELEMETRY_FILE}", record)
+    append_to_ledger(output_dir, record)
     
     return total_accumulated_cost
 
 
 def num_tokens_from_messages(messages, model="gpt-4o-2024-08-06"):
-    import tiktoken
-    
     """Return the number of tokens used by a list of messages."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: model not found. Using o200k_base encoding.")
-        encoding = tiktoken.get_encoding("o200k_base")
-    if model in {
-        "gpt-3.5-turbo-0125",
-        "gpt-4-0314",
-        "gpt-4-32k-0314",
-        "gpt-4-0613",
-        "gpt-4-32k-0613",
-        "gpt-4o-mini-2024-07-18",
-        "gpt-4o-2024-08-06"
-        }:
-        tokens_per_message = 3
-        tokens_per_name = 1
-    elif "gpt-3.5-turbo" in model:
-        print("Warning: gpt-3.5-turbo may update over time. Returning num tokens assuming gpt-3.5-turbo-0125.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo-0125")
-    elif "gpt-4o-mini" in model:
-        print("Warning: gpt-4o-mini may update over time. Returning num tokens assuming gpt-4o-mini-2024-07-18.")
-        return num_tokens_from_messages(messages, model="gpt-4o-mini-2024-07-18")
-    elif "gpt-4o" in model:
-        print("Warning: gpt-4o and gpt-4o-mini may update over time. Returning num tokens assuming gpt-4o-2024-08-06.")
-        return num_tokens_from_messages(messages, model="gpt-4o-2024-08-06")
-
-    elif "gpt-4" in model:
-        print("Warning: gpt-4 may update over time. Returning num tokens assuming gpt-4-0613.")
-        return num_tokens_from_messages(messages, model="gpt-4-0613")
-    else:
-        raise NotImplementedError(
-            f"""num_tokens_from_messages() is not implemented for model {model}."""
-        )
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            # num_tokens += len(encoding.encode(value) 
-            num_tokens += len(encoding.encode(value, allowed_special={"<|endoftext|>"},disallowed_special=()))
-            
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+    return count_message_tokens(messages, model)
 
 
 
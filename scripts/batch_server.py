@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+本地 Batch API 替身服务 (用于离线测试 --batch 模式, 或为不支持 Batch API 的兼容端点提供批处理)
+
+实现 OpenAI Batch API 中 Paper2Code 用到的部分:
+  POST /v1/files                  上传 JSONL 批处理文件
+  GET  /v1/files/{id}/content     下载结果文件
+  POST /v1/batches                创建批处理任务
+  GET  /v1/batches/{id}           查询任务状态
+  POST /v1/chat/completions       普通 (含流式) 请求, run.py --batch 中不走批处理的规划阶段等使用
+
+每个请求要么转发到 --upstream 指定的 chat/completions 端点, 要么 (--echo) 直接返回固定格式的回复。
+
+用法:
+  python batch_server.py --echo
+  python batch_server.py --upstream https://api.openai.com/v1
+  然后设置 OPENAI_API_BASE=http://127.0.0.1:8765 并使用 python run.py --batch
+"""
+
+import argparse
+import copy
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+files = {}    # file id -> {"meta": {...}, "content": bytes}
+batches = {}  # batch id -> batch object
+lock = threading.RLock()
+
+
+def new_id(prefix):
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+
+def add_file(filename, content, purpose):
+    file_id = new_id("file")
+    meta = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed"}
+    with lock:
+        files[file_id] = {"meta": meta, "content": content}
+    return meta
+
+
+class StandInError(Exception):
+    """请求无效时返回给客户端的错误 (HTTP 状态码 + OpenAI 格式的错误体)"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = {"error": {"message": message, "type": "invalid_request_error"}}
+
+
+def validate_body(body):
+    if not isinstance(body.get("messages"), list) or not body["messages"]:
+        raise StandInError(400, "'messages' must be a non-empty array")
+
+
+def echo_completion(body):
+    last = body["messages"][-1]["content"] if body.get("messages") else ""
+    content = f"[batch stand-in] {last[-200:]}"
+    prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in body.get("messages", []))
+    completion_tokens = len(content) // 4
+    return {
+        "id": new_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", ""),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens,
+                  "prompt_tokens_details": {"cached_tokens": 0}},
+    }
+
+
+def forward_completion(body, upstream, api_key):
+    request = urllib.request.Request(
+        upstream.rstrip("/") + "/chat/completions",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=600) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        error = StandInError(e.code, "")
+        error.body = json.loads(e.read() or b"{}")
+        raise error
+
+
+def get_completion(body, args):
+    validate_body(body)
+    body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+    return echo_completion(body) if args.echo else forward_completion(body, args.upstream, args.api_key)
+
+
+def to_stream_chunks(completion, include_usage):
+    """把完整回复拆成 chat.completion.chunk 序列 (流式请求)"""
+    base = {k: completion.get(k) for k in ("id", "created", "model")}
+    base["object"] = "chat.completion.chunk"
+    choice = completion["choices"][0]
+    content = choice["message"].get("content") or ""
+    yield dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+    for start in range(0, len(content), 64):
+        yield dict(base, choices=[{"index": 0, "delta": {"content": content[start:start + 64]}, "finish_reason": None}])
+    yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": choice.get("finish_reason") or "stop"}])
+    if include_usage:
+        yield dict(base, choices=[], usage=completion.get("usage"))
+
+
+def process_batch(batch_id, args):
+    with lock:
+        batch = batches[batch_id]
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = int(time.time())
+        lines = files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+    items = [json.loads(line) for line in lines if line.strip()]
+    batch["request_counts"]["total"] = len(items)
+
+    outputs, errors = [], []
+    for item in items:
+        result = {"id": new_id("batch_req"), "custom_id": item["custom_id"]}
+        try:
+            body = get_completion(item["body"], args)
+            result.update({"response": {"status_code": 200, "request_id": new_id("req"), "body": body}, "error": None})
+            outputs.append(result)
+            batch["request_counts"]["completed"] += 1
+        except StandInError as e:
+            result.update({"response": {"status_code": e.status_code, "request_id": new_id("req"), "body": e.body}, "error": None})
+            errors.append(result)
+            batch["request_counts"]["failed"] += 1
+        except Exception as e:
+            result.update({"response": None, "error": {"code": "stand_in_error", "message": str(e)}})
+            errors.append(result)
+            batch["request_counts"]["failed"] += 1
+
+    def to_jsonl(results):
+        return "".join(json.dumps(r) + "\n" for r in results).encode("utf-8")
+
+    with lock:
+        if outputs:
+            batch["output_file_id"] = add_file(f"{batch_id}_output.jsonl", to_jsonl(outputs), "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = add_file(f"{batch_id}_error.jsonl", to_jsonl(errors), "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_args = None
+
+    def send_json(self, obj, status=200):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self):
+        self.send_json({"error": {"message": f"Unknown path: {self.path}", "type": "invalid_request_error"}}, 404)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send_stream(self, chunks):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/v1/chat/completions":
+            body = json.loads(self.read_body())
+            try:
+                completion = get_completion(body, self.server_args)
+            except StandInError as e:
+                self.send_json(e.body, e.status_code)
+                return
+            except Exception as e:
+                self.send_json({"error": {"message": str(e), "type": "stand_in_error"}}, 502)
+                return
+            if body.get("stream"):
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                self.send_stream(to_stream_chunks(completion, include_usage))
+            else:
+                self.send_json(completion)
+        elif path == "/v1/files":
+            body = self.read_body()
+            message = BytesParser(policy=default_policy).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body)
+            fields, filename, content = {}, "batch.jsonl", b""
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if name == "file":
+                    filename = part.get_filename() or filename
+                    content = part.get_payload(decode=True)
+                else:
+                    fields[name] = part.get_content().strip()
+            self.send_json(add_file(filename, content, fields.get("purpose", "batch")))
+        elif path == "/v1/batches":
+            body = json.loads(self.read_body())
+            if body.get("input_file_id") not in files:
+                self.send_json({"error": {"message": "input_file_id not found", "type": "invalid_request_error"}}, 400)
+                return
+            batch_id = new_id("batch")
+            batch = {
+                "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+                "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+                "status": "validating", "output_file_id": None, "error_file_id": None, "errors": None,
+                "created_at": int(time.time()), "in_progress_at": None, "completed_at": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}, "metadata": body.get("metadata"),
+            }
+            with lock:
+                batches[batch_id] = batch
+            threading.Thread(target=process_batch, args=(batch_id, self.server_args), daemon=True).start()
+            self.send_json(batch)
+        else:
+            self.not_found()
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in batches:
+            with lock:
+                batch = copy.deepcopy(batches[parts[2]])
+            self.send_json(batch)
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in files:
+            content = files[parts[2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        elif parts[:2] == ["v1", "files"] and len(parts) == 3 and parts[2] in files:
+            self.send_json(files[parts[2]]["meta"])
+        else:
+            self.not_found()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Batch API 替身服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upstream", type=str, default=None, help="转发请求的 OpenAI 兼容端点 (如: https://api.openai.com/v1)")
+    parser.add_argument("--api-key", type=str, default=os.environ.get("OPENAI_API_KEY", ""), help="上游端点的 API 密钥")
+    parser.add_argument("--echo", action="store_true", help="不转发, 直接返回固定格式的回复 (离线测试)")
+    args = parser.parse_args()
+
+    if not args.echo and not args.upstream:
+        parser.error("需要指定 --upstream 或 --echo")
+
+    Handler.server_args = args
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Batch API 替身服务运行于 http://{args.host}:{args.port} ({'echo' if args.echo else args.upstream})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
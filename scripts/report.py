@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Paper2Code 运行报告: 汇总各输出目录中的 telemetry.jsonl (每次 LLM 调用一行),
+按阶段、论文、模型统计调用次数、p50/p95 延迟、吞吐量与费用;
+--ledger 则直接查询费用账本 (cost_ledger.sqlite), 并发运行的费用以账本为准
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 各阶段脚本位于 codes/ 目录下
+CODES_DIR = Path(__file__).resolve().parent.parent / "codes"
+sys.path.insert(0, str(CODES_DIR))
+
+from cost_ledger import LEDGER_GROUP_KEYS, CostLedger
+from telemetry import GROUP_KEYS, format_summary, read_records, summarize
+
+
+def format_ledger_summary(rows, group_by):
+    header = (f"{group_by.capitalize():<28} {'Calls':>6} {'Cached':>7} {'Est.':>5} {'Prompt':>10} {'Output':>9} "
+              f"{'Cost ($)':>10}")
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(f"{str(row[group_by] or '-')[:28]:<28} {row['calls']:>6} {row['cache_hits']:>7} "
+                     f"{row['estimated']:>5} {row['prompt_tokens']:>10} {row['completion_tokens']:>9} {row['cost']:>10.4f}")
+    return "\n".join(lines)
+
+
+def report_ledger(args):
+    if not Path(args.ledger).exists():
+        print(f"❌ 费用账本不存在: {args.ledger}")
+        sys.exit(1)
+    ledger = CostLedger(args.ledger)
+    filters = {"paper": args.paper, "run_id": args.run_id}
+    group_keys = args.by or ["paper", "stage", "model"]
+    summaries = {group_by: ledger.summarize(group_by, **filters) for group_by in group_keys}
+    if args.json:
+        print(json.dumps(summaries, indent=2, ensure_ascii=False))
+        return
+
+    print(f"📒 {args.ledger}: 总费用 ${ledger.total_cost(**filters):.4f}")
+    num_estimated = sum(row["estimated"] or 0 for row in summaries[group_keys[0]])
+    if num_estimated:
+        print(f"⚠️ {num_estimated} 次调用提前结束流式输出, 用量为本地估算 (Est. 列): 缓存与推理 token 未知")
+    for group_by in group_keys:
+        print()
+        print(format_ledger_summary(summaries[group_by], group_by))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总 telemetry.jsonl, 输出各阶段/论文/模型的延迟、吞吐量与费用")
+    parser.add_argument("paths", nargs="*",
+                        help="输出目录或 telemetry.jsonl 文件, 目录会递归查找 (默认: 项目根目录下 outputs)")
+    parser.add_argument("--by", action="append", choices=sorted(set(GROUP_KEYS + LEDGER_GROUP_KEYS)),
+                        help="分组维度, 可重复 (默认: stage、paper、model 全部输出; run_id 仅用于 --ledger)")
+    parser.add_argument("--since", type=str, default=None,
+                        help="只统计此时间之后的调用 (ISO 格式, 如 2025-05-01 或 2025-05-01T12:00)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出汇总结果")
+    parser.add_argument("--ledger", type=str, default=None, help="改为汇总此费用账本 (cost_ledger.sqlite)")
+    parser.add_argument("--paper", type=str, default=None, help="--ledger: 只统计此论文")
+    parser.add_argument("--run-id", type=str, default=None, help="--ledger: 只统计此次运行")
+    args = parser.parse_args()
+
+    if args.ledger:
+        report_ledger(args)
+        return
+    if args.by and "run_id" in args.by:
+        parser.error("--by run_id 需要 --ledger")
+
+    paths = args.paths or [str(Path(__file__).resolve().parent.parent / "outputs")]
+    records = read_records(paths)
+    if args.since:
+        records = [record for record in records if record.get("ts", "") >= args.since]
+    if not records:
+        print(f"❌ 没有找到调用记录: {', '.join(paths)}")
+        sys.exit(1)
+
+    group_keys = args.by or GROUP_KEYS
+    summaries = {group_by: summarize(records, group_by) for group_by in group_keys}
+    if args.json:
+        print(json.dumps(summaries, indent=2, ensure_ascii=False))
+        return
+
+    total_cost = sum(record.get("cost", 0.0) for record in records)
+    print(f"📊 {len(records)} 次调用, {len({record.get('paper') for record in records})} 篇论文, 总费用 ${total_cost:.4f}")
+    num_estimated = sum(1 for record in records if record.get("estimated"))
+    if num_estimated:
+        print(f"⚠️ {num_estimated} 次调用提前结束流式输出, 用量为本地估算 (Est. 列): 缓存与推理 token 未知")
+    for group_by in group_keys:
+        print()
+        print(format_summary(summaries[group_by], group_by))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,38 +5,31 @@ Paper2Code 运行脚本 (Windows PowerShell 兼容版本)
 
 import os
 import sys
-import subprocess
-import shutil
+import json
 import argparse
+import contextlib
+import tempfile
 from pathlib import Path
 
+# 各阶段脚本位于 codes/ 目录下，在同一进程内直接调用
+CODES_DIR = Path(__file__).resolve().parent.parent / "codes"
+sys.path.insert(0, str(CODES_DIR))
+
+from llm_cache import CACHE_MODES
+from artifact_store import ARTIFACT_STORES
+from code_summary import CODE_CONTEXTS
+from paper_markdown import PAPER_SERIALIZATIONS
+from pipeline import PipelineContext, run_pipeline
+from planning_schema import PLANNING_OUTPUTS
+from pricing import load_pricing_file
+from dry_run import DryRunContext, History, find_reference_dir, format_estimate, summarize_rows
+
 try:
     from dotenv import load_dotenv
 except ImportError:
     load_dotenv = None
 
 
-def run_command(cmd, description="", env=None):
-    """运行命令并处理错误"""
-    if description:
-        print(f"\n------- {description} -------")
-    
-    print(f"执行: {' '.join(cmd)}")
-    try:
-        # 继承当前环境变量，并合并新的环境变量
-        cmd_env = os.environ.copy()
-        if env:
-            cmd_env.update(env)
-        result = subprocess.run(cmd, check=True, env=cmd_env)
-        return result.returncode == 0
-    except subprocess.CalledProcessError as e:
-        print(f"错误: 命令执行失败 (返回码: {e.returncode})")
-        sys.exit(1)
-    except Exception as e:
-        print(f"错误: {str(e)}")
-        sys.exit(1)
-
-
 def load_api_key(api_key_arg=None):
     """
     加载API_KEY (优先级: 命令行参数 > .env文件 > 环境变量)
@@ -96,6 +89,86 @@ def load_api_base_url(base_url_arg=None):
     return None
 
 
+def load_pricing(pricing_arg=None):
+    """检查自定义价格文件并通过 PAPER2CODE_PRICING 交给各阶段; 格式错误时直接退出, 不等到第一次调用"""
+    if not pricing_arg:
+        return
+    try:
+        load_pricing_file(pricing_arg)
+    except (OSError, ValueError) as e:
+        print(f"❌ 价格文件无效: {e}")
+        sys.exit(1)
+    os.environ["PAPER2CODE_PRICING"] = str(Path(pricing_arg).resolve())
+    print(f"✓ 使用自定义价格文件: {pricing_arg}")
+
+
+def add_pipeline_arguments(parser, artifact_store="json"):
+    """各阶段共用的运行选项; run.py 与 run_batch.py 都通过 get_pipeline_kwargs 交给 PipelineContext"""
+    parser.add_argument("--max-workers", type=int, default=4, help="每个阶段的最大并发请求数 (默认: 4)")
+    parser.add_argument("--coding-schedule", type=str, default="sequential", choices=["sequential", "dag"],
+                        help="代码生成顺序: sequential 按任务列表逐个生成 (默认), dag 按依赖图分批并发生成")
+    parser.add_argument("--stream", action="store_true",
+                        help="流式输出: 生成过程中实时写入 *_coding.txt 等中间文件, 并记录首 token 延迟")
+    parser.add_argument("--resume", action="store_true",
+                        help="断点续跑: 跳过输入未变化且已完成的规划轮次/分析/代码文件 (记录于 outputs/<论文>/*_manifest.json)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Batch API 模式: 分析与代码生成请求以批处理任务提交 (费用减半, 不需要实时响应); 建议配合 --coding-schedule dag")
+    parser.add_argument("--max-prompt-tokens", type=int, default=None,
+                        help="单次请求的提示词 token 上限, 超出时依次裁剪旧代码文件、参考文献、附录 (默认: 按模型上下文窗口计算)")
+    parser.add_argument("--paper-serialization", type=str, default="markdown", choices=PAPER_SERIALIZATIONS,
+                        help="论文在提示词中的格式: markdown 按章节标题排版 (默认), json 沿用原始字典文本")
+    parser.add_argument("--paper-top-k", type=int, default=None,
+                        help="分析与代码生成时每个文件只附带与其 Logic Analysis 最相关的 k 个论文章节 (本地 BM25 检索; 默认: 附带整篇论文)")
+    parser.add_argument("--paper-token-cap", type=int, default=None,
+                        help="配合 --paper-top-k, 每个请求附带的论文 token 上限 (默认: 6000)")
+    parser.add_argument("--artifact-store", type=str, default=artifact_store, choices=ARTIFACT_STORES,
+                        help=f"轨迹文件存储方式 (默认: {artifact_store}): json 完整保存, blobs 消息正文按内容去重存入 outputs/<论文>/blobs, blobs-zstd 另用 zstd 压缩 (需安装 zstandard)")
+    parser.add_argument("--code-context", type=str, default="full", choices=CODE_CONTEXTS,
+                        help="代码生成时已完成文件的呈现方式: full 完整源码 (默认), interface 非直接依赖的文件只附带接口摘要 (类、函数签名、类型注解、文档字符串、常量)")
+    parser.add_argument("--planning-output", type=str, default="text", choices=PLANNING_OUTPUTS,
+                        help="规划中架构设计与任务列表两轮的输出方式: text 按格式示例自由输出 (默认), structured 以 JSON Schema 约束输出 (需模型支持 response_format)")
+
+
+def get_pipeline_kwargs(args):
+    """add_pipeline_arguments 中选项对应的 PipelineContext 参数"""
+    return dict(
+        max_workers=args.max_workers,
+        coding_schedule=args.coding_schedule,
+        stream=args.stream,
+        resume=args.resume,
+        batch=args.batch,
+        max_prompt_tokens=args.max_prompt_tokens,
+        paper_serialization=args.paper_serialization,
+        paper_top_k=args.paper_top_k,
+        paper_token_cap=args.paper_token_cap,
+        code_context=args.code_context,
+        artifact_store=args.artifact_store,
+        planning_output=args.planning_output,
+    )
+
+
+def run_dry_run(ctx_kwargs, input_json_path, output_dir, history_dirs):
+    """构建整个流程的所有提示词并估算 token 数与费用, 不调用 API; 中间文件写入临时目录"""
+    history = History(history_dirs)
+    reference_dir = find_reference_dir([output_dir] + history_dirs)
+    print(f"参考输出: {reference_dir or '无 (使用默认长度的占位回复)'}")
+    with tempfile.TemporaryDirectory(prefix="paper2code_dry_run_") as tmp_dir:
+        ctx = DryRunContext(**dict(ctx_kwargs, output_dir=os.path.join(tmp_dir, "output"),
+                                   output_repo_dir=os.path.join(tmp_dir, "repo"),
+                                   pdf_json_path=os.path.join(tmp_dir, "cleaned.json")),
+                            history=history, reference_dir=reference_dir)
+        with open(os.path.join(tmp_dir, "dry_run.log"), "w", encoding="utf-8") as log_file, \
+                contextlib.redirect_stdout(log_file):
+            run_pipeline(ctx, input_json_path=str(input_json_path))
+
+    print(format_estimate(ctx.rows))
+    estimate_path = Path(output_dir) / "dry_run_estimate.json"
+    with open(estimate_path, "w", encoding="utf-8") as f:
+        json.dump({"rows": ctx.rows, "totals": summarize_rows(ctx.rows)}, f, indent=2, ensure_ascii=False)
+    print(f"\n估算结果: {estimate_path}")
+    print("说明: 输出 token 取自历史运行的 cost_info.log; 缓存 token 为前缀缓存的理论上限; 耗时按顺序执行估算")
+
+
 def main():
     # 命令行参数解析
     parser = argparse.ArgumentParser(
@@ -113,12 +186,26 @@ def main():
     parser.add_argument("--api-base-url", type=str, help="OpenAI API 基础 URL (如: http://172.96.160.199:3000)")
     parser.add_argument("--paper", type=str, default="Transformer", help="论文名称 (默认: Transformer)")
     parser.add_argument("--gpt-version", type=str, default="o3-mini", help="GPT 模型版本 (默认: o3-mini)")
+    add_pipeline_arguments(parser)
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="LLM 响应缓存目录 (默认: 项目根目录下 .cache/llm_responses)")
+    parser.add_argument("--cache-mode", type=str, default="read_write", choices=CACHE_MODES,
+                        help="缓存模式: read_write 读写, read_only 只读, write_only 只写(强制刷新), off 关闭 (默认: read_write)")
+    parser.add_argument("--ledger", type=str, default=None,
+                        help="费用账本 (SQLite) 路径, 多个运行可共用 (默认: 项目根目录下 outputs/cost_ledger.sqlite)")
+    parser.add_argument("--pricing", type=str, default=None,
+                        help="自定义价格文件 (JSON, 每百万 token 美元价, 覆盖内置价格; 如自部署模型), 未知模型只统计 token")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只估算: 构建全部提示词并按 cal_cost 价格表计算各阶段/各文件的输入、缓存、输出 token 与费用, 不调用 API")
+    parser.add_argument("--dry-run-history", type=str, nargs="*", default=None,
+                        help="提供历史输出长度与参考回复的输出目录 (默认: 项目根目录下 outputs)")
     
     args = parser.parse_args()
     
-    # 加载 API_KEY
-    api_key = load_api_key(args.api_key)
-    os.environ["OPENAI_API_KEY"] = api_key
+    # 加载 API_KEY (估算模式不调用 API)
+    if not args.dry_run:
+        api_key = load_api_key(args.api_key)
+        os.environ["OPENAI_API_KEY"] = api_key
     
     # 加载 API 基础 URL
     api_base_url = load_api_base_url(args.api_base_url)
@@ -133,6 +220,16 @@ def main():
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
     
+    # LLM 响应缓存: 未改变的请求直接读取本地结果, 不再产生费用
+    cache_dir = Path(args.cache_dir) if args.cache_dir else project_root / ".cache" / "llm_responses"
+    os.environ["PAPER2CODE_CACHE_DIR"] = str(cache_dir)
+    os.environ["PAPER2CODE_CACHE_MODE"] = args.cache_mode
+    
+    # 费用账本: 每次调用追加一行, 并发运行共用时总费用也不会丢失
+    ledger_path = Path(args.ledger) if args.ledger else project_root / "outputs" / "cost_ledger.sqlite"
+    os.environ["PAPER2CODE_LEDGER"] = str(ledger_path)
+    load_pricing(args.pricing)
+    
     # 设置路径
     PDF_PATH = project_root / "examples" / "Transformer.pdf"
     PDF_JSON_PATH = project_root / "examples" / "Transformer.json"
@@ -140,9 +237,6 @@ def main():
     OUTPUT_DIR = project_root / "outputs" / "Transformer"
     OUTPUT_REPO_DIR = project_root / "outputs" / "Transformer_repo"
     
-    # 代码目录
-    codes_dir = project_root / "codes"
-    
     # 创建输出目录
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     OUTPUT_REPO_DIR.mkdir(parents=True, exist_ok=True)
@@ -153,6 +247,19 @@ def main():
     print("="*50)
     print(f"论文名称: {PAPER_NAME}")
     print(f"GPT 版本: {GPT_VERSION}")
+    print(f"最大并发数: {args.max_workers}")
+    print(f"代码生成调度: {args.coding_schedule}")
+    print(f"响应缓存: {cache_dir} ({args.cache_mode})")
+    print(f"费用账本: {ledger_path}")
+    print(f"价格文件: {args.pricing or '内置价格表'}")
+    print(f"流式输出: {'开启' if args.stream else '关闭'}")
+    print(f"断点续跑: {'开启' if args.resume else '关闭'}")
+    print(f"Batch API 模式: {'开启' if args.batch else '关闭'}")
+    print(f"论文格式: {args.paper_serialization}")
+    print(f"论文章节检索: {f'top {args.paper_top_k}' if args.paper_top_k else '关闭'}")
+    print(f"已完成代码文件: {args.code_context}")
+    print(f"规划输出: {args.planning_output}")
+    print(f"轨迹存储: {args.artifact_store}")
     print(f"JSON 输入: {PDF_JSON_CLEANED_PATH}")
     print(f"输出目录: {OUTPUT_DIR}")
     print(f"API_KEY: {'已加载' if os.environ.get('OPENAI_API_KEY') else '未设置'}")
@@ -164,68 +271,26 @@ def main():
     
     print(f"\n开始处理: {PAPER_NAME}")
     
-    # 准备所有命令需要的环境变量
-    cmd_env = {
-        "OPENAI_API_KEY": api_key,
-    }
-    if api_base_url:
-        cmd_env["OPENAI_API_BASE"] = api_base_url
-    
-    # Step 1: Preprocess
-    run_command([
-        sys.executable,
-        str(codes_dir / "0_pdf_process.py"),
-        "--input_json_path", str(PDF_JSON_PATH),
-        "--output_json_path", str(PDF_JSON_CLEANED_PATH)
-    ], "Preprocess", env=cmd_env)
-    
-    # Step 2: Planning
-    run_command([
-        sys.executable,
-        str(codes_dir / "1_planning.py"),
-        "--paper_name", PAPER_NAME,
-        "--gpt_version", GPT_VERSION,
-        "--pdf_json_path", str(PDF_JSON_CLEANED_PATH),
-        "--output_dir", str(OUTPUT_DIR)
-    ], "PaperCoder - Planning", env=cmd_env)
-    
-    # Step 3: Extract Config
-    run_command([
-        sys.executable,
-        str(codes_dir / "1.1_extract_config.py"),
-        "--paper_name", PAPER_NAME,
-        "--output_dir", str(OUTPUT_DIR)
-    ], "PaperCoder - Extract Config", env=cmd_env)
-    
-    # Step 4: Copy config
-    planning_config = OUTPUT_DIR / "planning_config.yaml"
-    output_config = OUTPUT_REPO_DIR / "config.yaml"
-    if planning_config.exists():
-        shutil.copy2(planning_config, output_config)
-        print(f"复制配置文件: {planning_config} -> {output_config}")
-    else:
-        print(f"警告: 配置文件不存在 {planning_config}")
-    
-    # Step 5: Analyzing
-    run_command([
-        sys.executable,
-        str(codes_dir / "2_analyzing.py"),
-        "--paper_name", PAPER_NAME,
-        "--gpt_version", GPT_VERSION,
-        "--pdf_json_path", str(PDF_JSON_CLEANED_PATH),
-        "--output_dir", str(OUTPUT_DIR)
-    ], "PaperCoder - Analyzing", env=cmd_env)
-    
-    # Step 6: Coding
-    run_command([
-        sys.executable,
-        str(codes_dir / "3_coding.py"),
-        "--paper_name", PAPER_NAME,
-        "--gpt_version", GPT_VERSION,
-        "--pdf_json_path", str(PDF_JSON_CLEANED_PATH),
-        "--output_dir", str(OUTPUT_DIR),
-        "--output_repo_dir", str(OUTPUT_REPO_DIR)
-    ], "PaperCoder - Coding", env=cmd_env)
+    # 所有阶段共享同一个上下文 (论文、规划、配置、分析结果、OpenAI 客户端)
+    ctx_kwargs = dict(
+        paper_name=PAPER_NAME,
+        gpt_version=GPT_VERSION,
+        output_dir=str(OUTPUT_DIR),
+        output_repo_dir=str(OUTPUT_REPO_DIR),
+        pdf_json_path=str(PDF_JSON_CLEANED_PATH),
+        **get_pipeline_kwargs(args),
+    )
+    if args.dry_run:
+        history_dirs = args.dry_run_history or [str(project_root / "outputs")]
+        run_dry_run(ctx_kwargs, PDF_JSON_PATH, OUTPUT_DIR, history_dirs)
+        return
+
+    ctx = PipelineContext(**ctx_kwargs)
+    try:
+        run_pipeline(ctx, input_json_path=str(PDF_JSON_PATH))
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
     
     print("\n✓ 所有步骤执行完成！")
 
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Paper2Code 批量运行脚本: 按 data/paper2code/dataset_info.json 并发处理多篇论文
+"""
+
+import argparse
+import contextvars
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+# 各阶段脚本位于 codes/ 目录下，在同一进程内直接调用
+CODES_DIR = Path(__file__).resolve().parent.parent / "codes"
+sys.path.insert(0, str(CODES_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from llm_cache import CACHE_MODES
+from llm_client import LLMClient, TokenRateLimiter
+from pipeline import DEFAULT_STAGES, PipelineContext, run_pipeline
+from run import add_pipeline_arguments, get_pipeline_kwargs, load_api_key, load_api_base_url, load_pricing
+
+SUMMARY_FIELDS = ["conference", "paper", "status", "wall_time", "requests", "prompt_tokens",
+                  "cached_tokens", "completion_tokens", "cost", "output_dir", "error"]
+
+
+class PaperLogRouter:
+    """stdout/stderr 替身: 论文的输出写入各自的 run.log, 主线程输出保持不变
+
+    按 contextvars 上下文路由; PipelineContext.chat_all 的工作线程在发起论文的上下文中运行, 其输出同样进入该论文的 run.log
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.log_file = contextvars.ContextVar(f"paper_log_{id(self)}", default=None)
+
+    def set_log(self, f):
+        self.log_file.set(f)
+
+    def target(self):
+        return self.log_file.get() or self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def isatty(self):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def load_papers(dataset_info_path, conferences=None, papers=None):
+    with open(dataset_info_path, encoding="utf-8") as f:
+        dataset_info = json.load(f)
+
+    paper_lst = []
+    for conference, entries in dataset_info.items():
+        if conferences and conference not in conferences:
+            continue
+        for entry in entries:
+            if papers and entry["repo_name"] not in papers:
+                continue
+            paper_lst.append((conference, entry["repo_name"]))
+    return paper_lst
+
+
+def get_inputs(data_dir, conference, paper_name):
+    """(原始 JSON 路径或 None, 清洗后 JSON 路径); 已有清洗结果时跳过预处理"""
+    raw_json_path = data_dir / conference / f"{paper_name}.json"
+    cleaned_json_path = data_dir / conference / f"{paper_name}_cleaned.json"
+    if cleaned_json_path.exists():
+        return None, cleaned_json_path
+    if raw_json_path.exists():
+        return raw_json_path, cleaned_json_path
+    raise FileNotFoundError(f"找不到论文 JSON: {raw_json_path} 或 {cleaned_json_path}")
+
+
+def run_paper(args, client, routers, conference, paper_name):
+    output_dir = Path(args.output_root) / conference / paper_name
+    output_repo_dir = Path(args.output_root) / conference / f"{paper_name}_repo"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    result = {"conference": conference, "paper": paper_name, "status": "ok", "output_dir": str(output_dir),
+              "error": "", "requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+    start_time = time.time()
+    ctx = None
+    with open(output_dir / "run.log", "a", encoding="utf-8") as log_file:
+        for router in routers:
+            router.set_log(log_file)
+        try:
+            input_json_path, cleaned_json_path = get_inputs(Path(args.data_dir), conference, paper_name)
+            ctx = PipelineContext(
+                paper_name=paper_name,
+                gpt_version=args.gpt_version,
+                output_dir=str(output_dir),
+                output_repo_dir=str(output_repo_dir),
+                pdf_json_path=str(cleaned_json_path),
+                **get_pipeline_kwargs(args),
+            )
+            ctx.client = client
+            stages = DEFAULT_STAGES if input_json_path else [s for s in DEFAULT_STAGES if s != "preprocess"]
+            run_pipeline(ctx, input_json_path=str(input_json_path) if input_json_path else None, stages=stages)
+        except (Exception, SystemExit) as e:
+            # 单篇论文失败不影响其他论文
+            traceback.print_exc(file=log_file)
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            for router in routers:
+                router.set_log(None)
+
+    result["wall_time"] = round(time.time() - start_time, 2)
+    if ctx is not None:
+        result.update(ctx.usage_totals)
+        result["cost"] = round(result["cost"], 8)
+    return result
+
+
+def write_summary(output_root, results):
+    results = sorted(results, key=lambda r: (r["conference"], r["paper"]))
+    with open(output_root / "batch_summary.json", "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    with open(output_root / "batch_summary.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow({k: result.get(k, "") for k in SUMMARY_FIELDS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paper2Code 批量运行 (dataset_info.json 中的全部论文)")
+    project_root = Path(__file__).resolve().parent.parent
+    parser.add_argument("--api-key", type=str, help="OpenAI API 密钥")
+    parser.add_argument("--api-base-url", type=str, help="OpenAI API 基础 URL")
+    parser.add_argument("--dataset-info", type=str, default=str(project_root / "data" / "paper2code" / "dataset_info.json"))
+    parser.add_argument("--data-dir", type=str, default=str(project_root / "data" / "paper2code"),
+                        help="解压后的 paper2code_data 目录, 包含 <会议>/<论文>.json 或 <论文>_cleaned.json")
+    parser.add_argument("--output-root", type=str, default=str(project_root / "outputs" / "paper2code"))
+    parser.add_argument("--conferences", type=str, nargs="*", help="只处理指定会议 (如: iclr2024 icml2024)")
+    parser.add_argument("--papers", type=str, nargs="*", help="只处理指定论文 (repo_name)")
+    parser.add_argument("--gpt-version", type=str, default="o3-mini")
+    # 与 run.py 相同的各阶段选项; 批量运行默认按内容去重存储轨迹
+    add_pipeline_arguments(parser, artifact_store="blobs")
+    parser.add_argument("--max-papers", type=int, default=4, help="同时处理的论文数 (默认: 4)")
+    parser.add_argument("--max-concurrent-requests", type=int, default=16, help="全局同时进行的 API 请求上限 (默认: 16)")
+    parser.add_argument("--tpm", type=int, default=None, help="全局每分钟 token 预算 (默认: 不限制)")
+    parser.add_argument("--cache-dir", type=str, default=None, help="LLM 响应缓存目录 (默认: 项目根目录下 .cache/llm_responses)")
+    parser.add_argument("--cache-mode", type=str, default="read_write", choices=CACHE_MODES)
+    parser.add_argument("--ledger", type=str, default=None, help="费用账本 (SQLite) 路径 (默认: 输出目录下 cost_ledger.sqlite)")
+    parser.add_argument("--pricing", type=str, default=None, help="自定义价格文件 (JSON), 覆盖内置价格")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_API_KEY"] = load_api_key(args.api_key)
+    api_base_url = load_api_base_url(args.api_base_url)
+    if api_base_url:
+        os.environ["OPENAI_API_BASE"] = api_base_url
+    cache_dir = Path(args.cache_dir) if args.cache_dir else project_root / ".cache" / "llm_responses"
+    os.environ["PAPER2CODE_CACHE_DIR"] = str(cache_dir)
+    os.environ["PAPER2CODE_CACHE_MODE"] = args.cache_mode
+    load_pricing(args.pricing)
+
+    paper_lst = load_papers(args.dataset_info, args.conferences, args.papers)
+    output_root = Path(args.output_root)
+    output_root.mkdir(parents=True, exist_ok=True)
+    # 所有论文的调用记入同一个费用账本
+    ledger_path = Path(args.ledger) if args.ledger else output_root / "cost_ledger.sqlite"
+    os.environ["PAPER2CODE_LEDGER"] = str(ledger_path)
+
+    print("\n" + "="*50)
+    print("Paper2Code 批量运行")
+    print("="*50)
+    print(f"论文数: {len(paper_lst)}")
+    print(f"GPT 版本: {args.gpt_version}")
+    print(f"并发论文数: {args.max_papers}, 每阶段并发: {args.max_workers}, 全局请求上限: {args.max_concurrent_requests}")
+    print(f"TPM 预算: {args.tpm or '不限制'}")
+    print(f"输出目录: {output_root}")
+    print(f"费用账本: {ledger_path}")
+    print("="*50)
+
+    # 所有论文共享一个连接池、速率限制和响应缓存
+    rate_limiter = TokenRateLimiter(args.tpm) if args.tpm else None
+    client = LLMClient.from_env(rate_limiter=rate_limiter, max_concurrent_requests=args.max_concurrent_requests,
+                                max_connections=max(args.max_concurrent_requests, 1))
+
+    # 每篇论文的阶段输出写入 <输出目录>/run.log, 控制台只显示进度
+    router_out, router_err = PaperLogRouter(sys.stdout), PaperLogRouter(sys.stderr)
+    sys.stdout, sys.stderr = router_out, router_err
+
+    results = []
+    start_time = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.max_papers)) as executor:
+            futures = {}
+            for conference, paper_name in paper_lst:
+                future = executor.submit(run_paper, args, client, [router_out, router_err], conference, paper_name)
+                futures[future] = (conference, paper_name)
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                mark = "✓" if result["status"] == "ok" else "✗"
+                print(f"{mark} [{len(results)}/{len(paper_lst)}] {result['conference']}/{result['paper']} "
+                      f"{result['wall_time']}s, {result['prompt_tokens']}+{result['completion_tokens']} tokens, "
+                      f"${result['cost']:.4f} {result['error']}")
+                write_summary(output_root, results)
+    finally:
+        sys.stdout, sys.stderr = router_out.stream, router_err.stream
+        client.close()
+
+    failed = [r for r in results if r["status"] != "ok"]
+    print(f"\n完成 {len(results) - len(failed)}/{len(paper_lst)} 篇论文, 用时 {time.time() - start_time:.1f}s, "
+          f"总费用 ${sum(r['cost'] for r in results):.4f}")
+    print(f"汇总: {output_root / 'batch_summary.json'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# the modules under test live in codes/ and scripts/ and import each other by their bare names
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "scripts"))
+sys.path.insert(0, str(ROOT_DIR / "codes"))
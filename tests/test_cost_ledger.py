@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import ROOT_DIR
+from cost_ledger import CostLedger, append_to_ledger, get_ledger_path
+
+
+def make_record(paper="Transformer", stage="[CODING]", model="o3-mini", cost=0.001, **overrides):
+    record = {"ts": "2025-05-01T00:00:00.000", "paper": paper, "stage": stage, "file": "model.py", "model": model,
+              "prompt_tokens": 100, "cached_tokens": 20, "completion_tokens": 10, "cost": cost,
+              "from_cache": False, "from_batch": False, "estimated": False}
+    record.update(overrides)
+    return record
+
+
+def test_totals_and_groups(tmp_path):
+    ledger = CostLedger(str(tmp_path / "ledger.sqlite"))
+    ledger.append(make_record(paper="A", cost=1.0))
+    ledger.append(make_record(paper="A", stage="[Planning]", cost=2.0, from_cache=True))
+    ledger.append(make_record(paper="B", cost=4.0, estimated=True))
+
+    assert ledger.total_cost() == 7.0
+    assert ledger.total_cost(paper="A") == 3.0
+    assert ledger.total_cost(paper="A", stage="[CODING]") == 1.0
+    by_paper = {row["paper"]: row for row in ledger.summarize("paper")}
+    assert by_paper["A"]["calls"] == 2 and by_paper["A"]["cache_hits"] == 1 and by_paper["A"]["prompt_tokens"] == 200
+    assert by_paper["B"]["estimated"] == 1
+    assert len(ledger.summarize("run_id")) == 1  # every call of this process shares its run id
+
+
+def test_only_known_columns_can_be_grouped_or_filtered(tmp_path):
+    ledger = CostLedger(str(tmp_path / "ledger.sqlite"))
+    with pytest.raises(ValueError):
+        ledger.summarize("cost; DROP TABLE calls")
+    with pytest.raises(ValueError):
+        ledger.total_cost(file="model.py")
+
+
+def test_concurrent_threads_lose_no_rows(tmp_path):
+    ledger = CostLedger(str(tmp_path / "ledger.sqlite"))
+
+    def write():
+        for _ in range(50):
+            ledger.append(make_record())
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ledger.summarize("paper")[0]["calls"] == 400
+
+
+def test_concurrent_processes_lose_no_rows(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    code = ("import sys; from cost_ledger import CostLedger; ledger = CostLedger(sys.argv[1])\n"
+            "for _ in range(100): ledger.append({'ts': 't', 'paper': 'p', 'cost': 0.01, 'prompt_tokens': 1, "
+            "'cached_tokens': 0, 'completion_tokens': 1, 'from_cache': False, 'from_batch': False})")
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR / "codes"))
+    processes = [subprocess.Popen([sys.executable, "-c", code, path], env=env) for _ in range(6)]
+    assert all(process.wait(timeout=120) == 0 for process in processes)
+    ledger = CostLedger(path)
+    assert ledger.summarize("paper")[0]["calls"] == 600
+    assert ledger.total_cost() == pytest.approx(6.0)
+
+
+def test_ledger_created_before_the_estimated_column_is_upgraded(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE calls (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, run_id TEXT NOT NULL, "
+                     "paper TEXT, stage TEXT, file TEXT, model TEXT, prompt_tokens INTEGER NOT NULL DEFAULT 0, "
+                     "cached_tokens INTEGER NOT NULL DEFAULT 0, completion_tokens INTEGER NOT NULL DEFAULT 0, "
+                     "cost REAL NOT NULL DEFAULT 0, from_cache INTEGER NOT NULL DEFAULT 0, "
+                     "from_batch INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("INSERT INTO calls (ts, run_id, paper, cost) VALUES ('t', 'old', 'A', 1.0)")
+    ledger = CostLedger(path)
+    ledger.append(make_record(paper="A", estimated=True))
+    row = ledger.summarize("paper")[0]
+    assert row["calls"] == 2 and row["estimated"] == 1
+
+
+def test_ledger_path_and_failures(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("PAPER2CODE_LEDGER", raising=False)
+    assert get_ledger_path(str(tmp_path)) == os.path.join(str(tmp_path), "cost_ledger.sqlite")
+    monkeypatch.setenv("PAPER2CODE_LEDGER", str(tmp_path / "shared.sqlite"))
+    assert get_ledger_path("anywhere") == str(tmp_path / "shared.sqlite")
+
+    # a directory where the database should be: the call is reported, never raised
+    (tmp_path / "broken.sqlite").mkdir()
+    monkeypatch.setenv("PAPER2CODE_LEDGER", str(tmp_path / "broken.sqlite"))
+    append_to_ledger(str(tmp_path), make_record())
+    assert "Cost ledger not updated" in capsys.readouterr().err
@@ -0,0 +1,31 @@
+import argparse
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+
+from conftest import ROOT_DIR
+from run import add_pipeline_arguments, get_pipeline_kwargs, run_dry_run
+
+
+@pytest.mark.parametrize("argv", [[], ["--planning-output", "structured", "--code-context", "interface"]])
+def test_dry_run_estimates_every_stage_without_recording_spend(tmp_path, monkeypatch, argv):
+    ledger_path = tmp_path / "cost_ledger.sqlite"
+    monkeypatch.setenv("PAPER2CODE_LEDGER", str(ledger_path))
+    monkeypatch.setenv("PAPER2CODE_CACHE_MODE", "off")
+    parser = argparse.ArgumentParser()
+    add_pipeline_arguments(parser)
+    ctx_kwargs = dict(paper_name="Transformer", gpt_version="o3-mini", output_dir=str(tmp_path),
+                      **get_pipeline_kwargs(parser.parse_args(argv)))
+
+    run_dry_run(ctx_kwargs, ROOT_DIR / "examples" / "Transformer.json", tmp_path, [str(ROOT_DIR / "outputs")])
+
+    with open(tmp_path / "dry_run_estimate.json", encoding="utf-8") as f:
+        estimate = json.load(f)
+    stages = {row["stage"] for row in estimate["rows"]}
+    assert stages == {"[Planning]", "[ANALYSIS]", "[CODING]"}
+    assert estimate["totals"][-1]["stage"] == "Total" and estimate["totals"][-1]["cost"] > 0
+    # estimates are not spend
+    assert not ledger_path.exists()
+    assert not list(tmp_path.rglob("telemetry.jsonl"))
@@ -0,0 +1,55 @@
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+import batch_server
+from llm_batch import BatchRunner
+from llm_client import LLMClient
+
+MSG = [{"role": "user", "content": "Write model.py"}]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """An LLMClient talking to batch_server.py --echo on a free local port."""
+    monkeypatch.setattr(batch_server.Handler, "server_args", argparse.Namespace(echo=True, upstream=None, api_key=""))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), batch_server.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm_client = LLMClient(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+    yield llm_client
+    llm_client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_batch_results_and_failures_come_back_per_request(client, tmp_path):
+    runner = BatchRunner(client, str(tmp_path), "gpt-4o-mini", poll_interval=0.01)
+    results = {custom_id: (completion_json, error)
+               for custom_id, completion_json, error in runner.run("analysis", [("model.py", MSG), ("empty", [])])}
+
+    completion_json, error = results["model.py"]
+    assert error is None and completion_json["from_batch"]
+    assert completion_json["choices"][0]["message"]["content"] == "[batch stand-in] Write model.py"
+    completion_json, error = results["empty"]
+    assert completion_json is None and "non-empty" in str(error)
+    assert (tmp_path / "batch" / "analysis_requests.jsonl").exists()
+
+
+def test_restarted_run_reuses_the_submitted_batch(client, tmp_path, capsys):
+    runner = BatchRunner(client, str(tmp_path), "gpt-4o-mini", poll_interval=0.01)
+    list(runner.run("analysis", [("model.py", MSG)]))
+    list(runner.run("analysis", [("model.py", MSG)]))
+    out = capsys.readouterr().out
+    assert out.count("[BATCH] Submitted") == 1 and "[BATCH] Reusing" in out
+
+
+def test_stand_in_serves_chat_completions(client):
+    completion_json = client.complete({"model": "gpt-4o-mini", "messages": MSG})
+    assert completion_json["choices"][0]["message"]["content"] == "[batch stand-in] Write model.py"
+    streamed = client.stream({"model": "gpt-4o-mini", "messages": MSG})
+    assert streamed["choices"][0]["message"]["content"] == completion_json["choices"][0]["message"]["content"]
+    assert streamed["usage"]["completion_tokens"] == completion_json["usage"]["completion_tokens"]
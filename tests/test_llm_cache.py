@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+from llm_cache import ResponseCache, cache_from_env, make_cache_key
+
+REQUEST = {"model": "o3-mini", "messages": [{"role": "user", "content": "hi"}], "reasoning_effort": "high"}
+
+
+def test_cache_key_ignores_transport_options_only():
+    assert make_cache_key(REQUEST) == make_cache_key(dict(REQUEST, stream=True, timeout=30, user="x"))
+    assert make_cache_key(REQUEST) != make_cache_key(dict(REQUEST, reasoning_effort="low"))
+    assert make_cache_key(REQUEST) != make_cache_key(dict(REQUEST, model="o3"))
+
+
+def test_answers_cut_at_stop_at_get_their_own_key():
+    assert make_cache_key(REQUEST) == make_cache_key(REQUEST, stop_at=None)
+    assert make_cache_key(REQUEST, stop_at="code") != make_cache_key(REQUEST)
+    assert make_cache_key(REQUEST, stop_at="code") != make_cache_key(REQUEST, stop_at="content")
+
+
+def test_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    key = make_cache_key(REQUEST)
+    assert cache.get(key) is None
+    cache.put(key, {"choices": [], "usage": {"prompt_tokens": 1}})
+    assert cache.get(key) == {"choices": [], "usage": {"prompt_tokens": 1}}
+
+
+@pytest.mark.parametrize("mode, readable, writable", [
+    ("read_only", True, False), ("write_only", False, True), ("read_write", True, True),
+])
+def test_modes(tmp_path, mode, readable, writable):
+    ResponseCache(str(tmp_path)).put("ab" * 32, {"x": 1})
+    cache = ResponseCache(str(tmp_path), mode=mode)
+    assert (cache.get("ab" * 32) is not None) == readable
+    cache.put("cd" * 32, {"x": 2})
+    assert os.path.exists(cache.get_path("cd" * 32)) == writable
+
+
+def test_unknown_mode(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseCache(str(tmp_path), mode="sometimes")
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10 ** 6)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for idx, key in enumerate(keys):
+        cache.put(key, {"text": "x" * 100})
+        os.utime(cache.get_path(key), (time.time() - 100 + idx, time.time() - 100 + idx))
+    cache.get(keys[0])  # refreshes the oldest entry
+    entry_size = os.path.getsize(cache.get_path(keys[0]))
+    cache.max_bytes = entry_size * 3
+    cache.put("99" * 32, {"text": "x" * 100})
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get("99" * 32) is not None
+
+
+def test_overwriting_an_entry_does_not_grow_the_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10 ** 6)
+    cache.put("ab" * 32, {"text": "x" * 100})
+    cache.put("cd" * 32, {"text": "x" * 100})
+    entry_size = os.path.getsize(cache.get_path("ab" * 32))
+    cache.max_bytes = entry_size * 2
+    for _ in range(5):
+        cache.put("ab" * 32, {"text": "x" * 100})
+    assert cache.total_bytes == entry_size * 2
+    assert cache.get("cd" * 32) is not None
+
+
+def test_cache_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("PAPER2CODE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("PAPER2CODE_CACHE_MODE", "read_only")
+    assert cache_from_env().mode == "read_only"
+    monkeypatch.setenv("PAPER2CODE_CACHE_MODE", "off")
+    assert cache_from_env() is None
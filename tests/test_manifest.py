@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+
+from manifest import StageManifest, get_input_hash
+
+MSG = [{"role": "user", "content": "Write model.py"}]
+
+
+def test_input_hash_follows_prompt_model_and_options():
+    assert get_input_hash(MSG, "o3-mini") == get_input_hash(list(MSG), "o3-mini")
+    assert get_input_hash(MSG, "o3-mini") != get_input_hash(MSG, "o3")
+    assert get_input_hash(MSG, "o3-mini") != get_input_hash([{"role": "user", "content": "Write main.py"}], "o3-mini")
+    assert get_input_hash(MSG, "o3-mini") != get_input_hash(MSG, "o3-mini", response_format={"type": "json_object"})
+
+
+def test_unit_is_done_while_inputs_and_outputs_are_unchanged(tmp_path):
+    output = tmp_path / "model.py"
+    output.write_text("pass\n")
+    manifest = StageManifest(str(tmp_path), "coding")
+    manifest.mark_done("model.py", "hash-1", [str(output)])
+
+    reloaded = StageManifest(str(tmp_path), "coding")
+    assert reloaded.is_done("model.py", "hash-1")
+    assert not reloaded.is_done("model.py", "hash-2")
+    assert not reloaded.is_done("main.py", "hash-1")
+    output.unlink()
+    assert not reloaded.is_done("model.py", "hash-1")
+
+
+def test_manifest_is_rewritten_whole(tmp_path):
+    manifest = StageManifest(str(tmp_path), "analyzing")
+    manifest.mark_done("a.py", "h1", [])
+    manifest.mark_done("b.py", "h2", [])
+    with open(tmp_path / "analyzing_manifest.json", encoding="utf-8") as f:
+        assert json.load(f) == {"a.py": {"input_hash": "h1", "outputs": []}, "b.py": {"input_hash": "h2", "outputs": []}}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_unreadable_manifest_starts_empty(tmp_path, capsys):
+    (tmp_path / "coding_manifest.json").write_text("{not json")
+    assert StageManifest(str(tmp_path), "coding").units == {}
+    assert "unreadable manifest" in capsys.readouterr().out
@@ -0,0 +1,74 @@
+import importlib
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+
+from conftest import ROOT_DIR
+from pipeline import PipelineContext
+
+planning = importlib.import_module("1_planning")
+
+ARCH_DESIGN = {"Implementation approach": "PyTorch", "File list": ["main.py", "model.py"],
+               "Data structures and interfaces": "", "Program call flow": "", "Anything UNCLEAR": ""}
+TASK_LIST = {"Required packages": [], "Required Other language third-party packages": [],
+             "Logic Analysis": [["model.py", "Transformer"], ["main.py", "Entry point"]],
+             "Task list": ["model.py", "main.py"], "Full API spec": "", "Shared Knowledge": "", "Anything UNCLEAR": ""}
+
+
+def answer(content):
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20,
+                      "prompt_tokens_details": {"cached_tokens": 0}}}
+
+
+class ScriptedContext(PipelineContext):
+    """Answers every planning call with the next scripted content and keeps the requests."""
+
+    records_spend = False
+
+    def __init__(self, contents, **kwargs):
+        super().__init__(**kwargs)
+        self.contents = list(contents)
+        self.requests = []
+
+    def chat(self, msg, artifact_path=None, stop_at=None, **kwargs):
+        self.requests.append((msg, kwargs))
+        return answer(self.contents.pop(0))
+
+
+def run_planning(tmp_path, contents, planning_output="text"):
+    ctx = ScriptedContext(contents, paper_name="Transformer", gpt_version="o3-mini", output_dir=str(tmp_path),
+                          pdf_json_path=str(ROOT_DIR / "examples" / "Transformer_cleaned.json"),
+                          planning_output=planning_output)
+    responses = planning.run(ctx)
+    return ctx, responses
+
+
+def wrap(value):
+    return f"[CONTENT]\n{json.dumps(value)}\n[/CONTENT]"
+
+
+@pytest.mark.parametrize("planning_output", ["text", "structured"])
+def test_valid_answers_are_not_repaired(tmp_path, planning_output):
+    ctx, _ = run_planning(tmp_path, ["Plan", wrap(ARCH_DESIGN), wrap(TASK_LIST), "```yaml\nlr: 1\n```"], planning_output)
+    assert len(ctx.requests) == 4
+
+
+def test_text_mode_repair_asks_for_the_content_wrapper(tmp_path):
+    ctx, responses = run_planning(tmp_path, ["Plan", wrap({"File list": []}), wrap(ARCH_DESIGN), wrap(TASK_LIST),
+                                             "```yaml\nlr: 1\n```"])
+    repair_msg, repair_kwargs = ctx.requests[2]
+    assert len(ctx.requests) == 5 and repair_kwargs == {}
+    assert all("[CONTENT][/CONTENT]" in m["content"] for m in repair_msg)
+    assert responses[1]["choices"][0]["message"]["content"] == wrap(ARCH_DESIGN)
+
+
+def test_structured_mode_repair_only_asks_for_the_bare_object(tmp_path):
+    ctx, responses = run_planning(tmp_path, ["Plan", json.dumps({"File list": []}), json.dumps(ARCH_DESIGN),
+                                             json.dumps(TASK_LIST), "```yaml\nlr: 1\n```"], "structured")
+    repair_msg, repair_kwargs = ctx.requests[2]
+    assert repair_kwargs["response_format"]["type"] == "json_schema"
+    assert not any("[CONTENT]" in m["content"] for m in repair_msg)
+    assert json.loads(responses[1]["choices"][0]["message"]["content"]) == ARCH_DESIGN
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from pricing import BUILTIN_PRICES, PricingRegistry, get_registry, load_pricing_file
+from utils import cal_cost
+
+
+def usage(prompt_tokens=1_000_000, completion_tokens=1_000_000, cached_tokens=0, **extra):
+    return {"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached_tokens}}, **extra}
+
+
+@pytest.fixture(autouse=True)
+def builtin_prices(monkeypatch):
+    monkeypatch.delenv("PAPER2CODE_PRICING", raising=False)
+
+
+def test_exact_then_longest_prefix():
+    registry = PricingRegistry(BUILTIN_PRICES)
+    assert registry.lookup("o3-mini") is BUILTIN_PRICES["o3-mini"]
+    assert registry.lookup("gpt-4o-mini-2099-01-01") is BUILTIN_PRICES["gpt-4o-mini"]
+    assert registry.lookup("gpt-4o-2099-01-01") is BUILTIN_PRICES["gpt-4o"]
+    assert registry.lookup("openai/gpt-4.1") is BUILTIN_PRICES["gpt-4.1"]
+    assert registry.lookup("llama-3.1-70b") is None
+
+
+def test_earlier_layers_override_later_ones():
+    override = {"gpt-4o": {"input": 1.0, "cached_input": None, "output": 1.0}}
+    registry = PricingRegistry(override, BUILTIN_PRICES)
+    assert registry.lookup("gpt-4o-2024-08-06") is override["gpt-4o"]
+    assert registry.lookup("o3-mini") is BUILTIN_PRICES["o3-mini"]
+
+
+def test_cal_cost():
+    info = cal_cost(usage(cached_tokens=500_000), "o3-mini")
+    assert info["input_cost"] == pytest.approx(0.55)
+    assert info["cached_input_cost"] == pytest.approx(0.275)
+    assert info["output_cost"] == pytest.approx(4.40)
+    assert info["priced"] and not info["estimated"]
+    assert cal_cost(usage(from_batch=True), "o3-mini")["total_cost"] == pytest.approx((1.10 + 4.40) / 2)
+    assert cal_cost(usage(from_cache=True), "o3-mini")["total_cost"] == 0
+
+
+def test_cached_tokens_without_a_cache_discount_cost_the_input_price():
+    info = cal_cost(usage(cached_tokens=1_000_000, completion_tokens=0), "gpt-4o-2024-05-13")
+    assert info["total_cost"] == pytest.approx(5.00)
+
+
+def test_unknown_model_counts_tokens_only(capsys):
+    info = cal_cost(usage(), "my-local-model-unpriced")
+    assert info["total_cost"] == 0 and not info["priced"]
+    assert info["actual_input_tokens"] == 1_000_000 and info["output_tokens"] == 1_000_000
+    cal_cost(usage(), "my-local-model-unpriced")
+    assert capsys.readouterr().out.count("No pricing for model") == 1
+
+
+def test_missing_usage_fields():
+    assert cal_cost({"usage": {"prompt_tokens": 10, "completion_tokens": 1}}, "o3-mini")["total_cost"] > 0
+    assert cal_cost({}, "o3-mini")["total_cost"] == 0
+
+
+def test_pricing_file_overrides_builtin_prices(tmp_path, monkeypatch):
+    path = tmp_path / "pricing.json"
+    path.write_text(json.dumps({"llama-3": {"input": 0.2, "output": 0.4}, "o3-mini": {"input": 1.0, "output": 2.0}}))
+    monkeypatch.setenv("PAPER2CODE_PRICING", str(path))
+    assert get_registry() is get_registry()
+    assert cal_cost(usage(), "llama-3.1-70b-instruct")["total_cost"] == pytest.approx(0.6)
+    assert cal_cost(usage(), "o3-mini")["total_cost"] == pytest.approx(3.0)
+
+
+@pytest.mark.parametrize("content", ['[1, 2]', '{"m": {"output": 1}}', '{"m": {"input": 1, "output": "free"}}'])
+def test_invalid_pricing_files(tmp_path, content):
+    path = tmp_path / "pricing.json"
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        load_pricing_file(str(path))
+
+
+def test_unreadable_pricing_file_falls_back_to_builtin_prices(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("PAPER2CODE_PRICING", str(tmp_path / "missing.json"))
+    assert cal_cost(usage(), "o3-mini")["total_cost"] == pytest.approx(1.10 + 4.40)
+    assert "Pricing file not loaded" in capsys.readouterr().err
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from prompt_templates import PROMPTS_DIR, PromptTemplate, load_template, render_code_files, render_prompt
+
+
+def test_render_fills_every_slot():
+    template = PromptTemplate("Paper: {{Paper}}\nFile: {{File}} ({{File}})", "t")
+    assert template.slots == {"Paper", "File"}
+    assert template.render(Paper="P", File="model.py") == "Paper: P\nFile: model.py (model.py)"
+
+
+def test_values_are_inserted_verbatim():
+    # a paper or source file containing placeholders must not be expanded again
+    template = PromptTemplate("{{A}}|{{B}}", "t")
+    assert template.render(A="{{B}}", B="x") == "{{B}}|x"
+
+
+def test_missing_slot_names_the_template():
+    with pytest.raises(KeyError, match="'t' is missing slots: B"):
+        PromptTemplate("{{A}}{{B}}", "t").render(A="x")
+
+
+def test_templates_are_loaded_once():
+    assert load_template("code_file") is load_template("code_file")
+
+
+def test_render_code_files_matches_rendering_one_by_one():
+    codes = ["a = 1\n", "def f():\n    return '{{Code}}'\n"]
+    assert render_code_files(codes) == "".join(render_prompt("code_file", Code=code) for code in codes)
+
+
+@pytest.mark.parametrize("name", sorted(f[:-len(".txt")] for f in os.listdir(PROMPTS_DIR) if f.endswith(".txt")))
+def test_every_shipped_template_parses(name):
+    template = load_template(name)
+    assert template.render(**{slot: "" for slot in template.slots}) is not None
@@ -0,0 +1,66 @@
+import pytest
+
+from stream_extract import ContentBlockExtractor, FenceExtractor, ThinkFilter, get_extractor
+from utils import extract_code_from_content
+
+CODE_ANSWER = "Here is the code:\n```python\nimport torch\n\nx = 1\n```\nExplanation that is never needed."
+CONTENT_ANSWER = 'Plan first.\n[CONTENT]\n{"a": 1}\n[/CONTENT]\nMore prose.'
+THINK_CODE_ANSWER = "<think>\nDraft:\n```python\nx = 0\n```\n</think>\n" + CODE_ANSWER
+THINK_CONTENT_ANSWER = "<think>maybe [CONTENT] {} [/CONTENT]</think>" + CONTENT_ANSWER
+
+
+def feed(extractor, text, chunk_size):
+    """Feed `text` in chunks; returns how much of it was read when the extractor stopped, or None."""
+    for pos in range(0, len(text), chunk_size):
+        if extractor.feed(text[pos:pos + chunk_size]):
+            return pos + chunk_size
+    return None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_fence_extractor_stops_at_the_closing_fence(chunk_size):
+    extractor = FenceExtractor()
+    read = feed(extractor, CODE_ANSWER, chunk_size)
+    # stopped within one delta of the closing fence, before the explanation was waited for
+    assert read is not None and read < CODE_ANSWER.index("```\nExplanation") + 3 + chunk_size
+    assert extractor.result() == extract_code_from_content(CODE_ANSWER)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_content_extractor_stops_at_the_closing_tag(chunk_size):
+    extractor = ContentBlockExtractor()
+    assert feed(extractor, CONTENT_ANSWER, chunk_size) is not None
+    assert extractor.result() == '\n{"a": 1}\n'
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 1000])
+def test_reasoning_does_not_end_the_stream(chunk_size):
+    fence = FenceExtractor()
+    feed(fence, THINK_CODE_ANSWER, chunk_size)
+    assert fence.result() == "import torch\n\nx = 1\n"
+    content = ContentBlockExtractor()
+    feed(content, THINK_CONTENT_ANSWER, chunk_size)
+    assert content.result() == '\n{"a": 1}\n'
+
+
+def test_unfinished_blocks_have_no_result():
+    extractor = FenceExtractor()
+    assert not extractor.feed("```python\nx = 1\n")
+    assert extractor.result() == ""
+    extractor = ContentBlockExtractor()
+    assert not extractor.feed("[CONTENT]\n{")
+    assert extractor.result() == ""
+
+
+def test_think_filter_holds_back_split_tags_only():
+    think_filter = ThinkFilter()
+    assert think_filter.feed("a <th") == "a "
+    assert think_filter.feed("ink>hidden</thi") == ""
+    assert think_filter.feed("nk> b <") == " b "
+    assert think_filter.feed("= c") == "<= c"
+
+
+def test_get_extractor():
+    assert get_extractor(None) is None
+    assert isinstance(get_extractor("code"), FenceExtractor)
+    assert isinstance(get_extractor("content"), ContentBlockExtractor)
@@ -0,0 +1,51 @@
+from task_graph import build_dependency_graph, get_class_name, get_transitive_dependencies, mentions_file, \
+    schedule_waves
+
+TODO_FILES = ["config.yaml", "dataset_loader.py", "model.py", "trainer.py", "main.py"]
+LOGIC = {
+    "dataset_loader.py": "Loads the WMT data.",
+    "model.py": "Transformer layers, no dependencies.",
+    "trainer.py": "Uses DatasetLoader and `from model import Transformer`.",
+    "main.py": "Calls trainer.py to run training.",
+}
+
+
+def test_class_name_from_file_name():
+    assert get_class_name("src/dataset_loader.py") == "DatasetLoader"
+
+
+def test_mentions_file_by_path_import_and_class_name():
+    assert mentions_file("see model.py", "model.py")
+    assert mentions_file("import model", "model.py")
+    assert mentions_file("builds a DatasetLoader", "dataset_loader.py")
+    assert not mentions_file("see my_model.py", "model.py")
+    assert not mentions_file("", "model.py")
+
+
+def test_dependencies_only_point_backwards():
+    graph = build_dependency_graph(TODO_FILES, LOGIC)
+    assert "config.yaml" not in graph
+    assert graph == {
+        "dataset_loader.py": [],
+        "model.py": [],
+        "trainer.py": ["dataset_loader.py", "model.py"],
+        "main.py": ["trainer.py"],
+    }
+
+
+def test_transitive_dependencies_keep_task_list_order():
+    graph = build_dependency_graph(TODO_FILES, LOGIC)
+    assert get_transitive_dependencies("main.py", graph, TODO_FILES) == ["dataset_loader.py", "model.py", "trainer.py"]
+
+
+def test_waves_only_depend_on_earlier_waves():
+    graph = build_dependency_graph(TODO_FILES, LOGIC)
+    assert schedule_waves(TODO_FILES, graph) == [["dataset_loader.py", "model.py"], ["trainer.py"], ["main.py"]]
+
+
+def test_non_config_yaml_files_are_scheduled():
+    todo_files = ["config.yaml", "configs/model.yaml", "model.py", "main.py"]
+    logic = {"configs/model.yaml": "Model hyperparameters.", "main.py": "Loads configs/model.yaml and builds a Model."}
+    graph = build_dependency_graph(todo_files, logic)
+    assert graph == {"configs/model.yaml": [], "model.py": [], "main.py": ["model.py"]}
+    assert schedule_waves(todo_files, graph) == [["configs/model.yaml", "model.py"], ["main.py"]]
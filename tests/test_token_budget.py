@@ -0,0 +1,54 @@
+from token_budget import TokenBudget, get_max_prompt_tokens, trim_latex_paper, trim_paper
+
+PAPER = {"pdf_parse": {
+    "body_text": [
+        {"section": "Introduction", "sec_num": "1", "text": "intro"},
+        {"section": "Method", "sec_num": "2", "text": "method"},
+        {"section": "Proofs", "sec_num": "A", "text": "appendix"},
+        {"section": "More", "sec_num": "A.1", "text": "appendix"},
+    ],
+    "back_matter": [{"text": "acks"}],
+    "ref_entries": {"FIGREF0": {}},
+    "bib_entries": {"BIBREF0": {}},
+}}
+
+
+def test_budget_uses_longest_model_prefix(monkeypatch):
+    monkeypatch.delenv("PAPER2CODE_MAX_PROMPT_TOKENS", raising=False)
+    assert get_max_prompt_tokens("o3-mini") == 200_000 - 40_000
+    assert get_max_prompt_tokens("gpt-4o-mini") == 128_000 - 16_384
+    assert get_max_prompt_tokens("gpt-4.1-mini") == 1_047_576 - 16_384
+    assert get_max_prompt_tokens("some-local-model") == 128_000 - 16_384
+    monkeypatch.setenv("PAPER2CODE_MAX_PROMPT_TOKENS", "1234")
+    assert get_max_prompt_tokens("o3-mini") == 1234
+
+
+def test_trim_paper_drops_appendix_and_references_without_touching_the_original():
+    trimmed = trim_paper(PAPER, ["references", "appendix"])
+    pdf_parse = trimmed["pdf_parse"]
+    assert [p["section"] for p in pdf_parse["body_text"]] == ["Introduction", "Method"]
+    assert "back_matter" not in pdf_parse and "ref_entries" not in pdf_parse and "bib_entries" not in pdf_parse
+    assert len(PAPER["pdf_parse"]["body_text"]) == 4
+    assert trim_paper(PAPER, []) is PAPER
+
+
+def test_trim_latex_paper():
+    latex = "\\section{Intro}x\n\\bibliography{refs}\n\\appendix\n\\section{Proofs}y\n\\end{document}"
+    assert trim_latex_paper(latex, ["references", "appendix"]) == "\\section{Intro}x\n\n\\end{document}"
+
+
+def test_fit_drops_sections_in_order_until_the_prompt_fits():
+    sections = {"old_code": "c" * 4000, "references": "r" * 4000, "appendix": "a" * 4000}
+
+    def build_msg(dropped):
+        return [{"role": "user", "content": "task " + "".join(v for k, v in sections.items() if k not in dropped)}]
+
+    budget = TokenBudget("o3-mini", max_prompt_tokens=2500)
+    msg, dropped, original_tokens, num_tokens = budget.fit(build_msg, ["old_code", "references", "appendix"])
+    assert dropped[:1] == ["old_code"]
+    assert original_tokens > 2500 >= num_tokens
+    assert msg == build_msg(dropped)
+
+
+def test_small_prompts_are_accepted_without_counting():
+    assert TokenBudget("o3-mini", max_prompt_tokens=1000).fits([{"role": "user", "content": "hi"}]) == (True, None)
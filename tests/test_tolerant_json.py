@@ -0,0 +1,55 @@
+import pytest
+
+from tolerant_json import TolerantJSONError, loads_tolerant
+from utils import content_to_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b": [true, null, 2.5]}', {"a": 1, "b": [True, None, 2.5]}),
+    ("[CONTENT]\n{'a': 'x', # note\n 'b': [1, 2,],}\n[/CONTENT]", {"a": "x", "b": [1, 2]}),
+    ('{"a": True, "b": None, // comment\n "c": False}', {"a": True, "b": None, "c": False}),
+    ('{"code": """line 1\nline 2"""}', {"code": "line 1\nline 2"}),
+    ('{"text": "raw\nnewline"}', {"text": "raw\nnewline"}),
+    ('{"pattern": "\\d+\\n"}', {"pattern": "\\d+\n"}),
+    ('{"u": "\\u00e9"}', {"u": "é"}),
+    ('Here is the plan:\n```json\n{"a": 1}\n```\nHope this helps.', {"a": 1}),
+])
+def test_loads_tolerant(text, expected):
+    assert loads_tolerant(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('Note [1]: {"a": 1}', {"a": 1}),
+    ('Note [1]: {"a": 1} Thanks.', {"a": 1}),
+    ('{x} then {"b": 2}', {"b": 2}),
+    ('[{"a": 1}]', [{"a": 1}]),
+    ('[{"a": 1}] and some prose', [{"a": 1}]),
+    ('Note [1]: [{"a": 1}]', [{"a": 1}]),
+])
+def test_prose_before_the_answer(text, expected):
+    assert loads_tolerant(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('prefix {"a": 1} middle {"b": 2}', {"a": 1}),
+    ('[CONTENT]\n{"a": 1}\n[/CONTENT]\nOr, alternatively: {"b": 2}', {"a": 1}),
+    ('{"x": 0} [CONTENT] {"a": 1} [/CONTENT] {"b": 2}', {"a": 1}),
+])
+def test_first_complete_object_wins(text, expected):
+    assert loads_tolerant(text) == expected
+
+
+def test_truncated_answer_fails_instead_of_returning_an_inner_value():
+    with pytest.raises(TolerantJSONError, match="Unexpected end of input"):
+        loads_tolerant('{"a": {"b": 1}, "c": ')
+
+
+def test_error_position():
+    with pytest.raises(TolerantJSONError) as excinfo:
+        loads_tolerant('{\n  "a": 1\n  "b": 2\n}')
+    assert (excinfo.value.lineno, excinfo.value.colno) == (3, 3)
+
+
+def test_content_to_json_returns_empty_dict_on_failure(capsys):
+    assert content_to_json("no json here") == {}
+    assert "[WARNING] Failed to parse JSON content" in capsys.readouterr().out